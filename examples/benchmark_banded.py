@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Cost of the ODE integration of a chain of 200 tanks in series with a dense
+and a banded Jacobian (Model.use_banded_jacobian), with the analytical
+Jacobian and with its finite difference approximation (Model.use_jacobian).
+"""
+from __future__ import division
+
+import timeit
+
+import numpy as np
+from pyideas import Model
+
+
+def tanks_in_series(number_of_tanks=200):
+    system = {'C_in': '5/(1+exp(-5*(t-10)))',
+              'dC0': 'Q_in*(C_in - C0)/Vol'}
+    for i in range(1, number_of_tanks):
+        system['dC' + str(i)] = ('Q_in*(C' + str(i - 1) + ' - C' + str(i) +
+                                 ')/Vol')
+    parameters = {'Q_in': 5, 'Vol': 1e2/number_of_tanks}
+
+    model = Model('tanks in series', system, parameters)
+    model.initial_conditions = dict(('C' + str(i), 0.)
+                                    for i in range(number_of_tanks))
+    model.independent = {'t': np.linspace(0, 50, 1000)}
+    model.initialize_model()
+    return model
+
+
+def benchmark(number=3):
+    model = tanks_in_series()
+    print('lower and upper bandwidth: {0}, {1}'.format(
+        model.jac_ode_banded.lband, model.jac_ode_banded.uband))
+    print('{0:<30}{1:>12}{2:>12}'.format('odeint [ms]', 'dense',
+                                         'banded'))
+    reference = model._run()
+    for use_jacobian in [True, False]:
+        model.use_jacobian = use_jacobian
+        timing = []
+        for banded in [False, True]:
+            model.use_banded_jacobian = banded
+            assert np.allclose(model._run(), reference, atol=1e-6)
+            timing.append(timeit.timeit(model._run, number=number)/number)
+        print('{0:<30}{1:>12.1f}{2:>12.1f}'.format(
+            'analytical Jacobian' if use_jacobian else 'finite differences',
+            timing[0]*1e3, timing[1]*1e3))
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Cost of the generated right hand sides with and without common
+subexpression elimination (Model.use_cse and DirectLocalSensitivity cse) for
+the models of the examples.
+"""
+from __future__ import division
+
+import timeit
+
+import numpy as np
+from pyideas import Model, DirectLocalSensitivity
+
+
+def michaelis_menten():
+    system = {'v': 'Vmax*S/(Km + S)',
+              'dS': '-v*E',
+              'dP': 'v*E'}
+    parameters = {'Km': 150., 'Vmax': 0.768, 'E': 0.68}
+    initial_conditions = {'S': 500., 'P': 0.}
+    return system, parameters, initial_conditions, np.linspace(0, 2500, 1000)
+
+
+def fermentor():
+    system = {'dS': 'Q_in/V*(S_in-S)-1/Ys*mu_max*S/(S+K_S)*X',
+              'dX': '-Q_in/V*X+mu_max*S/(S+K_S)*X'}
+    parameters = {'mu_max': 0.4, 'K_S': 0.015, 'Q_in': 2, 'Ys': 0.67,
+                  'S_in': 0.02, 'V': 20}
+    initial_conditions = {'S': 0.02, 'X': 5e-5}
+    return system, parameters, initial_conditions, np.linspace(0, 100, 1000)
+
+
+def tanks_in_series(number_of_tanks=10):
+    system = {'C_in': '5/(1+exp(-5*(t-10)))',
+              'dC0': 'Q_in*(C_in - C0)/Vol'}
+    for i in range(1, number_of_tanks):
+        system['dC' + str(i)] = ('Q_in*(C' + str(i - 1) + ' - C' + str(i) +
+                                 ')/Vol')
+    parameters = {'Q_in': 5, 'Vol': 1e2/number_of_tanks}
+    initial_conditions = dict(('C' + str(i), 0.)
+                              for i in range(number_of_tanks))
+    return system, parameters, initial_conditions, np.linspace(0, 50, 1000)
+
+
+def ping_pong_bi_bi():
+    ping_pong = ('(Vf*Vr*(IPA*BA-ACE*MPPA/Keq))/(Vr*Km*BA + Vr*Kp*IPA +'
+                 'Vr*BA*IPA + Vf*Kac*MPPA/Keq + Vf*Kal*ACE/Keq +'
+                 'Vf*ACE*MPPA/Keq + Vr*Km*BA*MPPA/Kialp +'
+                 'Vf*Kal*IPA*ACE/(Keq*Kimp))')
+    system = {'v': ping_pong,
+              'Keq': '((Vf/Vr)**2)*(Kac*Kal)/(Km*Kp)',
+              'dE': '-decay*E',
+              'dIPA': '-v*E',
+              'dBA': '-v*E',
+              'dACE': 'v*E',
+              'dMPPA': 'v*E'}
+    parameters = {'Vf': 2.47e-2, 'Km': 143.18, 'Kp': 3.52, 'Vr': 1.996e-2,
+                  'Kac': 207.64, 'Kal': 2.301, 'Kialp': 1.39889,
+                  'Kimp': 2.9295, 'decay': 0.00302837}
+    initial_conditions = {'IPA': 65., 'BA': 5., 'ACE': 0., 'MPPA': 0.,
+                          'E': 0.68}
+    return system, parameters, initial_conditions, np.linspace(0, 30, 1000)
+
+
+def time_model(definition, cse, number=2000):
+    system, parameters, initial_conditions, time = definition()
+
+    model = Model('benchmark', system, parameters)
+    model.use_cse = cse
+    model.initial_conditions = initial_conditions
+    model.independent = {'t': time}
+    model.initialize_model()
+    sens = DirectLocalSensitivity(model, cse=cse)
+
+    states = np.array(model.initial_conditions.values()) + 1.
+    lsa_states = np.concatenate([states,
+                                 np.zeros(sens._dxdtheta_start.size)])
+    args = model._parameter_args()
+
+    rhs = timeit.timeit(lambda: model.fun_ode(states, 1., *args),
+                        number=number)/number
+    rhs_lsa = timeit.timeit(lambda: sens._fun_ode(lsa_states, 1., *args),
+                            number=number)/number
+    run_lsa = timeit.timeit(sens._get_ode_sensitivity, number=3)/3
+    return rhs, rhs_lsa, run_lsa
+
+
+def benchmark():
+    print('{0:<18}{1:>22}{2:>22}{3:>22}'.format(
+        'model', 'fun_ode [us]', 'fun_ode_lsa [us]', 'direct LSA run [ms]'))
+    for definition in [michaelis_menten, fermentor, tanks_in_series,
+                       ping_pong_bi_bi]:
+        plain = time_model(definition, False)
+        cse = time_model(definition, True)
+        print('{0:<18}{1:>10.1f} ->{2:>8.1f}  {3:>10.1f} ->{4:>8.1f}  '
+              '{5:>10.1f} ->{6:>8.1f}'.format(
+                  definition.__name__, plain[0]*1e6, cse[0]*1e6,
+                  plain[1]*1e6, cse[1]*1e6, plain[2]*1e3, cse[2]*1e3))
+
+if __name__ == "__main__":
+    benchmark()
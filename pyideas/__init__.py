@@ -12,8 +12,12 @@ from measurements import Measurements
 from parameterdistribution import *
 
 from model import BaseModel, Model, AlgebraicModel
-from solver import HybridSolver, OdeSolver, AlgebraicSolver
-from sensitivity import NumericalLocalSensitivity, DirectLocalSensitivity
+from cache import KernelCache, OutputCache
+from inputs import InputSignal
+from solver import (HybridSolver, OdeSolver, AlgebraicSolver,
+                    SteadyStateSolver, SolverStats)
+from sensitivity import (NumericalLocalSensitivity, DirectLocalSensitivity,
+                         GlobalSensitivity)
 from confidence import TheoreticalConfidence, CalibratedConfidence
 from optimisation import ParameterOptimisation, MultiParameterOptimisation
 from uncertainty import Uncertainty
@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""
+Caching utilities for the generated model functions.
+"""
+from __future__ import division
+
+import __future__
+import os
+import sys
+import errno
+import hashlib
+import marshal
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from pyideas.version import version as PYIDEAS_VERSION
+
+# Bump this number whenever the set of generated kernels (e.g. a new
+# optional kernel such as jac_ode_sparsity) or the code generation in
+# modeldefinition or sensitivitydefinition changes, so older cache entries
+# are not reused.
+KERNEL_FORMAT = 10
+
+KERNEL_EXTENSION = '.pyideas-kernel'
+
+DEFAULT_KERNEL_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.pyideas',
+                                        'kernels')
+
+
+def compile_kernels(kernels):
+    r"""
+    Compile the source code of the generated model functions.
+
+    Parameters
+    -----------
+    kernels: OrderedDict
+        For each function name (e.g. fun_ode), the source code defining
+        that function.
+
+    Returns
+    --------
+    code: OrderedDict
+        For each function name, the compiled code object of the source.
+    """
+    code = OrderedDict()
+    for name, source in kernels.items():
+        # The generated equations rely on true division
+        code[name] = compile(source, '<pyideas-{0}>'.format(name), 'exec',
+                             __future__.division.compiler_flag, True)
+    return code
+
+
+def load_kernels(code):
+    r"""
+    Execute compiled kernels and collect the function objects.
+
+    Parameters
+    -----------
+    code: OrderedDict
+        For each function name, a code object (or source code) which defines
+        a function with that name.
+
+    Returns
+    --------
+    functions: OrderedDict
+        For each function name, the corresponding function object.
+    """
+    functions = OrderedDict()
+    for name, kernel in code.items():
+        if not hasattr(kernel, 'co_code'):
+            kernel = compile_kernels({name: kernel})[name]
+        namespace = {'np': np}
+        exec(kernel, namespace)
+        functions[name] = namespace[name]
+    return functions
+
+
+class KernelCache(object):
+    r"""
+    Content-addressed on-disk cache for the functions generated by
+    initialize_model.
+
+    Generating the model functions requires sympy (to order the algebraic
+    equations and derive Jacobians) and several regex passes. For short-lived
+    processes, this can be the major part of the runtime. The KernelCache
+    stores the generated source code (and optionally the marshalled code
+    objects) on disk, keyed on a hash of the system equations, the parameter
+    names, the independent names and the pyideas version.
+
+    Parameters
+    -----------
+    directory: str
+        Directory to store the cached kernels in. Default is
+        ~/.pyideas/kernels.
+    max_size: int
+        Maximum total size (in bytes) of the cache directory. When exceeded,
+        the least recently used entries are removed.
+    store_code: bool
+        If True, the marshalled code objects are stored together with the
+        source code, which avoids compiling the source on a warm start. Code
+        objects are only reused by the same Python version.
+
+    Examples
+    ---------
+    >>> from pyideas import Model, KernelCache
+    >>> Model.kernel_cache = KernelCache('/tmp/pyideas_kernels')
+    >>> M1 = Model('Michaelis-Menten', system, parameters)
+    >>> M1.initialize_model()  # generated once, loaded from disk afterwards
+    >>> Model.kernel_cache.invalidate(M1)
+    """
+
+    def __init__(self, directory=None, max_size=64*1024**2, store_code=False):
+        if directory is None:
+            directory = DEFAULT_KERNEL_CACHE_DIR
+        self.directory = directory
+        self.max_size = max_size
+        self.store_code = store_code
+
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return ('KernelCache({0!r}, max_size={1}, store_code={2}) - '
+                '{3} hits, {4} misses'.format(self.directory, self.max_size,
+                                              self.store_code, self.hits,
+                                              self.misses))
+
+    @staticmethod
+    def key(model, variant=None):
+        r"""
+        Hash identifying the generated functions of a model.
+
+        Parameters
+        -----------
+        model: _BiointenseModel
+            Model for which the functions are generated.
+        variant: tuple|None
+            Identifies functions generated in addition to those of
+            initialize_model, e.g. ('fun_alg_voi', variables of interest).
+
+        Returns
+        --------
+        key: str
+            Hexadecimal sha1 hash of the kernel signature of the model.
+        """
+        signature = (KERNEL_FORMAT, PYIDEAS_VERSION,
+                     model._kernel_signature())
+        if variant is not None:
+            signature += (variant,)
+        return hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + KERNEL_EXTENSION)
+
+    def _ensure_directory(self):
+        try:
+            os.makedirs(self.directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+    def load(self, model, variant=None):
+        r"""
+        Load the generated functions of the model from the cache.
+
+        Parameters
+        -----------
+        model: _BiointenseModel
+            Model for which the functions are requested.
+        variant: tuple|None
+            See key.
+
+        Returns
+        --------
+        result: tuple|None
+            None when the model is not (or no longer) available in the cache,
+            otherwise a tuple with an OrderedDict of the source code and an
+            OrderedDict with the function objects.
+        """
+        filename = self._filename(self.key(model, variant))
+        try:
+            with open(filename, 'rb') as inputfile:
+                entry = pickle.load(inputfile)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except Exception:
+            # Corrupt or truncated entry, e.g. from an interrupted write
+            self._remove(filename)
+            self.misses += 1
+            return None
+
+        kernels = entry['kernels']
+        if entry.get('code') is not None and \
+                entry.get('python') == sys.version:
+            code = OrderedDict((name, marshal.loads(data))
+                               for name, data in entry['code'].items())
+        else:
+            code = kernels
+
+        # Mark as recently used for the eviction policy
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return kernels, load_kernels(code)
+
+    def store(self, model, kernels, variant=None):
+        r"""
+        Store the generated source code of the model functions.
+
+        Parameters
+        -----------
+        model: _BiointenseModel
+            Model for which the functions were generated.
+        kernels: OrderedDict
+            For each function name, the source code defining the function.
+        variant: tuple|None
+            See key.
+        """
+        self._ensure_directory()
+
+        entry = {'kernels': kernels, 'code': None, 'python': sys.version}
+        if self.store_code:
+            entry['code'] = OrderedDict(
+                (name, marshal.dumps(code))
+                for name, code in compile_kernels(kernels).items())
+
+        # Write to a temporary file first and rename afterwards, so parallel
+        # workers never read a half written entry.
+        filename = self._filename(self.key(model, variant))
+        handle, tempname = tempfile.mkstemp(dir=self.directory,
+                                            suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                pickle.dump(entry, output, pickle.HIGHEST_PROTOCOL)
+            if os.name == 'nt' and os.path.exists(filename):
+                # rename does not overwrite existing files on Windows
+                os.remove(filename)
+            os.rename(tempname, filename)
+        except Exception:
+            self._remove(tempname)
+            raise
+
+        self._evict()
+
+    def _entries(self):
+        """
+        List the cache entries as (last access, size, filename), oldest first
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(KERNEL_EXTENSION):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        return sorted(entries)
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until max_size is satisfied
+        """
+        entries = self._entries()
+        total_size = sum(entry[1] for entry in entries)
+        for mtime, size, filename in entries:
+            if total_size <= self.max_size:
+                break
+            self._remove(filename)
+            total_size -= size
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    @property
+    def size(self):
+        """
+        Total size (in bytes) of the cached kernels
+        """
+        return sum(entry[1] for entry in self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, model):
+        return os.path.exists(self._filename(self.key(model)))
+
+    def invalidate(self, model):
+        r"""
+        Remove the cached functions of a model, forcing the functions to be
+        generated again at the next initialisation.
+
+        Parameters
+        -----------
+        model: _BiointenseModel
+            Model for which the cached functions are removed.
+        """
+        self._remove(self._filename(self.key(model)))
+
+    def clear(self):
+        r"""
+        Remove all cached functions from the cache directory.
+        """
+        for mtime, size, filename in self._entries():
+            self._remove(filename)
+        self.hits = 0
+        self.misses = 0
+
+
+class OutputCache(object):
+    r"""
+    In-memory least recently used cache of model outputs.
+
+    The outputs are keyed on a fingerprint of everything the simulation
+    depends on (parameter values, initial conditions, independent values,
+    solver procedure...). As the fingerprint is based on the values
+    themselves, setting (or changing in place) any of these values
+    automatically results in a new key, so outdated outputs are never
+    returned; they are removed when they become the least recently used.
+
+    Parameters
+    -----------
+    maxsize: int
+        Maximum number of stored outputs.
+    max_bytes: int|None
+        Maximum total size (in bytes) of the stored outputs, no limit when
+        None.
+
+    Examples
+    ---------
+    >>> M1.enable_output_cache(maxsize=32)
+    >>> M1._run()  # simulated
+    >>> M1._run()  # from the cache
+    >>> M1.output_cache
+    OutputCache(maxsize=32, max_bytes=None) - 1 entries, 1 hits, 1 misses
+    """
+
+    def __init__(self, maxsize=128, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._outputs = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return ('OutputCache(maxsize={0}, max_bytes={1}) - {2} entries, '
+                '{3} hits, {4} misses'.format(self.maxsize, self.max_bytes,
+                                              len(self), self.hits,
+                                              self.misses))
+
+    @staticmethod
+    def fingerprint(*items):
+        r"""
+        Hash of the given values, which can be (nested) dicts, lists,
+        tuples, arrays, numbers and strings.
+
+        Returns
+        --------
+        fingerprint: str
+            Hexadecimal sha1 hash of the values.
+        """
+        sha = hashlib.sha1()
+
+        def update(item):
+            if isinstance(item, dict):
+                sha.update(b'{')
+                for key, value in item.items():
+                    update(key)
+                    update(value)
+                sha.update(b'}')
+            elif isinstance(item, (list, tuple)) and \
+                    not all(isinstance(value, (int, long, float, complex))
+                            for value in item):
+                sha.update(b'[')
+                for value in item:
+                    update(value)
+                sha.update(b']')
+            elif isinstance(item, (str, unicode)):
+                sha.update(b's' + item.encode('utf-8'))
+            elif item is None or isinstance(item, bool):
+                sha.update(repr(item).encode('utf-8'))
+            else:
+                array = np.ascontiguousarray(item)
+                sha.update(repr((array.dtype.str, array.shape)).encode())
+                sha.update(array.tostring())
+
+        for item in items:
+            update(item)
+        return sha.hexdigest()
+
+    def get(self, key):
+        r"""
+        Stored output for the given fingerprint, None if not available.
+
+        The returned array is read-only, copy it before changing it.
+        """
+        try:
+            output = self._outputs.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # Most recently used at the end
+        self._outputs[key] = output
+        self.hits += 1
+        return output
+
+    def put(self, key, output):
+        r"""
+        Store the output for the given fingerprint.
+        """
+        output = np.array(output)
+        output.flags.writeable = False
+        if key in self._outputs:
+            self.nbytes -= self._outputs.pop(key).nbytes
+        self._outputs[key] = output
+        self.nbytes += output.nbytes
+
+        while self._outputs and (len(self._outputs) > self.maxsize or
+                                 (self.max_bytes is not None and
+                                  self.nbytes > self.max_bytes)):
+            removed_key, removed = self._outputs.popitem(last=False)
+            self.nbytes -= removed.nbytes
+
+    def __len__(self):
+        return len(self._outputs)
+
+    def __contains__(self, key):
+        return key in self._outputs
+
+    def clear(self):
+        r"""
+        Remove all stored outputs and reset the counters.
+        """
+        self._outputs.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
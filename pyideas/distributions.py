@@ -112,8 +112,16 @@ def LogNormalDistribution(x, mu=0.0, sigma=1.0, wholePDF=True,left=0.0,right=Non
 ##RANDOM SAMPLING                                                       ##
 ##########################################################################
 
+def _generator(random_state):
+    '''
+    random_state, or the global numpy generator when None
+    '''
+    if random_state is None:
+        return np.random
+    return random_state
+
 #Uniform
-def randomUniform(left=0.0,right=1.0,rnsize=None):
+def randomUniform(left=0.0,right=1.0,rnsize=None,random_state=None):
     '''
     link to uniform sampling of numpy, to remain consistency in names
     of the pyFUSE module
@@ -126,16 +134,19 @@ def randomUniform(left=0.0,right=1.0,rnsize=None):
         upper value
     rnsize: int
         number of samples
+    random_state: numpy.random.RandomState
+        generator to sample from, default the global numpy generator
     
     See Also
     ---------
     numpy.random.uniform
     '''
-    rn=np.random.uniform(left,right,rnsize)
+    rn=_generator(random_state).uniform(left,right,rnsize)
     return rn
 
 #triangular
-def randomTriangular(left=0.0, mode=None, right=1.0, rnsize=None):
+def randomTriangular(left=0.0, mode=None, right=1.0, rnsize=None,
+                     random_state=None):
     '''
     link to triangular sampling of numpy, to remain consistency in names
     of the pyFUSE module
@@ -150,6 +161,8 @@ def randomTriangular(left=0.0, mode=None, right=1.0, rnsize=None):
         upper value
     rnsize: int
         number of samples    
+    random_state: numpy.random.RandomState
+        generator to sample from, default the global numpy generator
     
     See Also
     ---------
@@ -158,11 +171,12 @@ def randomTriangular(left=0.0, mode=None, right=1.0, rnsize=None):
     
     if mode==None:
         print 'Triangular needs mode-value'
-    rn=np.random.triangular(left, mode, right, rnsize)
+    rn=_generator(random_state).triangular(left, mode, right, rnsize)
     return rn
 
 #trapezoidal
-def randomTrapezoidal(left=0.0,mode1=None,mode2=None,right=1.0,rnsize=None):
+def randomTrapezoidal(left=0.0,mode1=None,mode2=None,right=1.0,rnsize=None,
+                      random_state=None):
     '''
     random sampling from trapezoidal function
 
@@ -178,6 +192,8 @@ def randomTrapezoidal(left=0.0,mode1=None,mode2=None,right=1.0,rnsize=None):
         upper value
     rnsize: int
         number of samples
+    random_state: numpy.random.RandomState
+        generator to sample from, default the global numpy generator
     
     '''
     if mode1==None:
@@ -187,7 +203,7 @@ def randomTrapezoidal(left=0.0,mode1=None,mode2=None,right=1.0,rnsize=None):
 
     rn=np.zeros(rnsize)
     for i in range(np.size(rn)):
-        y = np.random.uniform(0.0,1.0,1)
+        y = _generator(random_state).uniform(0.0,1.0,1)
         h=2/(right+mode2-mode1-left)
 
         a=left
@@ -206,7 +222,7 @@ def randomTrapezoidal(left=0.0,mode1=None,mode2=None,right=1.0,rnsize=None):
     return rn
 
 #Normal
-def randomNormal(mu=0.0, sigma=1.0, rnsize=None):
+def randomNormal(mu=0.0, sigma=1.0, rnsize=None, random_state=None):
     '''
     link to sampling of normal distribution of numpy, to remain consistency in names
     of the pyFUSE module
@@ -219,17 +235,19 @@ def randomNormal(mu=0.0, sigma=1.0, rnsize=None):
         Standard deviation (spread or 'width') of the distribution
     rnsize: int
         number of samples
+    random_state: numpy.random.RandomState
+        generator to sample from, default the global numpy generator
     
     See Also
     ---------
     numpy.random.normal
     '''
     
-    rn=np.random.normal(mu, sigma, rnsize)
+    rn=_generator(random_state).normal(mu, sigma, rnsize)
     return rn
 
 #lognormal
-def randomLogNormal(mu=0.0, sigma=1.0, rnsize=None):
+def randomLogNormal(mu=0.0, sigma=1.0, rnsize=None, random_state=None):
     '''
     link to sampling of lognormal distribution of numpy, to remain consistency in names
     of the pyFUSE module
@@ -242,13 +260,15 @@ def randomLogNormal(mu=0.0, sigma=1.0, rnsize=None):
         Standard deviation of the underlying normal distribution
     rnsize: int
         number of samples
+    random_state: numpy.random.RandomState
+        generator to sample from, default the global numpy generator
     
     See Also
     ---------
     numpy.random.lognormal
     '''
     
-    rn=np.random.lognormal(mu, sigma, rnsize)
+    rn=_generator(random_state).lognormal(mu, sigma, rnsize)
     return rn
 
 #distribution selector
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Time-varying inputs (forcing functions) of the models.
+"""
+from __future__ import division
+
+import numpy as np
+
+
+INPUT_KINDS = ['step', 'linear']
+
+
+class InputSignal(object):
+    r"""
+    Input signal defined by a time series, e.g. a feed or aeration profile.
+
+    The signal can be used in the model equations by its name, see
+    Model.inputs. The times of the signal are passed to the ODE solvers as
+    breakpoints: the ODEs are integrated segment by segment and restarted at
+    each breakpoint, so the integrator does not need to resolve the
+    discontinuities by reducing its step size.
+
+    Parameters
+    -----------
+    times: array_like
+        Increasing independent values at which the signal values are given.
+    values: array_like
+        Signal value at each of the times.
+    kind: str
+        'step' for a piecewise constant signal, i.e. each value holds until
+        the next time (right-continuous); 'linear' for a linear interpolation
+        between the given values. Before the first and after the last time,
+        the first and last value are used.
+
+    Examples
+    ---------
+    >>> feed = InputSignal([0., 10., 20.], [2., 0., 2.], kind='step')
+    >>> feed(np.array([5., 10., 15.]))
+    array([ 2.,  0.,  0.])
+    """
+
+    def __init__(self, times, values, kind='step'):
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if times.shape != values.shape or times.ndim != 1:
+            raise Exception('The times and values of an InputSignal should be '
+                            '1D arrays with the same length.')
+        if np.any(np.diff(times) <= 0.):
+            raise Exception('The times of an InputSignal should be strictly '
+                            'increasing.')
+        if kind not in INPUT_KINDS:
+            raise Exception('The kind of an InputSignal should be one of ' +
+                            str(INPUT_KINDS))
+
+        self.times = times
+        self.values = values
+        self.kind = kind
+
+    def __repr__(self):
+        return 'InputSignal({0} values, kind={1!r})'.format(len(self.times),
+                                                            self.kind)
+
+    def __call__(self, independent):
+        r"""
+        Evaluate the signal, independent can be a value or an array.
+        """
+        if self.kind == 'step':
+            index = np.searchsorted(self.times, independent, side='right') - 1
+            return self.values[np.clip(index, 0, len(self.times) - 1)]
+        return np.interp(independent, self.times, self.values)
+
+    @property
+    def breakpoints(self):
+        r"""
+        Independent values at which the signal (or its derivative) is
+        discontinuous.
+        """
+        return self.times
+
+    def segment(self, start):
+        r"""
+        Smooth piece of the signal which is valid from start up to the next
+        breakpoint. Outside this segment, the piece is extended smoothly
+        (constant or linear), so an integrator evaluating slightly beyond the
+        end of the segment does not see the discontinuity.
+
+        Parameters
+        -----------
+        start: float
+            Independent value at the start of the segment.
+
+        Returns
+        --------
+        piece: SegmentSignal
+        """
+        index = np.searchsorted(self.times, start, side='right') - 1
+        if self.kind == 'step' or index < 0 or index >= len(self.times) - 1:
+            return SegmentSignal(self(start))
+
+        slope = ((self.values[index + 1] - self.values[index]) /
+                 (self.times[index + 1] - self.times[index]))
+        return SegmentSignal(self.values[index], slope, self.times[index])
+
+
+class SegmentSignal(object):
+    r"""
+    Polynomial piece of an InputSignal: offset + slope*(independent - start)
+    """
+
+    def __init__(self, offset, slope=0., start=0.):
+        self.offset = offset
+        self.slope = slope
+        self.start = start
+
+    def __call__(self, independent):
+        if self.slope == 0.:
+            return self.offset + 0.*np.asarray(independent)
+        return self.offset + self.slope*(independent - self.start)
+
+
+def get_breakpoints(inputs, independent):
+    r"""
+    Sorted breakpoints of all input signals strictly inside the horizon of
+    the independent values.
+
+    Parameters
+    -----------
+    inputs: dict
+        Input names with their InputSignal.
+    independent: array_like
+        Increasing independent values.
+    """
+    if not inputs:
+        return np.array([])
+    breakpoints = np.unique(np.concatenate(
+        [signal.breakpoints for signal in inputs.values()]))
+    return breakpoints[(breakpoints > independent[0]) &
+                       (breakpoints < independent[-1])]
+
+
+def segment_inputs(inputs, start):
+    r"""
+    Input signals frozen to their smooth piece starting at start, see
+    InputSignal.segment.
+    """
+    return dict((name, signal.segment(start))
+                for name, signal in inputs.items())
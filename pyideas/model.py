@@ -15,13 +15,58 @@ from sklearn.utils.extmath import cartesian as sklearncartesian
 
 from pyideas.modelbase import BaseModel
 from pyideas.modeldefinition import (generate_ode_derivative_definition,
-                                     generate_non_derivative_part_definition)
-from pyideas.solver import OdeSolver, AlgebraicSolver, HybridSolver
+                                     generate_non_derivative_part_definition,
+                                     generate_non_derivative_batch_definition,
+                                     generate_ode_ensemble_definition)
+from pyideas.solver import (OdeSolver, AlgebraicSolver, HybridSolver,
+                            SteadyStateSolver, SolverStats)
+from pyideas.sensitivitydefinition import (
+    generate_ode_jacobian, generate_ode_jacobian_definition,
+    generate_ode_jacobian_sparsity_definition, get_band_ordering,
+    generate_ode_banded_jacobian_definition)
+from pyideas.cache import load_kernels, OutputCache
+from pyideas.inputs import InputSignal
 
 
 class _BiointenseModel(BaseModel):
     r"""
     """
+    # Optional pyideas.KernelCache instance to reuse the generated functions
+    # across processes, e.g. Model.kernel_cache = KernelCache()
+    kernel_cache = None
+    # Pass the analytical Jacobian jac_ode to the ODE solvers, set to False
+    # to fall back on the finite difference approximation of the solvers
+    use_jacobian = True
+    # Reorder the states in a band and use banded solvers when the Jacobian
+    # of the ODEs has a narrow band structure (e.g. compartment models)
+    use_banded_jacobian = True
+    # Integrator of the ode, odespy and solve_ivp procedures (e.g. 'BDF' or
+    # 'Radau' for solve_ivp), None for the default of STD_ODE_INTEGRATOR
+    ode_integrator = None
+    # Options of the ODE solver procedure, e.g. {'rtol': 1e-6} or the
+    # max_step of the rk procedure, None for the defaults of the procedure
+    ode_solver_options = None
+    # Generate the model functions with the parameters passed as a flat
+    # sequence of floats instead of a dict, set before initialize_model
+    positional_parameters = False
+    # Calculate common subexpressions only once in the generated functions
+    # (the algebraic variables are substituted), set before initialize_model
+    use_cse = False
+    # Optional OutputCache, see enable_output_cache
+    output_cache = None
+    _positional_kernels = False
+    _parameter_vector = None
+    _inputs = None
+    # Procedure and integrator selected by procedure='auto'
+    _auto_integrator = None
+    # Algebraic variables of interest fun_alg_voi was generated for
+    _fun_alg_voi_variables = None
+    fun_alg_voi = None
+    # (fingerprint, independent values, output) of the last _run, see extend
+    _last_run = None
+    # Generated functions which are not available for each model
+    _optional_kernels = ['jac_ode', 'jac_ode_sparsity', 'jac_ode_banded']
+
     def __init__(self, name, system, parameters, independent):
         """
         """
@@ -51,6 +96,7 @@ class _BiointenseModel(BaseModel):
 
         self.fun_alg = None
         self.fun_ode = None
+        self.jac_ode = None
 
         self._initialised = False
 #==============================================================================
@@ -66,6 +112,150 @@ class _BiointenseModel(BaseModel):
 #==============================================================================
 
 
+    @property
+    def parameters(self):
+        """
+        """
+        return self._parameters
+
+    @parameters.setter
+    def parameters(self, pardict):
+        """
+        Update the parameters and refresh the preallocated parameter vector
+        passed to the model functions in positional mode.
+        """
+        BaseModel.parameters.fset(self, pardict)
+        if self._parameter_vector is None:
+            self._parameter_vector = []
+        # Refreshed in place; a list of python floats is unpacked faster
+        # than a numpy array, whose elements would become numpy scalars
+        self._parameter_vector[:] = \
+            np.asarray(self._parameters.values()).tolist()
+
+    @property
+    def inputs(self):
+        """
+        Time-varying inputs (forcing functions) of the model, see InputSignal
+        """
+        return self._inputs
+
+    @inputs.setter
+    def inputs(self, inputs):
+        """
+        Set the input signals, a dict with for each input name (used in the
+        model equations) an InputSignal. The model needs to be initialised
+        again when the input names change, changing only the signals does
+        not require a new initialisation.
+
+        Examples
+        ---------
+        >>> M1.inputs = {'Q_in': InputSignal([0., 10., 20.], [2., 0., 2.])}
+        """
+        if not inputs:
+            inputs = None
+        else:
+            for name, signal in inputs.items():
+                if not isinstance(signal, InputSignal):
+                    raise Exception('The input ' + name + ' should be an '
+                                    'InputSignal.')
+                if name in self.parameters or name in self._variables:
+                    raise Exception('The input ' + name + ' is already used '
+                                    'as parameter or variable name.')
+            inputs = self._make_OrderedDict(inputs)
+
+        names = sorted(inputs.keys()) if inputs else []
+        if names != sorted(self._inputs.keys() if self._inputs else []):
+            self._initialised = False
+        self._inputs = inputs
+
+    def _algebraic_of_interest(self):
+        """
+        Algebraic variables of interest, in the order of the model
+        """
+        return [var for var in self._ordered_var['algebraic']
+                if var in self._variables_of_interest]
+
+    def _alg_voi_function(self):
+        """
+        Algebraic part of the model calculating only the algebraic variables
+        of interest and the ones these depend on (fun_alg_voi), None if no
+        algebraic variable is of interest. The function is generated again
+        (or loaded from the kernel_cache) when the variables of interest
+        changed.
+        """
+        algebraic = self._algebraic_of_interest()
+        if algebraic != self._fun_alg_voi_variables:
+            if not algebraic:
+                self.fun_alg_voi = None
+            elif algebraic == list(self._ordered_var['algebraic']):
+                self.fun_alg_voi = self.fun_alg
+            else:
+                variant = ('fun_alg_voi', tuple(algebraic))
+                cached = None
+                if self.kernel_cache is not None:
+                    cached = self.kernel_cache.load(self, variant)
+                if cached is None:
+                    kernels = OrderedDict([(
+                        'fun_alg_voi',
+                        generate_non_derivative_part_definition(
+                            self, variables=algebraic))])
+                    functions = load_kernels(kernels)
+                    if self.kernel_cache is not None:
+                        self.kernel_cache.store(self, kernels, variant)
+                else:
+                    kernels, functions = cached
+                self.fun_alg_voi_str = kernels['fun_alg_voi']
+                self.fun_alg_voi = functions['fun_alg_voi']
+            self._fun_alg_voi_variables = algebraic
+        return self.fun_alg_voi
+
+    def _output_index(self):
+        """
+        Index of the variables of interest in the output of _simulate, which
+        contains the algebraic variables of interest followed by the ODE
+        variables.
+        """
+        variables = (self._algebraic_of_interest() +
+                     list(self._ordered_var.get('ode', [])))
+        return [variables.index(var) for var in self._variables_of_interest]
+
+    def _input_args(self):
+        """
+        Extra argument tuple with the input signals for the algebraic model
+        functions, empty when the model has no inputs.
+        """
+        if self._inputs:
+            return (self._inputs,)
+        return ()
+
+    def _input_fingerprint(self):
+        """
+        Data of the input signals, used in the output fingerprints.
+        """
+        if not self._inputs:
+            return None
+        return [(name, signal.kind, signal.times, signal.values)
+                for name, signal in self._inputs.items()]
+
+    def _parameter_args(self, parameters=None):
+        """
+        Arguments tuple with the parameters in the format of the generated
+        model functions: the parameter dict or the positional vector.
+
+        Parameters
+        -----------
+        parameters: OrderedDict
+            Parameters (in the order of model.parameters) to pass, e.g. with
+            arrays for batch evaluations. Default is the current parameters.
+        """
+        if parameters is None:
+            if self._positional_kernels:
+                return (self._parameter_vector,)
+            return (self.parameters,)
+        if self._positional_kernels:
+            return (parameters.values(),)
+        return (parameters,)
+
     def _parse_system_string(self, system):
         """
         split the system in ODE & algebraic
@@ -103,92 +293,386 @@ class _BiointenseModel(BaseModel):
         self.systemfunctions['algebraic'] = self._make_OrderedDict(alg_dict)
         self._ordered_var['algebraic'] = self.systemfunctions['algebraic'].keys()
 
-    def initialize_model(self):
+    def _kernel_signature(self):
         """
-        Parse system string equation to functions.
+        Everything the generated functions depend on, used as key by the
+        KernelCache.
         """
-        #self._check_for_independent()
-
-        fun_alg = None
-        fun_ode = None
+        return (self.__class__.__name__,
+                sorted(self._system.items()),
+                list(self.parameters.keys()),
+                list(self._independent_names),
+                bool(self.positional_parameters), bool(self.use_cse),
+                sorted(self._inputs.keys()) if self._inputs else [])
+
+    def _generate_kernels(self):
+        """
+        Generate the source code of the model functions.
 
-        # from modeldefinition import
+        Returns
+        --------
+        kernels: OrderedDict
+            For each function name, the source code defining the function.
+        """
+        kernels = OrderedDict()
         if self.systemfunctions.get('algebraic', None):
-            self.fun_alg_str = generate_non_derivative_part_definition(self)
-            exec(self.fun_alg_str)
-            self.fun_alg = fun_alg
+            kernels['fun_alg'] = generate_non_derivative_part_definition(self)
         if self.systemfunctions.get('ode', None):
-            self.fun_ode_str = generate_ode_derivative_definition(self)
-            exec(self.fun_ode_str)
-            self.fun_ode = fun_ode
+            kernels['fun_ode'] = generate_ode_derivative_definition(self)
+            try:
+                dfdx = generate_ode_jacobian(
+                    self._ordered_var['ode'],
+                    self.systemfunctions['ode'].values(),
+                    self._ordered_var['algebraic'],
+                    self.systemfunctions['algebraic'].values())
+                kernels['jac_ode'] = generate_ode_jacobian_definition(self,
+                                                                      dfdx)
+                kernels['jac_ode_sparsity'] = \
+                    generate_ode_jacobian_sparsity_definition(self, dfdx)
+                band = get_band_ordering([[element != 0 for element in row]
+                                          for row in dfdx])
+                if band[1] + band[2] + 1 < len(band[0]):
+                    kernels['jac_ode_banded'] = \
+                        generate_ode_banded_jacobian_definition(self, dfdx,
+                                                                band)
+            except Exception as error:
+                warnings.warn('The Jacobian of the ODEs could not be derived '
+                              '(' + str(error) + '), the solvers will use a '
+                              'finite difference approximation instead.')
+
+        return kernels
+
+    def initialize_model(self):
+        """
+        Parse system string equation to functions.
+
+        When a KernelCache is set as kernel_cache, previously generated
+        functions are loaded from the cache instead of being generated again.
+        """
+        #self._check_for_independent()
 
+        # The code generation follows the parameter passing mode of the
+        # kernels, which can differ from positional_parameters when the
+        # latter is changed after the initialisation
+        positional_kernels = self._positional_kernels
+        self._positional_kernels = bool(self.positional_parameters)
+        try:
+            cached = None
+            if self.kernel_cache is not None:
+                cached = self.kernel_cache.load(self)
+
+            if cached is None:
+                kernels = self._generate_kernels()
+                functions = load_kernels(kernels)
+                if self.kernel_cache is not None:
+                    self.kernel_cache.store(self, kernels)
+            else:
+                kernels, functions = cached
+        except Exception:
+            self._positional_kernels = positional_kernels
+            raise
+
+        for name in self._optional_kernels:
+            setattr(self, name, None)
+        for name, source in kernels.items():
+            setattr(self, name + '_str', source)
+            setattr(self, name, functions[name])
+
+        # The stiffness of the new model functions is probed again
+        self._auto_integrator = None
+        self._fun_alg_voi_variables = None
+        if self.output_cache is not None:
+            # Outputs of the previous model functions
+            self.output_cache.clear()
         self._initial_up_to_date = True
+        self._initialised = True
 
-    def _args_ode_function(self, fun, **kwargs):
+    def __getstate__(self):
+        """
+        The generated functions can not be pickled: only their source code
+        (the *_str attributes) is kept, the functions are compiled again when
+        the model is unpickled or copied, e.g. by the process executor of
+        NumericalLocalSensitivity or by save.
+        """
+        state = self.__dict__.copy()
+        kernels = [name for name, value in state.items()
+                   if callable(value) and name + '_str' in state]
+        for name in kernels:
+            del state[name]
+        state['_pickled_kernels'] = kernels
+        # fun_alg_voi is generated again when needed
+        state['fun_alg_voi'] = None
+        state['_fun_alg_voi_variables'] = None
+        # The continuous solution refers to the generated functions as well
+        if '_dense_solution' in state:
+            state['_dense_solution'] = None
+            state['_dense_fingerprint'] = None
+        return state
+
+    def __setstate__(self, state):
+        kernels = state.pop('_pickled_kernels', [])
+        self.__dict__.update(state)
+        functions = load_kernels(OrderedDict(
+            (name, state[name + '_str']) for name in kernels))
+        for name, function in functions.items():
+            setattr(self, name, function)
+
+    def _args_ode_function(self, fun, initial_conditions=None,
+                           independent=None, **kwargs):
         r"""
         """
-        initial_conditions = [self.initial_conditions[var]
-                              for var in self._ordered_var['ode']]
+        if initial_conditions is None:
+            initial_conditions = [self.initial_conditions[var]
+                                  for var in self._ordered_var['ode']]
         args = (fun, initial_conditions,
-                self.independent, (self.parameters,))
+                independent or self.independent, self._parameter_args())
 
         return args
 
     def _args_alg_function(self, fun, **kwargs):
         r"""
         """
-        args = (fun, self.independent, (self.parameters,),)
+        args = (fun, self.independent,
+                self._parameter_args() + self._input_args(),)
 
         return args
 
-    def _args_ode_alg_function(self, **kwargs):
+    def _args_ode_alg_function(self, fun_alg=None, initial_conditions=None,
+                               independent=None, **kwargs):
         """
         """
-        initial_conditions = [self.initial_conditions[var]
-                              for var in self._ordered_var['ode']]
-        args = (self.fun_ode, self.fun_alg, initial_conditions,
-                self.independent, (self.parameters,),)
+        if initial_conditions is None:
+            initial_conditions = [self.initial_conditions[var]
+                                  for var in self._ordered_var['ode']]
+        args = (self.fun_ode, fun_alg or self.fun_alg, initial_conditions,
+                independent or self.independent, self._parameter_args(),)
 
         return args
 
+    def _solver_jacobian(self):
+        """
+        Jacobian passed to the ODE solvers, None when not available or
+        disabled by use_jacobian.
+        """
+        if self.use_jacobian:
+            return getattr(self, 'jac_ode', None)
+        return None
+
+    def _solver_jacobian_sparsity(self):
+        """
+        Sparsity structure of the Jacobian passed to the ODE solvers, None
+        when not available.
+        """
+        if getattr(self, 'jac_ode_sparsity', None) is None:
+            return None
+        return self.jac_ode_sparsity()
+
+    def _solver_options(self):
+        """
+        Keyword arguments of OdeSolver and HybridSolver: the Jacobian and its
+        structure, the inputs, the integrator and its options.
+        """
+        options = {'jac_ode': self._solver_jacobian(),
+                   'jac_sparsity': self._solver_jacobian_sparsity(),
+                   'inputs': self._inputs,
+                   'ode_integrator': self.ode_integrator,
+                   'ode_solver_options': dict(self.ode_solver_options or {})}
+        banded = getattr(self, 'jac_ode_banded', None)
+        if self.use_banded_jacobian and banded is not None:
+            options['jac_band'] = (banded.order, banded.lband, banded.uband)
+            if self.use_jacobian:
+                options['jac_ode_banded'] = banded
+        return options
+
+    def enable_output_cache(self, maxsize=128, max_bytes=None):
+        r"""
+        Store the model outputs of _run in memory, such that repeated runs
+        with the same parameters, initial conditions, independent values and
+        procedure are not simulated again.
+
+        Parameters
+        -----------
+        maxsize: int
+            Maximum number of stored outputs.
+        max_bytes: int|None
+            Maximum total size (in bytes) of the stored outputs.
+        """
+        self.output_cache = OutputCache(maxsize=maxsize, max_bytes=max_bytes)
+
+    def disable_output_cache(self):
+        r"""
+        Remove the output cache, each run is simulated again.
+        """
+        self.output_cache = None
+
+    def _select_procedure(self, procedure):
+        """
+        Procedure and integrator of the ODE solvers. For procedure='auto',
+        these are selected by a stiffness probe (see
+        OdeSolver.select_integrator), which is done only once until the model
+        is initialised again, e.g. in an optimisation loop.
+        """
+        if procedure != 'auto':
+            return procedure, self.ode_integrator
+        if self._auto_integrator is None:
+            ode_args = self._args_ode_function(self.fun_ode)
+            solver = OdeSolver(*ode_args, **self._solver_options())
+            self._auto_integrator = solver.select_integrator()
+        return self._auto_integrator
+
+    def _run_fingerprint(self, procedure):
+        """
+        Fingerprint of all values the model output depends on, except for
+        the independent values.
+        """
+        return OutputCache.fingerprint(self.parameters,
+                                       getattr(self, 'initial_conditions',
+                                               None), procedure,
+                                       bool(self.use_jacobian),
+                                       bool(self.use_banded_jacobian),
+                                       self.ode_integrator,
+                                       self.ode_solver_options,
+                                       self._algebraic_of_interest(),
+                                       self._input_fingerprint())
+
+    def _output_fingerprint(self, procedure):
+        """
+        Fingerprint of all values the model output depends on.
+        """
+        return OutputCache.fingerprint(self._run_fingerprint(procedure),
+                                       self.independent)
+
     def _run(self, procedure="odeint"):
         """
         Run the model for the given set of parameters, independent variable
         values and output a datagrame with the variables of interest.
 
+        """
+        # Indexing with the list of indices returns a copy
+        return self._output(procedure=procedure)[:, self._output_index()]
+
+    def _output(self, procedure="odeint"):
+        """
+        Output of the algebraic variables of interest followed by all ODE
+        variables, from the output cache when available, see _simulate.
         """
         if not self._initialised:
             self.initialize_model()
 
+        if self.output_cache is None:
+            result = self._simulate(procedure=procedure)
+        else:
+            key = self._output_fingerprint(procedure)
+            result = self.output_cache.get(key)
+            if result is None:
+                result = self._simulate(procedure=procedure)
+                self.output_cache.put(key, result)
+            else:
+                self._record_solve_stats(SolverStats(
+                    'cache', rhs_evaluations=0, jacobian_evaluations=0,
+                    steps=0, rejected_steps=0))
+
+        return result
+
+    def _simulate(self, procedure="odeint"):
+        """
+        Simulate the algebraic variables of interest followed by all ODE
+        variables, see _output_index.
+        """
 #        self._check_len_independent(self._independent_values.values())
 
+        solver, procedure = self._model_solver(procedure)
+        if isinstance(solver, AlgebraicSolver):
+            result = solver.solve()
+        else:
+            result = solver.solve(procedure=procedure)
+        self._record_solve_stats(solver.stats)
+
+        #result = pd.DataFrame(result, columns=var)
+
+        return result
+
+    def _model_solver(self, procedure="odeint", initial_conditions=None,
+                      independent=None):
+        """
+        Solver of the algebraic variables of interest and the ODE variables,
+        and the (selected) ODE procedure. By default, the solver starts from
+        the initial conditions at the independent values of the model.
+        """
         ode_var = self._ordered_var.get('ode')
-        alg_var = self._ordered_var.get('algebraic')
+        fun_alg = self._alg_voi_function()
 
         if ode_var:
-            var = [] + ode_var
-            if alg_var:
-                var += alg_var
-                ode_alg_args = self._args_ode_alg_function()
-                solver = HybridSolver(*ode_alg_args)
+            procedure, integrator = self._select_procedure(procedure)
+            options = self._solver_options()
+            options['ode_integrator'] = integrator
+            if fun_alg is not None:
+                ode_alg_args = self._args_ode_alg_function(
+                    fun_alg=fun_alg, initial_conditions=initial_conditions,
+                    independent=independent)
+                solver = HybridSolver(*ode_alg_args, **options)
             else:
-                ode_args = self._args_ode_function(self.fun_ode)
-                solver = OdeSolver(*ode_args)
-            result = solver.solve(procedure=procedure)
+                ode_args = self._args_ode_function(
+                    self.fun_ode, initial_conditions=initial_conditions,
+                    independent=independent)
+                solver = OdeSolver(*ode_args, **options)
 
-        elif alg_var:
-            var = [] + alg_var
-            alg_args = self._args_alg_function(self.fun_alg)
+        elif fun_alg is not None:
+            alg_args = self._args_alg_function(fun_alg)
             solver = AlgebraicSolver(*alg_args)
-
-            result = solver.solve()
         else:
             raise Exception("In an initialized Model, there should always "
                             "be at least a fun_ode or fun_alg.")
 
-        #result = pd.DataFrame(result, columns=var)
+        return solver, procedure
+
+    def run_chunks(self, chunk_size, procedure="odeint"):
+        """
+        Run the model chunk by chunk of the independent values and yield the
+        output of the variables of interest for each chunk. For very long
+        horizons, the chunks can be processed (e.g. written to disk) as they
+        arrive, without keeping the full output in memory.
 
-        return result[:, self._variables_of_interest_index]
+        Parameters
+        -----------
+        chunk_size: int
+            Number of independent values in each chunk.
+        procedure: str
+            ODE solver procedure, see OdeSolver.
+
+        Yields
+        -------
+        output: numpy.ndarray
+            Array with shape (number of independent values of the chunk,
+            number of variables of interest).
+
+        Examples
+        ---------
+        >>> M1.independent = {'t': np.linspace(0, 40320, 40321)}
+        >>> with open('output.csv', 'w') as output_file:
+                for block in M1.run_chunks(1440):
+                    np.savetxt(output_file, block, delimiter=',')
+        """
+        if not self._initialised:
+            self.initialize_model()
+
+        solver, procedure = self._model_solver(procedure)
+        if isinstance(solver, AlgebraicSolver):
+            chunks = solver.solve_chunks(chunk_size)
+        elif isinstance(solver, OdeSolver):
+            chunks = (output for independent, output in
+                      solver.solve_chunks(chunk_size, procedure=procedure))
+        else:
+            chunks = solver.solve_chunks(chunk_size, procedure=procedure)
+
+        output_index = self._output_index()
+        try:
+            for output in chunks:
+                yield output[:, output_index]
+        finally:
+            # Also when the chunks are not consumed until the end
+            if solver.stats is not None:
+                self._record_solve_stats(solver.stats)
 
     def run(self, procedure="odeint"):
         """
@@ -197,6 +681,13 @@ class _BiointenseModel(BaseModel):
         """
         result = self._run(procedure=procedure)
 
+        return self._output_dataframe(result)
+
+    def _output_dataframe(self, result):
+        """
+        DataFrame of the output of the variables of interest, indexed by the
+        independent values.
+        """
         result = pd.DataFrame(result, columns=self._variables_of_interest)
 
         index = pd.MultiIndex.from_arrays(self._independent_values.values(),
@@ -286,7 +777,16 @@ class Model(_BiointenseModel):
         self._variables_of_interest_index = range(len(self._variables))
 
         self.fun_alg = None
+        self.fun_alg_batch = None
         self.fun_ode = None
+        self.fun_ode_ensemble = None
+        self.jac_ode = None
+        self.jac_ode_sparsity = None
+        self.jac_ode_banded = None
+
+        # Continuous ODE solution used by evaluate_at
+        self._dense_solution = None
+        self._dense_fingerprint = None
 
         self._initialised = False
 
@@ -324,6 +824,440 @@ class Model(_BiointenseModel):
                 raise Exception('Initial condition defined for variable which '
                                 'is not (an ODE variable) in the model.')
 
+    def _generate_kernels(self):
+        """
+        Generate the source code of the model functions, including the
+        vectorised versions of fun_ode and fun_alg used by run_ensemble.
+        """
+        kernels = super(Model, self)._generate_kernels()
+        if self.systemfunctions.get('ode', None):
+            kernels['fun_ode_ensemble'] = \
+                generate_ode_ensemble_definition(self)
+        if self.systemfunctions.get('algebraic', None):
+            kernels['fun_alg_batch'] = \
+                generate_non_derivative_batch_definition(self)
+
+        return kernels
+
+    @staticmethod
+    def _ensemble_values(values, names, current):
+        """
+        Convert the ensemble definition to an OrderedDict with, for each
+        name, either the current value (not part of the ensemble) or an array
+        with one value for each member.
+        """
+        if values is None:
+            values = {}
+        elif isinstance(values, (list, tuple)):
+            # list with a dict for each member
+            values = dict((key, np.array([member[key] for member in values]))
+                          for key in values[0].keys())
+        if not set(values.keys()).issubset(names):
+            raise KeyError("The ensemble contains names which are not "
+                           "available in the model: " +
+                           str(list(set(values.keys()) - set(names))))
+
+        ensemble = OrderedDict()
+        for name in names:
+            ensemble[name] = np.asarray(values.get(name, current[name]),
+                                        dtype=float)
+        return ensemble
+
+    def run_ensemble(self, parameters=None, initial_conditions=None,
+                     procedure='odeint'):
+        r"""
+        Run the model for many parameter sets and/or initial conditions at
+        once.
+
+        The states of all N ensemble members are stacked in one vector, which
+        is integrated by a vectorised version of fun_ode. In this way, N
+        trajectories cost one ODE solve instead of N.
+
+        Parameters
+        -----------
+        parameters: dict|list
+            Either a dict with, for the varying parameters, an array with one
+            value for each member, or a list with a (parameter) dict for each
+            member. Parameters which are not given keep their current value.
+        initial_conditions: dict|list
+            Idem for the initial conditions.
+        procedure: str
+            ODE solver procedure, see OdeSolver. For non-stiff models, 'rk'
+            advances all members in lock-step with a vectorised Runge-Kutta
+            integrator (model.ode_integrator 'rk4' or 'rk45').
+
+        Returns
+        --------
+        output: numpy.ndarray
+            Array with shape (N, number of independent values, number of
+            variables of interest).
+
+        Examples
+        ---------
+        >>> M1 = Model('Michaelis-Menten', system, parameters)
+        >>> M1.initial_conditions = {'S': 500., 'P': 0.}
+        >>> M1.independent = {'t': np.linspace(0, 2500, 100)}
+        >>> output = M1.run_ensemble(
+                parameters={'Km': np.random.uniform(100., 200., 1000)},
+                initial_conditions={'S': np.linspace(400., 600., 1000)})
+        """
+        if not self._initialised:
+            self.initialize_model()
+
+        ode_var = self._ordered_var['ode']
+        alg_var = self._ordered_var['algebraic']
+
+        ens_pars = self._ensemble_values(parameters, self.parameters.keys(),
+                                         self.parameters)
+        ens_init = self._ensemble_values(initial_conditions, ode_var,
+                                         self.initial_conditions)
+
+        members = set(value.size for value in
+                      ens_pars.values() + ens_init.values() if value.ndim)
+        if len(members) > 1:
+            raise Exception('All ensemble arrays need to have the same '
+                            'length.')
+        n_members = members.pop() if members else 1
+
+        indep_len = len(self.independent.values()[0])
+        output = []
+
+        if ode_var:
+            initial = np.empty([n_members, len(ode_var)])
+            for i, var in enumerate(ode_var):
+                initial[:, i] = ens_init[var]
+            options = {'ode_solver_options':
+                       dict(self.ode_solver_options or {})}
+            if self.use_banded_jacobian and \
+                    self.jac_ode_sparsity is not None:
+                # The Jacobian of the stacked members is block diagonal,
+                # banded with the band of a single member
+                order, lband, uband = get_band_ordering(
+                    self.jac_ode_sparsity())
+                options['jac_band'] = ([k*len(ode_var) + i
+                                        for k in range(n_members)
+                                        for i in order], lband, uband)
+            procedure, options['ode_integrator'] = \
+                self._select_procedure(procedure)
+            solver = OdeSolver(self.fun_ode_ensemble, initial.ravel(),
+                               self.independent,
+                               self._parameter_args(ens_pars),
+                               inputs=self._inputs, **options)
+            ode_output = solver.solve(procedure=procedure)
+            self._record_solve_stats(solver.stats)
+            ode_output = ode_output.reshape(indep_len, n_members,
+                                            len(ode_var)).transpose(1, 0, 2)
+
+        if alg_var:
+            # All members at once, with the parameters as column vectors
+            batch_pars = OrderedDict(
+                (par, value[:, None] if value.ndim else value)
+                for par, value in ens_pars.items())
+            kwargs = {'batch_len': n_members}
+            if ode_var:
+                kwargs['ode_values'] = ode_output
+            solver = AlgebraicSolver(self.fun_alg_batch, self.independent,
+                                     self._parameter_args(batch_pars) +
+                                     self._input_args(), **kwargs)
+            output.append(solver.solve())
+
+        if ode_var:
+            output.append(ode_output)
+
+        result = np.concatenate(output, axis=2)
+
+        return result[:, :, self._variables_of_interest_index]
+
+    def _dense_ode_solution(self, method='LSODA'):
+        """
+        Continuous solution of the ODEs over the current independent
+        horizon, integrated again only when the parameters, initial
+        conditions or horizon changed.
+        """
+        independent = np.asarray(self.independent.values()[0], dtype=float)
+        fingerprint = OutputCache.fingerprint(
+            self.parameters, self.initial_conditions,
+            (independent[0], independent[-1]), method,
+            bool(self.use_jacobian), bool(self.use_banded_jacobian),
+            id(self.fun_ode),
+            self._input_fingerprint())
+        if self._dense_solution is None or \
+                fingerprint != self._dense_fingerprint:
+            ode_args = self._args_ode_function(self.fun_ode)
+            solver = OdeSolver(*ode_args, **self._solver_options())
+            self._dense_solution = solver.solve_dense(method=method)
+            self._record_solve_stats(solver.stats)
+            self._dense_fingerprint = fingerprint
+        return self._dense_solution
+
+    def evaluate_at(self, independent_values, return_error=False,
+                    method='LSODA'):
+        r"""
+        Evaluate the model at any independent values inside the horizon of
+        model.independent, without integrating the ODEs again.
+
+        The ODEs are integrated once over the horizon with an integrator
+        providing a continuous extension (dense output). Further calls only
+        interpolate this solution, until the parameters, the initial
+        conditions or the horizon are changed.
+
+        Parameters
+        -----------
+        independent_values: array_like
+            Values of the independent to evaluate the model at, inside the
+            first and last value of model.independent.
+        return_error: bool
+            If True, the estimated (absolute) interpolation error is returned
+            as well, see DenseOdeSolution.
+        method: str
+            Integration method of scipy.integrate.solve_ivp.
+
+        Returns
+        --------
+        output: numpy.ndarray
+            Array with shape (number of independent values, number of
+            variables of interest).
+        error: numpy.ndarray
+            Estimated error with the same shape as output, only returned if
+            return_error is True.
+
+        Examples
+        ---------
+        >>> M1.independent = {'t': np.linspace(0, 2500, 10)}
+        >>> output = M1.evaluate_at(np.array([12.5, 600., 1800.]))
+        >>> output, error = M1.evaluate_at([12.5], return_error=True)
+        """
+        if not self._initialised:
+            self.initialize_model()
+
+        independent_values = np.atleast_1d(np.asarray(independent_values,
+                                                      dtype=float))
+        ode_var = self._ordered_var['ode']
+        alg_var = self._ordered_var['algebraic']
+
+        output = []
+        error = []
+        if ode_var:
+            solution = self._dense_ode_solution(method=method)
+            ode_output = solution(independent_values)
+            if return_error:
+                ode_hermite = solution.hermite(independent_values)
+
+        if alg_var:
+            independent = {self._independent_names[0]: independent_values}
+            kwargs = {}
+            if ode_var:
+                kwargs['ode_values'] = ode_output
+            solver = AlgebraicSolver(self.fun_alg, independent,
+                                     self._parameter_args() +
+                                     self._input_args(), **kwargs)
+            alg_output = solver.solve()
+            output.append(alg_output)
+            if return_error:
+                if ode_var:
+                    # Propagate the error of the states to the algebraic
+                    # variables
+                    kwargs['ode_values'] = ode_hermite
+                    solver = AlgebraicSolver(self.fun_alg, independent,
+                                             self._parameter_args() +
+                                             self._input_args(), **kwargs)
+                    error.append(np.abs(alg_output - solver.solve()))
+                else:
+                    error.append(np.zeros_like(alg_output))
+
+        if ode_var:
+            output.append(ode_output)
+            if return_error:
+                error.append(np.abs(ode_output - ode_hermite))
+
+        output = np.hstack(output)[:, self._variables_of_interest_index]
+        if return_error:
+            error = np.hstack(error)[:, self._variables_of_interest_index]
+            return output, error
+        return output
+
+
+    def extend(self, independent_values, procedure="odeint"):
+        r"""
+        Extend the horizon of the model with new independent values and run
+        the model for the whole horizon.
+
+        When the previous extend was done with the same parameters, initial
+        conditions and procedure, only the new part of the horizon is
+        integrated, starting from the last states of that extend, and
+        appended to its output. The same holds for the output of the last
+        run when the model has an output_cache. Otherwise, the model is run
+        again for the whole horizon.
+
+        Parameters
+        -----------
+        independent_values: array_like
+            Increasing independent values after the last value of
+            model.independent.
+        procedure: str
+            ODE solver procedure, see OdeSolver.
+
+        Returns
+        --------
+        output: pandas.DataFrame
+            Output of the variables of interest for the whole horizon, as
+            returned by run.
+
+        Examples
+        ---------
+        >>> M1.independent = {'t': np.linspace(0, 60, 61)}
+        >>> output = M1.run()
+        >>> output = M1.extend(np.linspace(61, 120, 60))
+        """
+        return self._output_dataframe(self._extend(independent_values,
+                                                   procedure=procedure))
+
+    def _extend(self, independent_values, procedure="odeint"):
+        """
+        Extend the horizon and return the output of the variables of
+        interest, see extend.
+        """
+        if not self._initialised:
+            self.initialize_model()
+
+        name = self._independent_names[0]
+        current = np.asarray(self.independent[name], dtype=float)
+        new = np.atleast_1d(np.asarray(independent_values, dtype=float))
+        if not new.size or new[0] <= current[-1] or \
+                np.any(np.diff(new) <= 0.):
+            raise Exception('The independent values to extend the horizon '
+                            'with should be increasing and after the last '
+                            'independent value of the model.')
+
+        # Output of the current horizon, kept by the previous extend or
+        # stored in the output cache by the last run
+        last_run = self._last_run
+        fingerprint = self._run_fingerprint(procedure)
+        if last_run is not None and last_run[0] == fingerprint and \
+                np.array_equal(last_run[1], current):
+            output = last_run[2]
+        elif self.output_cache is not None:
+            output = self.output_cache.get(self._output_fingerprint(procedure))
+        else:
+            output = None
+
+        if output is None or not self._ordered_var['ode']:
+            self.independent = {name: np.concatenate([current, new])}
+            output = self._output(procedure=procedure)
+        else:
+            # Continue from the last ODE states of the current horizon
+            ode_start = len(self._algebraic_of_interest())
+            solver, procedure = self._model_solver(
+                procedure, initial_conditions=output[-1, ode_start:],
+                independent={name: np.concatenate([current[-1:], new])})
+            output = np.concatenate([output,
+                                     solver.solve(procedure=procedure)[1:]])
+            self._record_solve_stats(solver.stats)
+
+            self.independent = {name: np.concatenate([current, new])}
+            if self.output_cache is not None:
+                self.output_cache.put(self._output_fingerprint(procedure),
+                                      output)
+
+        # Kept to continue the integration with the next extend
+        self._last_run = (fingerprint, np.array(self.independent[name]),
+                          output)
+
+        return output[:, self._output_index()]
+
+    def steady_state(self, initial_guess=None, independent_value=None,
+                     tol=1e-10, max_iter=50):
+        r"""
+        Calculate the steady state of the model directly, by solving
+        fun_ode = 0 instead of integrating the ODEs up to a large
+        independent value.
+
+        The steady state is solved by Newton's method with the (symbolic)
+        Jacobian jac_ode, with pseudo-transient continuation as fall back,
+        see SteadyStateSolver. The algebraic variables are evaluated at the
+        steady state.
+
+        Parameters
+        -----------
+        initial_guess: dict|None
+            Initial guess for (some of) the ODE variables, the initial
+            conditions are used for the others. When the steady state is not
+            unique, e.g. because of conserved quantities, the solution
+            depends on the initial guess.
+        independent_value: float|None
+            Independent value to evaluate the inputs at, default the last
+            value of model.independent.
+        tol: float
+            Maximum absolute derivative of the ODEs at the steady state.
+        max_iter: int
+            Maximum number of Newton iterations.
+
+        Returns
+        --------
+        output: pandas.Series
+            Steady state value of each of the variables of interest.
+
+        Examples
+        ---------
+        >>> M1 = Model('chemostat', system, parameters)
+        >>> M1.initial_conditions = {'S': 0.02, 'X': 5e-5}
+        >>> M1.steady_state()
+        """
+        states, independent_value = self._steady_state(
+            initial_guess=initial_guess, independent_value=independent_value,
+            tol=tol, max_iter=max_iter)
+        output = self._steady_state_output(states, independent_value)
+        return pd.Series(output, index=self._variables_of_interest)
+
+    def _steady_state(self, initial_guess=None, independent_value=None,
+                      tol=1e-10, max_iter=50):
+        """
+        States at the steady state and the independent value at which the
+        derivatives are evaluated, see steady_state.
+        """
+        if not self._initialised:
+            self.initialize_model()
+
+        ode_var = self._ordered_var['ode']
+        if not ode_var:
+            raise Exception('The steady state can only be calculated for a '
+                            'model with ODEs.')
+        if independent_value is None:
+            independent_value = 0.
+            if self.independent is not None:
+                independent_value = self.independent.values()[0][-1]
+
+        guess = [self.initial_conditions[var] for var in ode_var]
+        if initial_guess is not None:
+            guess = [initial_guess.get(var, value)
+                     for var, value in zip(ode_var, guess)]
+
+        solver = SteadyStateSolver(self.fun_ode, guess, independent_value,
+                                   self._parameter_args() +
+                                   self._input_args(),
+                                   jac_ode=self._solver_jacobian(), tol=tol,
+                                   max_iter=max_iter)
+        try:
+            states = solver.solve()
+        finally:
+            self._record_solve_stats(solver.stats)
+        return states, independent_value
+
+    def _steady_state_output(self, states, independent_value):
+        """
+        Variables of interest for the given steady state.
+        """
+        output = [states]
+        fun_alg = self._alg_voi_function()
+        if fun_alg is not None:
+            independent = {self._independent_names[0]:
+                           np.array([independent_value], dtype=float)}
+            solver = AlgebraicSolver(fun_alg, independent,
+                                     self._parameter_args() +
+                                     self._input_args(),
+                                     ode_values=states[np.newaxis, :])
+            output.insert(0, np.asarray(solver.solve())[0])
+        return np.concatenate(output)[self._output_index()]
 
 #==============================================================================
 #     def set_initial(self, initial_values):
@@ -542,6 +1476,7 @@ class AlgebraicModel(_BiointenseModel):
         self._variables_of_interest_index = range(len(self._variables))
 
         self.fun_alg = None
+        self.fun_alg_batch = None
 
         # Model initialised?
         self._initialised = False
@@ -552,6 +1487,75 @@ class AlgebraicModel(_BiointenseModel):
             if eq.startswith('d'):
                 raise Exception('Algebraic class cannot work with ODEs')
 
+    def _generate_kernels(self):
+        """
+        Generate the source code of the model functions, including the
+        broadcasting version of fun_alg used by run_batch.
+        """
+        kernels = super(AlgebraicModel, self)._generate_kernels()
+        kernels['fun_alg_batch'] = \
+            generate_non_derivative_batch_definition(self)
+
+        return kernels
+
+    def run_batch(self, param_matrix, parameters=None):
+        r"""
+        Evaluate the model for many parameter sets at once.
+
+        Instead of calling fun_alg once for every parameter set, all sets are
+        evaluated by a broadcasting version of fun_alg, in which each
+        parameter is a column vector.
+
+        Parameters
+        -----------
+        param_matrix: numpy.ndarray
+            Array with shape (number of parameter sets, number of parameters).
+        parameters: list
+            Names of the parameters in the columns of param_matrix. Default is
+            all model parameters in the order of model.parameters. Parameters
+            which are not listed keep their current value.
+
+        Returns
+        --------
+        output: numpy.ndarray
+            Array with shape (number of parameter sets, number of independent
+            values, number of variables of interest).
+
+        Examples
+        ---------
+        >>> M1 = AlgebraicModel('MM', {'v': 'Vmax*S/(Km + S)'},
+                                {'Vmax': 1e-2, 'Km': 0.4}, ['S'])
+        >>> M1.independent = {'S': np.linspace(0., 5., 100)}
+        >>> samples = np.random.uniform(0.1, 1., (1000, 2))
+        >>> output = M1.run_batch(samples, parameters=['Km', 'Vmax'])
+        """
+        if not self._initialised:
+            self.initialize_model()
+
+        if parameters is None:
+            parameters = self.parameters.keys()
+        param_matrix = np.atleast_2d(param_matrix)
+        if param_matrix.shape[1] != len(parameters):
+            raise Exception('The number of columns of param_matrix should be '
+                            'equal to the number of parameters.')
+        if not set(parameters).issubset(self.parameters.keys()):
+            raise KeyError("The defined parameters are not all available in "
+                           "the model. Check for typos or reinitialise the "
+                           "model.")
+
+        batch_pars = self.parameters.copy()
+        for i, par in enumerate(parameters):
+            batch_pars[par] = param_matrix[:, i:i + 1]
+
+        solver = AlgebraicSolver(self.fun_alg_batch, self.independent,
+                                 self._parameter_args(batch_pars) +
+                                 self._input_args(),
+                                 batch_len=param_matrix.shape[0])
+        result = solver.solve()
+        self._record_solve_stats(solver.stats)
+
+        return result[:, :, self._variables_of_interest_index]
+
 #==============================================================================
 #     def __repr__(self):
 #         """
@@ -4,13 +4,17 @@ import pandas as pd
 import pickle
 from collections import OrderedDict
 
-from pyideas.solver import AlgebraicSolver
+from pyideas.solver import AlgebraicSolver, SolverStats
 
 
 FILE_EXTENSION = '.pyideas'
 
 
 class BaseModel(object):
+    # Statistics of the last solve and of all solves of the model, see
+    # SolverStats and reset_solve_stats
+    last_solve_stats = None
+    total_solve_stats = SolverStats(solves=0)
 
     def __init__(self, name, parameters, variables, indep_names, fun):
         """
@@ -156,9 +160,33 @@ class BaseModel(object):
                                  (self.parameters,))
 
         result = solver.solve()
+        self._record_solve_stats(solver.stats)
 
         return result[:, self._variables_of_interest_index]
 
+    def _record_solve_stats(self, stats):
+        """
+        Keep the statistics of a solve as last_solve_stats and add them to
+        total_solve_stats.
+        """
+        self.last_solve_stats = stats
+        self.total_solve_stats = self.total_solve_stats + stats
+
+    def reset_solve_stats(self):
+        r"""
+        Reset the aggregated statistics of the solves of the model, see
+        SolverStats.
+
+        Examples
+        ---------
+        >>> M1.reset_solve_stats()
+        >>> M1.run()
+        >>> M1.run(procedure='ode')
+        >>> M1.total_solve_stats.rhs_evaluations
+        """
+        self.last_solve_stats = None
+        self.total_solve_stats = SolverStats(solves=0)
+
     def run(self, procedure=None):
         """
         Run the model for the given set of parameters, independent variable
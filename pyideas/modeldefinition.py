@@ -6,6 +6,8 @@ Created on Sun Jan  4 12:02:32 2015
 """
 
 import re
+from collections import OrderedDict
+
 import numpy as np
 import sympy
 from sympy.abc import _clash
@@ -37,6 +39,39 @@ def write_parameters(defstr, parameters):
         defstr += "    {0} = parameters['{0}']\n".format(parname)
     return defstr
 
+def write_parameters_positional(defstr, parameters):
+    """
+    The parameters are passed as a flat sequence (e.g. a float array) in the
+    order of the parameters dict and are unpacked in one step, which avoids a
+    dict lookup for each parameter at every function call.
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    parameters : OrderedDict
+        key gives parameter names (!sequence is important)
+    """
+    if parameters:
+        defstr += '    {0}, = parameters\n'.format(', '.join(parameters))
+    return defstr
+
+def write_model_parameters(defstr, model):
+    """
+    Write the parameter lines according to the parameter passing mode of the
+    kernels of the model (positional_parameters at the initialisation, see
+    _BiointenseModel.positional_parameters)
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    model : biointense.model
+    """
+    if getattr(model, '_positional_kernels', False):
+        return write_parameters_positional(defstr, model.parameters)
+    return write_parameters(defstr, model.parameters)
+
 def write_independent(defstr, independent):
     """
     Parameters
@@ -50,6 +85,27 @@ def write_independent(defstr, independent):
         defstr += "    {0} = independent['{0}']\n".format(ind_name)
     return defstr
 
+def write_inputs(defstr, inputs, independent_name):
+    """
+    The input signals are passed as first extra argument (a dict of
+    callables) and are evaluated at the independent value(s)
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    inputs : dict
+        key gives input names
+    independent_name : str
+        name of the independent variable in the definition
+    """
+    if inputs:
+        defstr += "    inputs = args[0]\n"
+        for input_name in inputs:
+            defstr += "    {0} = inputs['{0}']({1})\n".format(input_name,
+                                                           independent_name)
+    return defstr
+
 def write_ode_indices(defstr, ode_variables):
     """
     Based on the sequence of the variables in the variables dict,
@@ -66,7 +122,56 @@ def write_ode_indices(defstr, ode_variables):
         defstr += '    {0} = odes[{1}]\n'.format(varname, str(i))
     return defstr
 
-def write_array_extraction(defstr, ode_variables):
+def write_ode_unpack(defstr, ode_variables):
+    """
+    The ode vector is unpacked in one step, in the sequence of the variables
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    ode_variables : list
+        variable names (!sequence is important)
+    """
+    if ode_variables:
+        defstr += '    {0}, = odes\n'.format(', '.join(ode_variables))
+    return defstr
+
+def write_model_ode_indices(defstr, model):
+    """
+    Write the lines extracting the current ode values according to the
+    parameter passing mode of the model; the positional mode unpacks the
+    states in one step as well.
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    model : biointense.model
+    """
+    if getattr(model, '_positional_kernels', False):
+        return write_ode_unpack(defstr, model._ordered_var['ode'])
+    return write_ode_indices(defstr, model._ordered_var['ode'])
+
+def write_ensemble_indices(defstr, ode_variables):
+    """
+    The ode vector contains the states of all ensemble members one after the
+    other. The vector is reshaped and each state becomes an array with the
+    values of all members.
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    ode_variables : list
+        variable names (!sequence is important)
+    """
+    defstr += '    odes = odes.reshape(-1, {0})\n'.format(len(ode_variables))
+    for i, varname in enumerate(ode_variables):
+        defstr += '    {0} = odes[:, {1}]\n'.format(varname, str(i))
+    return defstr
+
+def write_array_extraction(defstr, ode_variables, batch=False):
     """
     Based on the sequence of the variables in the variables dict,
     the ode sequence is printed
@@ -77,13 +182,17 @@ def write_array_extraction(defstr, ode_variables):
         str containing the definition to solve in model
     ode_variables : list
         variable names (!sequence is important)
+    batch : bool
+        If True, the ode values have an additional first dimension with the
+        parameter sets, see generate_non_derivative_batch_definition.
     """
     if ode_variables:
         defstr += "    solved_variables = kwargs.get('ode_values')\n"
 
+    index = ':, :, {0}' if batch else ':, {0}'
     for i, varname in enumerate(ode_variables):
-        defstr += '    {0} = solved_variables[:, {1}]\n'.format(varname,
-                                                                str(i))
+        defstr += '    {0} = solved_variables[{1}]\n'.format(
+            varname, index.format(i))
     return defstr
 
 #==============================================================================
@@ -274,6 +383,169 @@ def write_algebraic_solve(defstr, algebraic_right_side, independent_var):
                                     independent_var=independent_var)
     return defstr
 
+def write_algebraic_batch(defstr, algebraic_right_side):
+    """
+    Based on the model equations of the algebraic-part model, the equations are
+    printed in the function, broadcasted to the batch_shape (number of
+    parameter sets x number of independent values)
+
+    Parameters
+    -----------
+    defstr : str
+        str containing the definition to solve in model
+    algebraic_right_side : dict
+        dict of variables with their corresponding right hand side part of
+        the equation
+    """
+    if algebraic_right_side:
+        varnames, expressions = _order_algebraic(algebraic_right_side)
+        for i, varname in enumerate(varnames):
+            expression = replace_numpy_fun(expressions[i])
+            defstr += '    {0} = {1} + np.zeros(batch_shape)\n'.format(
+                varname, str(expression))
+    return defstr
+
+def get_algebraic_dependencies(algebraic_right_side, variables):
+    """
+    Algebraic equations needed to calculate the given algebraic variables,
+    i.e. their own equations and those of the algebraic variables they
+    depend on (directly or through other algebraic variables)
+
+    Parameters
+    -----------
+    algebraic_right_side : dict
+        dict of variables with their corresponding right hand side part of
+        the equation
+    variables : list
+        algebraic variables to calculate
+
+    Returns
+    --------
+    needed : OrderedDict
+        the needed variables with their right hand side, in the order of
+        algebraic_right_side
+    """
+    needed = set()
+    todo = list(variables)
+    while todo:
+        varname = todo.pop()
+        if varname in needed:
+            continue
+        needed.add(varname)
+        todo += [name for name in re.findall(r'[A-Za-z_]\w*',
+                                             algebraic_right_side[varname])
+                 if name in algebraic_right_side]
+    return OrderedDict((varname, expression) for varname, expression
+                       in algebraic_right_side.items() if varname in needed)
+
+def _substituted_algebraic(algebraic_right_side):
+    """
+    Symbolic algebraic equations in which the other algebraic variables are
+    replaced by their equations, such that they only depend on the
+    parameters, the independent and the ODE states.
+
+    Parameters
+    -----------
+    algebraic_right_side : dict
+        dict of variables with their corresponding right hand side part of
+        the equation
+
+    Returns
+    --------
+    substituted : OrderedDict
+        For each algebraic variable (in the order of evaluation), the sympy
+        expression of the right hand side.
+    """
+    substituted = OrderedDict()
+    if algebraic_right_side:
+        varnames, expressions = _order_algebraic(algebraic_right_side)
+        for varname, expression in zip(varnames, expressions):
+            substituted[varname] = _substitute_algebraic(expression,
+                                                         substituted)
+    return substituted
+
+def _substitute_algebraic(expression, substituted):
+    """
+    Replace the algebraic variables in an equation by their expressions
+
+    Parameters
+    -----------
+    expression : str
+        right hand side of an equation
+    substituted : dict
+        algebraic variables with their (substituted) sympy expression, see
+        _substituted_algebraic
+    """
+    expression = sympy.sympify(expression, _clash)
+    return expression.xreplace(dict((sympy.Symbol(name), value)
+                                    for name, value in substituted.items()))
+
+def numpy_expression(expression):
+    """
+    Check that a sympy expression can be written as numpy code. Abs is
+    written as abs (np.abs), whereas derivatives sympy could not evaluate
+    (e.g. of abs) and functions which are not known numpy functions (e.g.
+    Heaviside, Max) are rejected.
+
+    Parameters
+    -----------
+    expression : sympy expression|number
+
+    Returns
+    --------
+    expression : sympy expression
+    """
+    expression = sympy.sympify(expression)
+    if expression.atoms(sympy.Derivative):
+        raise Exception('The derivatives in ' + str(expression) + ' could '
+                        'not be evaluated.')
+    expression = expression.replace(sympy.Abs, sympy.Function('abs'))
+    unknown = [name for name in re.findall(r'([A-Za-z_][\w\.]*)\s*\(',
+                                           str(expression))
+               if name not in KNOWN_NUMPY_FUN]
+    if unknown:
+        raise Exception('The functions ' + ', '.join(sorted(set(unknown))) +
+                        ' in ' + str(expression) + ' are not known numpy '
+                        'functions.')
+    return expression
+
+def cse_expressions(expressions):
+    """
+    Common subexpression elimination of a list of sympy expressions
+
+    Parameters
+    -----------
+    expressions : list
+        sympy expressions (or numbers) which are evaluated in the same
+        function
+
+    Returns
+    --------
+    replacements : list
+        (temporary symbol, expression) tuples to evaluate in this order
+    reduced : list
+        the expressions written in terms of the temporary symbols
+    """
+    expressions = [numpy_expression(expression)
+                   for expression in expressions]
+    return sympy.cse(expressions, symbols=sympy.numbered_symbols('_cse'))
+
+def write_cse_lines(defstr, replacements):
+    """
+    Write the temporary variables of the common subexpression elimination
+
+    Parameters
+    -----------
+    defstr : str
+        str containing the definition to solve in model
+    replacements : list
+        (temporary symbol, expression) tuples as returned by cse_expressions
+    """
+    for symbol, expression in replacements:
+        defstr += '    {0} = {1}\n'.format(symbol,
+                                           replace_numpy_fun(str(expression)))
+    return defstr
+
 def write_ode_lines(defstr, ode_right_side):
     """
     Based on the model equations of the ode-part model, the equations are
@@ -309,6 +581,26 @@ def write_derivative_return(defstr, ode_variables):
     defstr += '    return [' + ', '.join(ode_variables) + ']'
     return defstr
 
+def write_ensemble_return(defstr, ode_variables):
+    """
+    Based on the sequence of the variables in the variables dict, the
+    derivatives of all ensemble members are returned as one flat vector
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    ode_variables : list
+        variable names (!sequence is important)
+    """
+    # Derivatives which do not depend on the states need to be broadcasted
+    defstr += '    ensemble_zeros = np.zeros(odes.shape[0])\n'
+    ode_variables = ["d" + variable + " + ensemble_zeros"
+                     for variable in ode_variables]
+    defstr += ('    return np.array([' + ', '.join(ode_variables) +
+               ']).T.ravel()')
+    return defstr
+
 def write_non_derivative_return(defstr, algebraic_variables):
     """
     Based on the sequence of the variables in the variables dict,
@@ -339,10 +631,11 @@ def generate_ode_derivative_definition(model):
     '''
     modelstr = 'def fun_ode(odes, t, parameters, *args, **kwargs):\n'
     # Get the parameter values
-    modelstr = write_parameters(modelstr, model.parameters)
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None), 't')
     modelstr = write_whiteline(modelstr)
     # Get the current variable values from the solver
-    modelstr = write_ode_indices(modelstr, model._ordered_var['ode'])
+    modelstr = write_model_ode_indices(modelstr, model)
     modelstr = write_whiteline(modelstr)
 
 #==============================================================================
@@ -352,16 +645,63 @@ def generate_ode_derivative_definition(model):
 #         modelstr = write_whiteline(modelstr)
 #==============================================================================
 
+    if getattr(model, 'use_cse', False):
+        # Algebraic variables are substituted in the ODEs and shared
+        # subexpressions are calculated only once
+        substituted = _substituted_algebraic(
+            model.systemfunctions['algebraic'])
+        ode_expressions = [_substitute_algebraic(expression, substituted)
+                           for expression in
+                           model.systemfunctions['ode'].values()]
+        replacements, reduced = cse_expressions(ode_expressions)
+        modelstr = write_cse_lines(modelstr, replacements)
+        modelstr = write_whiteline(modelstr)
+        modelstr = write_ode_lines(modelstr, OrderedDict(
+            zip(model.systemfunctions['ode'].keys(),
+                [str(expression) for expression in reduced])))
+    else:
+        # Write down necessary algebraic equations (if none, nothing written)
+        modelstr = write_algebraic_lines(modelstr,
+                                         model.systemfunctions['algebraic'])
+        modelstr = write_whiteline(modelstr)
+
+        # Write down the current derivative values
+        modelstr = write_ode_lines(modelstr, model.systemfunctions['ode'])
+    modelstr = write_derivative_return(modelstr, model._ordered_var['ode'])
+    return modelstr
+
+def generate_ode_ensemble_definition(model):
+    '''Write vectorised derivative of model as definition
+
+    The states of all ensemble members are stacked in one vector (member
+    after member) and the parameters are either scalars or arrays with one
+    value for each member. All members are evaluated with array arithmetic,
+    so one ODE solve integrates the whole ensemble.
+
+    Parameters
+    -----------
+    model : biointense.model
+
+    '''
+    modelstr = 'def fun_ode_ensemble(odes, t, parameters, *args, **kwargs):\n'
+    # Get the parameter values
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None), 't')
+    modelstr = write_whiteline(modelstr)
+    # Get the current variable values of all members from the solver
+    modelstr = write_ensemble_indices(modelstr, model._ordered_var['ode'])
+    modelstr = write_whiteline(modelstr)
+
     # Write down necessary algebraic equations (if none, nothing written)
     modelstr = write_algebraic_lines(modelstr, model.systemfunctions['algebraic'])
     modelstr = write_whiteline(modelstr)
 
     # Write down the current derivative values
     modelstr = write_ode_lines(modelstr, model.systemfunctions['ode'])
-    modelstr = write_derivative_return(modelstr, model._ordered_var['ode'])
+    modelstr = write_ensemble_return(modelstr, model._ordered_var['ode'])
     return modelstr
 
-def generate_non_derivative_part_definition(model):
+def generate_non_derivative_part_definition(model, variables=None):
     '''Write derivative of model as definition in file
 
     Writes a file with a derivative definition to run the model and
@@ -370,14 +710,27 @@ def generate_non_derivative_part_definition(model):
     Parameters
     -----------
     model : biointense.model
+    variables : list|None
+        If given, the definition (fun_alg_voi) only calculates and returns
+        these algebraic variables and the ones they depend on, see
+        get_algebraic_dependencies. Default all algebraic variables (fun_alg).
 
     '''
-    modelstr = 'def fun_alg(independent, parameters, *args, **kwargs):\n'
+    algebraic = model.systemfunctions['algebraic']
+    if variables is None:
+        variables = model._ordered_var['algebraic']
+        modelstr = 'def fun_alg(independent, parameters, *args, **kwargs):\n'
+    else:
+        algebraic = get_algebraic_dependencies(algebraic, variables)
+        modelstr = ('def fun_alg_voi(independent, parameters, *args, '
+                    '**kwargs):\n')
     # Get independent
     modelstr = write_independent(modelstr, model.independent)
     modelstr = write_whiteline(modelstr)
     # Get the parameter values
-    modelstr = write_parameters(modelstr, model.parameters)
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None),
+                            model._independent_names[0])
     modelstr = write_whiteline(modelstr)
 
     # Put the variables in a separate array
@@ -392,11 +745,66 @@ def generate_non_derivative_part_definition(model):
 #         modelstr = write_whiteline(modelstr)
 #
 #==============================================================================
+    if getattr(model, 'use_cse', False):
+        substituted = _substituted_algebraic(algebraic)
+        replacements, reduced = cse_expressions(substituted.values())
+        modelstr = write_cse_lines(modelstr, replacements)
+        modelstr = write_whiteline(modelstr)
+        for varname, expression in zip(substituted.keys(), reduced):
+            modelstr += '    {0} = {1} + np.zeros(len({2}))\n'.format(
+                varname, replace_numpy_fun(str(expression)),
+                model._independent_names[0])
+    else:
+        # Write down the equation of algebraic
+        modelstr = write_algebraic_solve(modelstr, algebraic,
+                                         model._independent_names[0])
+    modelstr = write_whiteline(modelstr)
+
+    modelstr = write_non_derivative_return(modelstr, variables)
+    return modelstr
+
+def generate_non_derivative_batch_definition(model):
+    '''Write broadcasting version of the algebraic part as definition
+
+    Each parameter is passed as a column vector (one row per parameter set),
+    whereas the independent values are passed as 1D arrays. The values of
+    the ODE variables, if any, are passed as ode_values with shape (number
+    of parameter sets, number of independent values, number of ODE
+    variables). As such, all parameter sets are evaluated at once and the
+    function returns an array with shape (number of parameter sets, number
+    of independent values, number of algebraic variables).
+
+    Parameters
+    -----------
+    model : biointense.model
+
+    '''
+    modelstr = 'def fun_alg_batch(independent, parameters, *args, **kwargs):\n'
+    # Get independent
+    modelstr = write_independent(modelstr, model.independent)
+    modelstr = write_whiteline(modelstr)
+    # Get the parameter values
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None),
+                            model._independent_names[0])
+    modelstr = write_whiteline(modelstr)
+
+    # Put the variables of each parameter set in a separate array
+    if len(model._ordered_var.get('ode', [])):
+        modelstr = write_array_extraction(modelstr, model._ordered_var['ode'],
+                                          batch=True)
+        modelstr = write_whiteline(modelstr)
+
+    modelstr += ("    batch_shape = (kwargs.get('batch_len'), "
+                 "len({0}))\n".format(model._independent_names[0]))
+    modelstr = write_whiteline(modelstr)
+
     # Write down the equation of algebraic
-    modelstr = write_algebraic_solve(modelstr,
-                                     model.systemfunctions['algebraic'],
-                                     model._independent_names[0])
+    modelstr = write_algebraic_batch(modelstr,
+                                     model.systemfunctions['algebraic'])
     modelstr = write_whiteline(modelstr)
 
-    modelstr = write_non_derivative_return(modelstr, model._ordered_var['algebraic'])
-    return modelstr
\ No newline at end of file
+    modelstr += ('    nonder = np.dstack([' +
+                 ', '.join(model._ordered_var['algebraic']) + '])\n')
+    modelstr += '    return nonder'
+    return modelstr
@@ -11,6 +11,7 @@ import itertools
 from copy import deepcopy
 
 from pyideas.optimisation import _BaseOptimisation
+from pyideas.solver import record_solve_stats
 
 
 def A_criterion(FIM):
@@ -174,6 +175,7 @@ class BaseOED(_BaseOptimisation):
 
         return OED_CRITERIA[obj_crit](FIM)
 
+    @record_solve_stats('inspyred_optimize')
     def inspyred_optimize(self, criterion='D', prng=None, approach='PSO',
                           initial_parset=None, pop_size=16, max_eval=256,
                           **kwargs):
@@ -279,6 +281,7 @@ class BaseOED(_BaseOptimisation):
         return (initial_cond, initial_list, parameters, parameter_list, index,
                 names)
 
+    @record_solve_stats('brute_modeloutput')
     def brute_modeloutput(self, step_dict):
         r"""
         Examples
@@ -310,6 +313,7 @@ class BaseOED(_BaseOptimisation):
 
         return pd.DataFrame(modeloutput, index=index, columns=output_var)
 
+    @record_solve_stats('brute_oed')
     def brute_oed(self, step_dict, number_of_samples, criterion='D',
                   replacement=True):
         r"""
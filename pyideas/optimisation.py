@@ -19,6 +19,8 @@ except:
 from parameterdistribution import ModPar
 from pyideas.modelbase import BaseModel
 from pyideas.model import Model
+from pyideas.sensitivity import DirectLocalSensitivity
+from pyideas.solver import record_solve_stats
 from time import time
 from random import Random
 
@@ -395,6 +397,8 @@ class ParameterOptimisation(_BaseOptimisation):
         self._minvalues = None
         self._maxvalues = None
 
+        self._adjoint_sensitivity = None
+
     def _set_independent(self):
         """
 
@@ -418,14 +422,24 @@ class ParameterOptimisation(_BaseOptimisation):
 
         self.model.independent = independent
 
+    @record_solve_stats('local_optimize')
     def local_optimize(self, pardict=None, obj_crit='wsse',
                        method='Nelder-Mead', *args, **kwargs):
         '''
         Wrapper for scipy.optimize.minimize
+
+        With jac='adjoint', the gradient of the objective function is
+        calculated by the adjoint method (see get_objective_gradient), e.g.
+        for method='BFGS' or 'L-BFGS-B'.
         '''
         def inner_obj_fun(parray=None):
             return self._obj_fun(obj_crit, parray=parray)
 
+        if kwargs.get('jac') == 'adjoint':
+            def inner_obj_gradient(parray=None):
+                return self._obj_fun_gradient(obj_crit, parray=parray)
+            kwargs['jac'] = inner_obj_gradient
+
         if pardict is None:
             pardict = self.model.parameters.copy()
 
@@ -438,6 +452,7 @@ class ParameterOptimisation(_BaseOptimisation):
 
         return optimize_info
 
+    @record_solve_stats('basinhopping')
     def basinhopping(self, pardict=None, obj_crit='wsse', *args, **kwargs):
         '''
         Wrapper for scipy.optimize.minimize
@@ -471,6 +486,68 @@ class ParameterOptimisation(_BaseOptimisation):
 
         return obj_val
 
+    def _obj_fun_gradient(self, obj_crit, parray=None):
+        """
+        Gradient of the objective function to the degrees of freedom, by the
+        adjoint method
+        """
+        if obj_crit not in OBJECTIVE_FUNCS:
+            raise Exception("The objective function '" + obj_crit + "' is "
+                            "not known, please choose 'wsse' or 'sse'.")
+        if self._dof_len[2]:
+            raise Exception('The adjoint gradient is not available for the '
+                            'independent values as degrees of freedom.')
+
+        model_output = self._run_model(dof_array=parray)
+        residuals = model_output - self.measurements._data
+        if obj_crit == 'wsse':
+            weights = 1./np.asarray(self.measurements.meas_uncertainty)
+        else:
+            weights = 1.
+
+        if self._adjoint_sensitivity is None:
+            self._adjoint_sensitivity = DirectLocalSensitivity(
+                self.model, parameters=self._dof_ordered['parameters'])
+        parameter_gradient, initial_gradient = \
+            self._adjoint_sensitivity.get_adjoint_gradient(
+                2*weights*residuals)
+
+        gradient = list(parameter_gradient)
+        for var in self._dof_ordered['initial']:
+            index = self.model._ordered_var['ode'].index(var)
+            gradient.append(initial_gradient[index])
+
+        return np.array(gradient)
+
+    def get_objective_gradient(self, pardict=None, obj_crit='wsse'):
+        """
+        Gradient of the objective function to the degrees of freedom
+        (parameters and initial conditions), see
+        DirectLocalSensitivity.get_adjoint_gradient. The adjoint ODEs are
+        integrated once, so the cost hardly depends on the number of
+        degrees of freedom.
+
+        Parameters
+        -----------
+        pardict : dict|None
+            Values of the degrees of freedom, default the current values of
+            the model.
+        obj_crit : 'wsse'|'sse'
+            Objective function, see OBJECTIVE_FUNCS.
+
+        Returns
+        --------
+        gradient : pandas.Series
+            Derivative of the objective function to each degree of freedom.
+        """
+        parray = None
+        if pardict is not None:
+            parray = self._dof_dict_to_array(pardict)
+
+        return pd.Series(self._obj_fun_gradient(obj_crit, parray=parray),
+                         index=self.dof)
+
+    @record_solve_stats('inspyred_optimize')
     def inspyred_optimize(self, obj_crit='wsse', prng=None, approach='PSO',
                           initial_parset=None, add_plot=True, pop_size=16,
                           max_eval=256, **kwargs):
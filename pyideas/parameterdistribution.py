@@ -10,6 +10,7 @@ import numpy as np
 
 #from pyFUSE.distributions import *
 from distributions import *
+from distributions import _generator
 
 class ModPar(object):
     """
@@ -140,7 +141,7 @@ class ModPar(object):
         pt3 = 'Min/Max values: '+str(self.min)+' / '+str(self.max)
         return pt1+pt2+pt3
 
-    def MCSample(self, nruns):
+    def MCSample(self, nruns, random_state=None):
         '''
         Give a sample of nMC samples from the par distribution
 
@@ -148,6 +149,8 @@ class ModPar(object):
         ----------
         nruns: int
             number of Monte Carlo samples to take
+        random_state: numpy.random.RandomState
+            generator to sample from, default the global numpy generator
 
         Returns
         --------
@@ -156,20 +159,24 @@ class ModPar(object):
 
         '''
         if self.pardistribution == 'randomUniform':
-            return randomUniform(left=self.min, right=self.max, rnsize=nruns)
+            return randomUniform(left=self.min, right=self.max, rnsize=nruns,
+                                 random_state=random_state)
 #        if self.pardistribution =='discreteUniform':
 #            return randomUniform(left=self.min,right=self.max,rnsize=nruns)
         elif self.pardistribution == 'randomTriangular':
             return randomTriangular(left=self.min, mode=self.mode,
-                                    right=self.max, rnsize=nruns)
+                                    right=self.max, rnsize=nruns,
+                                    random_state=random_state)
         elif self.pardistribution == 'randomTrapezoidal':
             return randomTrapezoidal(left=self.min, mode1=self.mode1,
                                      mode2=self.mode2, right=self.max,
-                                     rnsize=nruns)
+                                     rnsize=nruns, random_state=random_state)
         elif self.pardistribution == 'randomNormal':
-            return randomNormal(mu=self.mu, sigma=self.sigma, rnsize=nruns)
+            return randomNormal(mu=self.mu, sigma=self.sigma, rnsize=nruns,
+                                random_state=random_state)
         elif self.pardistribution == 'randomLogNormal':
-            return randomLogNormal(mu=self.mu, sigma=self.sigma, rnsize=nruns)
+            return randomLogNormal(mu=self.mu, sigma=self.sigma, rnsize=nruns,
+                                   random_state=random_state)
 
     def aValue(self):
         '''
@@ -209,7 +216,7 @@ class ModPar(object):
         else:
             return fig
 
-    def LatinH(self,nruns):
+    def LatinH(self,nruns,random_state=None):
         '''
         Return a sample of nMC samples from the par distribution
         with Latin Hypercube sampling (always randomUniform)
@@ -218,30 +225,39 @@ class ModPar(object):
         -----------
         nruns: int
             number of Latin HYpercube samples to take
+        random_state: numpy.random.RandomState
+            generator to sample from, default the random module
 
         '''
         if not self.pardistribution =='randomUniform':
             raise Exception('Latin hypercube only supported for uniform distribution')
 
-        pranges=[self.name]
-        low=self.min
-        high=self.max
-        delta=(high-low)/float(nruns)
-        for j in range(0,nruns):
-            pranges.append(random.uniform(low+j*delta,low+(j+1)*delta))
-
-        s=range(0,nruns)
-        result=[]
-        for i in range(0,nruns):
-            a = random.sample(s,1)[0]
-            result.append(a)
-            s.remove(a)
-
-        sample=[]
-        for j in range(0,len(result)):
-            sample.append(pranges[result[j]+1])
-
-        return np.array(sample)
+        if random_state is None:
+            pranges=[self.name]
+            low=self.min
+            high=self.max
+            delta=(high-low)/float(nruns)
+            for j in range(0,nruns):
+                pranges.append(random.uniform(low+j*delta,low+(j+1)*delta))
+
+            s=range(0,nruns)
+            result=[]
+            for i in range(0,nruns):
+                a = random.sample(s,1)[0]
+                result.append(a)
+                s.remove(a)
+
+            sample=[]
+            for j in range(0,len(result)):
+                sample.append(pranges[result[j]+1])
+
+            return np.array(sample)
+
+        # one value in each of the nruns strata, in random order
+        delta=(self.max-self.min)/float(nruns)
+        strata=self.min+(np.arange(nruns)+random_state.uniform(size=nruns))*delta
+
+        return random_state.permutation(strata)
 
 
 def reScale(arr,vmin,vmax):
@@ -10,12 +10,26 @@ import pandas as pd
 from collections import OrderedDict
 
 import warnings
+import threading
+from time import time
+from functools import partial, wraps
+from contextlib import contextmanager
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
 
 import matplotlib.pyplot as plt
 from copy import deepcopy
+from scipy.integrate import solve_ivp
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse import csc_matrix
+from scipy.sparse.linalg import splu
 from pyideas.model import _BiointenseModel
+from pyideas.cache import load_kernels
+from pyideas.parameterdistribution import ModPar
+from pyideas.distributions import _generator
 import pyideas.sensitivitydefinition as sensdef
-from pyideas.solver import OdeSolver, AlgebraicSolver
+from pyideas.solver import (OdeSolver, AlgebraicSolver, SolverStats,
+                            record_solve_stats)
 
 from itertools import product
 
@@ -55,6 +69,142 @@ SENS_QUALITY = {'SSE': _get_sse,
                 'SRE': _get_sre,
                 'RATIO': _get_ratio}
 
+# Relative imaginary step of the complex procedure of
+# NumericalLocalSensitivity, without subtractive cancellation it can be far
+# below the machine precision
+COMPLEX_STEP = 1e-20
+
+# Fraction of the larger part of the bracket of a golden section step
+GOLDEN_SECTION = (3 - np.sqrt(5))/2
+
+# Pools for the executor option of NumericalLocalSensitivity
+SENS_EXECUTORS = {'thread': ThreadPool, 'process': Pool}
+
+# Copy of the model of each worker (thread or process) of the pools of
+# SENS_EXECUTORS, see _init_worker
+_WORKER = threading.local()
+
+
+def _init_worker(model):
+    """
+    Initializer of the workers of the pools of SENS_EXECUTORS: each worker
+    keeps its own copy of the model for all its runs.
+    """
+    _WORKER.model = deepcopy(model)
+
+
+@contextmanager
+def _worker_pool(sensitivity):
+    """
+    Open the pool of the executor of the sensitivity object (as its _pool)
+    for the duration of the context. Nested contexts reuse the pool, so a
+    single pool is used for all runs of a top-level call.
+    """
+    if sensitivity.executor not in SENS_EXECUTORS or \
+            sensitivity._pool is not None:
+        yield
+        return
+
+    sensitivity._pool = SENS_EXECUTORS[sensitivity.executor](
+        sensitivity.n_workers, _init_worker, (sensitivity.model,))
+    try:
+        yield
+    finally:
+        sensitivity._pool.terminate()
+        sensitivity._pool = None
+
+
+def _pooled(method):
+    """
+    Decorator for the top-level methods using the executor, which share one
+    pool for all their runs, see _worker_pool.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with _worker_pool(self):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _run_perturbed(task):
+    """
+    Run a copy of the model with the given parameter values, returns the
+    output and the statistics of the solve. Without model in the task, the
+    copy of the worker is used. Defined at module level, so it can be passed
+    to a process pool.
+    """
+    model, parameters = task
+    if model is None:
+        model = _WORKER.model
+    model.parameters = parameters
+    output = model._run()
+    return output, model.last_solve_stats
+
+
+def _run_batch(task):
+    """
+    Evaluate a copy of the model for the rows of a parameter matrix, returns
+    the output and the statistics of the solves. Without model in the task,
+    the copy of the worker is used. Defined at module level, so it can be
+    passed to a process pool.
+    """
+    model, parameters, param_matrix = task
+    if model is None:
+        model = _WORKER.model
+    model.reset_solve_stats()
+    output = GlobalSensitivity._evaluate_model(model, parameters,
+                                               param_matrix)
+    return output, model.total_solve_stats
+
+
+def _golden_section_points(start, lower, upper, step=1., tolerance=0.5):
+    """
+    Generator of the points of a minimum search in [lower, upper], the
+    function values are sent back to the generator. From start, the search
+    walks downhill with the given step until the minimum is bracketed, the
+    bracket is then narrowed by golden section steps down to the tolerance.
+    Points are not repeated.
+    """
+    values = {}
+
+    b = start
+    a = min(start + step, upper)
+    for point in [b, a]:
+        if point not in values:
+            values[point] = yield point
+    if values[a] < values[b]:
+        a, b = b, a
+    direction = np.sign(b - a) or -1.
+
+    # Walk downhill, away from a
+    c = b
+    while True:
+        c = min(max(b + direction*step, lower), upper)
+        if c == b:
+            break
+        values[c] = yield c
+        if not values[c] < values[b]:
+            break
+        a, b = b, c
+
+    low, high = min(a, b, c), max(a, b, c)
+    while high - low > tolerance:
+        if b - low > high - b:
+            point = b - GOLDEN_SECTION*(b - low)
+        else:
+            point = b + GOLDEN_SECTION*(high - b)
+        values[point] = yield point
+        if values[point] < values[b]:
+            if point < b:
+                high = b
+            else:
+                low = b
+            b = point
+        elif point < b:
+            low = point
+        else:
+            high = point
+
 
 #==============================================================================
 # class Sensitivity(object):
@@ -162,8 +312,11 @@ class LocalSensitivity(object):
         return local_sens
 
     def _rescale_sensitivity(self, sens_array, scaling, cutoff=1e-16,
-                             cutoff_replacement=1e-16):
+                             cutoff_replacement=1e-16, model_output=None):
         """
+        Scale the absolute sensitivities, the total relative sensitivity
+        (TRS) uses the model_output of the nominal parameter values, which
+        is calculated when not given.
         """
         variables = self._model.variables_of_interest
         parameter_len = len(self._parameter_names)
@@ -183,8 +336,10 @@ class LocalSensitivity(object):
             sens_array *= par_values
 
             if scaling == 'TRS':
-                model_run = self._model._run().reshape([self._model._independent_len,
-                                                        -1, 1])
+                if model_output is None:
+                    model_output = self._model._run()
+                model_run = np.array(model_output).reshape(
+                    [self._model._independent_len, -1, 1])
                 model_run = np.repeat(model_run, parameter_len, axis=-1)
 
                 model_run[model_run < cutoff] = cutoff_replacement
@@ -201,6 +356,23 @@ class NumericalLocalSensitivity(LocalSensitivity):
     Parameters
     -----------
     model : Model|AlgebraicModel
+    parameters : list
+        Parameters to calculate the sensitivities for, default all
+    procedure : 'central'|'forward'|'backward'|'complex'
+        Finite difference or complex-step procedure, see procedure.
+    executor : None|'thread'|'process'|object
+        By default (None), the perturbed model runs are done one after the
+        other by changing the parameters of the model. With 'thread' or
+        'process', all perturbed runs are done concurrently by a pool of
+        threads (e.g. for models calling slow external code which releases
+        the GIL) or processes, each with its own copy of the model. The pool
+        is created once for each call of get_sensitivity,
+        autotune_perturbation,... Any long-lived object with a map method
+        (e.g. a multiprocessing Pool) can be passed as well, each run then
+        gets a copy of the model.
+    n_workers : int|None
+        Number of threads or processes of the pool, default the number of
+        CPUs.
 
 
     Examples
@@ -219,7 +391,8 @@ class NumericalLocalSensitivity(LocalSensitivity):
     >>> M1sens_num = NumericalLocalSensitivity(M1, parameters=['Km', 'Vmax'])
     >>> numsens = M1sens_num.get_sensitivity(method='AS')
     """
-    def __init__(self, model, parameters=None, procedure="central"):
+    def __init__(self, model, parameters=None, procedure="central",
+                 executor=None, n_workers=None):
         """
         """
         if parameters is None:
@@ -230,6 +403,14 @@ class NumericalLocalSensitivity(LocalSensitivity):
 
         self._procedure = None
         self.procedure = procedure
+
+        if executor is not None and executor not in SENS_EXECUTORS and \
+                not hasattr(executor, 'map'):
+            raise Exception("The executor should be None, 'thread', "
+                            "'process' or an object with a map method.")
+        self.executor = executor
+        self.n_workers = n_workers
+        self._pool = None
 #==============================================================================
 #         self._initiate_par()
 #         self._initiate_var()
@@ -244,12 +425,12 @@ class NumericalLocalSensitivity(LocalSensitivity):
     @procedure.setter
     def procedure(self, procedure):
         r"""
-        Select which procedure (central, forward, backward) should be used to
-        calculate the numerical local sensitivity.
+        Select which procedure (central, forward, backward, complex) should be
+        used to calculate the numerical local sensitivity.
 
         Parameters
         -----------
-        procedure : 'forward'|'central'|'backward'
+        procedure : 'forward'|'central'|'backward'|'complex'
             Three different procedures are available, the central procedure
             allows to evaluate the numerical accuracy of the sensitivity. This
             is not the case for the forward and backward procedure. However,
@@ -268,10 +449,22 @@ class NumericalLocalSensitivity(LocalSensitivity):
 
             .. math:: \frac{\partial y_i(t, \theta_j)}{\partial \theta_j} = \frac{y(t, \theta_j) - y(t, \theta_j- \Delta\theta_j)}{\Delta\theta_j}
 
+            *Complex-step derivative
+
+            .. math:: \frac{\partial y_i(t, \theta_j)}{\partial \theta_j} = \frac{\mathrm{Im}\left(y(t, \theta_j + i h\theta_j)\right)}{h\theta_j}
+
+            The complex procedure needs a single model run for each
+            parameter and, as there is no subtraction of model outputs, it
+            is accurate up to the machine precision with a tiny step h
+            (COMPLEX_STEP, the perturbation is not used). The model output
+            should be an analytic function of the parameters, computed
+            with complex arithmetic: this holds for the generated models,
+            but not for e.g. abs, comparisons or external code.
+
         """
-        if procedure not in ["forward", "backward", "central"]:
+        if procedure not in ["forward", "backward", "central", "complex"]:
             raise Exception("Procedure is not known, please choose 'forward', "
-                            "'backward' or 'central'.")
+                            "'backward', 'central' or 'complex'.")
         self._procedure = procedure
 
     @property
@@ -342,6 +535,57 @@ class NumericalLocalSensitivity(LocalSensitivity):
 
         return model_output
 
+    def _step(self, parameter):
+        """
+        Relative perturbation of the parameter, imaginary for the complex
+        procedure
+        """
+        if self.procedure == "complex":
+            return 1j*COMPLEX_STEP
+        return self._parameter_perturb[parameter]
+
+    def _perturbation_runs(self):
+        """
+        (parameter, relative perturbation) of the perturbed model runs
+        needed by the procedure
+        """
+        signs = {'central': [1, -1], 'forward': [1], 'backward': [-1],
+                 'complex': [1]}[self.procedure]
+        return [(par, sign*self._step(par))
+                for par in self._parameter_names for sign in signs]
+
+    def _perturbed_outputs(self, runs):
+        """
+        Model output of each of the perturbed runs, see executor
+        """
+        if self.executor is None:
+            return [self._model_output_pert(par, perturbation)
+                    for par, perturbation in runs]
+
+        if self.executor in SENS_EXECUTORS:
+            # The copies of the workers are reused for all runs, so each run
+            # sets all parameters
+            tasks = []
+            for par, perturbation in runs:
+                parameters = self.model.parameters.copy()
+                parameters[par] *= 1 + perturbation
+                tasks.append((None, parameters))
+            with _worker_pool(self):
+                results = self._pool.map(_run_perturbed, tasks)
+        else:
+            tasks = [(deepcopy(self.model),
+                      {par: self.model.parameters[par]*(1 + perturbation)})
+                     for par, perturbation in runs]
+            results = list(self.executor.map(_run_perturbed, tasks))
+
+        # The solves of the copies are part of the solves of the model
+        outputs = []
+        for output, stats in results:
+            if stats is not None:
+                self.model._record_solve_stats(stats)
+            outputs.append(output)
+        return outputs
+
     @staticmethod
     def _calc_sens(output_forw, output_back, parameter, perturbation):
         """
@@ -351,14 +595,20 @@ class NumericalLocalSensitivity(LocalSensitivity):
 
         return num_sens
 
-    def _get_num_sensitivity(self, output_std, parameter, perturbation):
+    def _get_num_sensitivity(self, output_std, parameter, perturbation,
+                             output_forw=None, output_back=None):
         """
+        Finite difference sensitivity to the parameter, the outputs of the
+        perturbed runs are calculated when not given.
         """
         par_value = self.model.parameters[parameter]
 
         if self.procedure == "central":
-            output_forw = self._model_output_pert(parameter, perturbation)
-            output_back = self._model_output_pert(parameter, -perturbation)
+            if output_forw is None:
+                output_forw = self._model_output_pert(parameter, perturbation)
+            if output_back is None:
+                output_back = self._model_output_pert(parameter,
+                                                      -perturbation)
 #==============================================================================
 #             par_number = self._par_order[parameter]
 #             self._sens_forw[:, :, par_number] = \
@@ -372,23 +622,33 @@ class NumericalLocalSensitivity(LocalSensitivity):
                                         par_value, 2*perturbation)
             output = cent_sens
         elif self.procedure == "forward":
-            output_forw = self._model_output_pert(parameter, perturbation)
+            if output_forw is None:
+                output_forw = self._model_output_pert(parameter, perturbation)
 
             forw_sens = self._calc_sens(output_forw, output_std,
                                         par_value, perturbation)
             output = forw_sens
         elif self.procedure == "backward":
-            output_back = self._model_output_pert(parameter, -perturbation)
+            if output_back is None:
+                output_back = self._model_output_pert(parameter,
+                                                      -perturbation)
 
             back_sens = self._calc_sens(output_std, output_back,
                                         par_value, perturbation)
             output = back_sens
+        elif self.procedure == "complex":
+            if output_forw is None:
+                output_forw = self._model_output_pert(parameter, perturbation)
+
+            output = np.imag(output_forw)/(np.imag(perturbation)*par_value)
         else:
             raise Exception('Type of perturbation is not known, perturbation'
-                            'should be central, forward, or backward')
+                            'should be central, forward, backward or complex')
 
         return output
 
+    @record_solve_stats('sensitivity')
+    @_pooled
     def _get_sensitivity(self, method='AS'):
         r"""
         Get numerical local sensitivity for the different parameters and
@@ -417,19 +677,176 @@ class NumericalLocalSensitivity(LocalSensitivity):
 
 
         """
-        output_std = self.model._run()
+        # The complex procedure does not need the nominal output
+        output_std = None
+        if self.procedure != "complex":
+            output_std = self.model._run()
         num_sens = np.empty([len(self.model._independent_values.values()[0]),
                              len(self.model.variables_of_interest),
                              len(self._parameter_names)])
 
+        runs = self._perturbation_runs()
+        outputs = dict(zip(runs, self._perturbed_outputs(runs)))
         for i, par in enumerate(self._parameter_names):
+            perturbation = self._step(par)
             num_sens[:, :, i] = self._get_num_sensitivity(
-                                output_std, par, self._parameter_perturb[par])
+                output_std, par, perturbation,
+                output_forw=outputs.get((par, perturbation)),
+                output_back=outputs.get((par, -perturbation)))
 
-        num_sens = self._rescale_sensitivity(num_sens, method)
+        if output_std is None and outputs:
+            # Real part of a complex-step run
+            output_std = np.real(outputs.values()[0])
+        num_sens = self._rescale_sensitivity(num_sens, method,
+                                             model_output=output_std)
 
         return num_sens
 
+    def _perturbed_sensitivities(self, perturbations, output_std,
+                                 method="AS"):
+        """
+        Forward and backward sensitivities for the relative perturbations
+        (dict) of the parameters, from a single +perturbation and
+        -perturbation run of each parameter and the nominal output_std. The
+        central sensitivity is their mean.
+        """
+        runs = [(par, sign*perturbations[par])
+                for par in self._parameter_names for sign in [1, -1]]
+        outputs = dict(zip(runs, self._perturbed_outputs(runs)))
+
+        shape = [len(self.model._independent_values.values()[0]),
+                 len(self.model.variables_of_interest),
+                 len(self._parameter_names)]
+        sens_forw = np.empty(shape)
+        sens_back = np.empty(shape)
+        for i, par in enumerate(self._parameter_names):
+            par_value = self.model.parameters[par]
+            perturbation = perturbations[par]
+            sens_forw[:, :, i] = self._calc_sens(outputs[(par, perturbation)],
+                                                 output_std, par_value,
+                                                 perturbation)
+            sens_back[:, :, i] = self._calc_sens(output_std,
+                                                 outputs[(par, -perturbation)],
+                                                 par_value, perturbation)
+
+        return (self._rescale_sensitivity(sens_forw, method,
+                                          model_output=output_std),
+                self._rescale_sensitivity(sens_back, method,
+                                          model_output=output_std))
+
+    def _perturbation_quality(self, parameter, perturbation, outputs,
+                              output_std, criterion):
+        """
+        Criterion (see SENS_QUALITY) of the forward and backward sensitivity
+        to the parameter, summed over the variables of interest. Variables
+        which do not depend on the parameter are left out.
+        """
+        par_value = self.model.parameters[parameter]
+        sens_forw = self._calc_sens(outputs[(parameter, perturbation)],
+                                    output_std, par_value, perturbation)
+        sens_back = self._calc_sens(output_std,
+                                    outputs[(parameter, -perturbation)],
+                                    par_value, perturbation)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            quality = [SENS_QUALITY[criterion](sens_forw[:, [i]],
+                                               sens_back[:, [i]])
+                       for i in range(sens_forw.shape[1])]
+        quality = np.nansum(quality)
+        return quality if np.isfinite(quality) else np.inf
+
+    @record_solve_stats('autotune_perturbation')
+    @_pooled
+    def autotune_perturbation(self, criterion='SRE', bounds=(1e-9, 1e-2),
+                              tolerance=0.5):
+        '''Search the perturbation of each parameter with the best quality of
+        the sensitivity, see get_sensitivity_accuracy
+
+        Parameters
+        -----------
+        criterion : 'SSE'|'SAE'|'MRE'|'SRE'|'RATIO'
+            Criterion of the discrepancy between the forward and backward
+            sensitivity, which is minimised for each of the parameters.
+        bounds : tuple
+            Smallest and largest perturbation factor.
+        tolerance : float
+            The search of a parameter stops when its perturbation is known
+            within this number of decades.
+
+        Returns
+        --------
+        perturbation : OrderedDict
+            The tuned perturbation factor of each parameter, which is set as
+            the perturbation.
+
+        Notes
+        ------
+        For each parameter, the search starts from its current perturbation
+        and takes steps of a decade (in log scale) until the minimum of the
+        criterion is bracketed, the bracket is then narrowed by golden
+        section steps. The nominal model run is shared by all parameters and
+        each evaluated perturbation needs a forward and a backward run. The
+        runs of all parameters in each iteration are done together, so
+        they run concurrently with an executor.
+        '''
+        if criterion not in SENS_QUALITY:
+            raise Exception("Criterion '" + criterion + "' is not a valid "
+                            "criterion, please select one of following "
+                            "criteria: SSE, SAE, MRE, SRE, RATIO")
+        lower, upper = np.log10(bounds)
+
+        output_std = self.model._run()
+        searches = OrderedDict()
+        pending = OrderedDict()
+        for par in self._parameter_names:
+            start = np.log10(self._parameter_perturb[par])
+            searches[par] = _golden_section_points(
+                min(max(start, lower), upper), lower, upper,
+                tolerance=tolerance)
+            pending[par] = next(searches[par])
+
+        quality = {par: {} for par in self._parameter_names}
+        while pending:
+            runs = [(par, sign*10**point) for par, point in pending.items()
+                    for sign in [1, -1]]
+            outputs = dict(zip(runs, self._perturbed_outputs(runs)))
+
+            searching = OrderedDict()
+            for par, point in pending.items():
+                quality[par][point] = self._perturbation_quality(
+                    par, 10**point, outputs, output_std, criterion)
+                try:
+                    searching[par] = searches[par].send(quality[par][point])
+                except StopIteration:
+                    pass
+            pending = searching
+
+        for par in self._parameter_names:
+            best = min(quality[par], key=quality[par].get)
+            self._parameter_perturb[par] = 10**best
+
+        return self.perturbation
+
+    def _sensitivity_quality(self, sens_forw, sens_back, criterion):
+        """
+        Criterion (see SENS_QUALITY) of the forward and backward
+        sensitivities for each parameter (index) and variable (columns)
+        """
+        if criterion not in SENS_QUALITY:
+            raise Exception("Criterion '" + criterion + "' is not a valid "
+                            "criterion, please select one of following "
+                            "criteria: SSE, SAE, MRE, SRE, RATIO")
+
+        acc_num_LSA = pd.DataFrame(index=self.parameter_names,
+                                   columns=self.model.variables_of_interest,
+                                   dtype=float)
+        for i, var in enumerate(self.model.variables_of_interest):
+            sens_input = (sens_forw[:, i, :], sens_back[:, i, :])
+            acc_num_LSA[var] = SENS_QUALITY[criterion](*sens_input)
+        return acc_num_LSA
+
+    @record_solve_stats('sensitivity_accuracy')
+    @_pooled
     def get_sensitivity_accuracy(self, criterion="SSE", method="AS"):
         '''Quantify the sensitivity calculations quality
 
@@ -456,28 +873,19 @@ class NumericalLocalSensitivity(LocalSensitivity):
             raise Exception('The accuracy of the sensitivity function can only'
                             ' be estimated when using the central local'
                             ' sensitivity!')
+        if criterion not in SENS_QUALITY:
+            raise Exception("Criterion '" + criterion + "' is not a valid "
+                            "criterion, please select one of following "
+                            "criteria: SSE, SAE, MRE, SRE, RATIO")
 
-        dummy_np = np.empty((len(self.parameter_names),
-                             len(self.model.variables_of_interest)))
-        acc_num_LSA = pd.DataFrame(dummy_np, index=self.parameter_names,
-                                   columns=self.model.variables_of_interest)
+        output_std = self.model._run()
+        sens_forw, sens_back = self._perturbed_sensitivities(
+            self._parameter_perturb, output_std, method=method)
 
-        self.procedure = "forward"
-        sens_forw = self._get_sensitivity(method=method)
-        self.procedure = "backward"
-        sens_back = self._get_sensitivity(method=method)
-        self.procedure = "central"
-
-        for i, var in enumerate(self.model.variables_of_interest):
-            sens_input = (sens_forw[:, i, :], sens_back[:, i, :])
-            if criterion in SENS_QUALITY:
-                acc_num_LSA[var] = SENS_QUALITY[criterion](*sens_input)
-            else:
-                raise Exception("Criterion '" + criterion + "' is not a valid "
-                                "criterion, please select one of following "
-                                "criteria: SSE, SAE, MRE, SRE, RATIO")
-        return acc_num_LSA
+        return self._sensitivity_quality(sens_forw, sens_back, criterion)
 
+    @record_solve_stats('quality_num_lsa')
+    @_pooled
     def calc_quality_num_lsa(self, perturbation_factors,
                              criteria=['SSE', 'SAE', 'MRE', 'SRE', 'RATIO'],
                              method="AS"):
@@ -495,6 +903,10 @@ class NumericalLocalSensitivity(LocalSensitivity):
             Sum or Relative Errors (SRE) or the ratio between the forward and
             backward sensitivity (RATIO) or a combination of all of them. [1]_
 
+        The nominal model run is shared by all perturbation factors and all
+        criteria of a factor are derived from the same forward and backward
+        runs. The perturbation of the parameters is not changed.
+
         Returns
         --------
         res : pandas.DataFrame
@@ -520,12 +932,23 @@ class NumericalLocalSensitivity(LocalSensitivity):
                             'measure) or list of strings (multiple quality '
                             'measures)!')
 
+        for crit in criteria:
+            if crit not in SENS_QUALITY:
+                raise Exception("Criterion '" + crit + "' is not a valid "
+                                "criterion, please select one of following "
+                                "criteria: SSE, SAE, MRE, SRE, RATIO")
+
+        # All criteria of a perturbation factor are derived from the same
+        # perturbed runs, the nominal run is shared by all factors
+        output_std = self.model._run()
         res = {crit: {} for (crit) in criteria}
         for pert in perturbation_factors:
-            self.perturbation = pert
+            perturbations = OrderedDict((par, pert)
+                                        for par in self._parameter_names)
+            sens_forw, sens_back = self._perturbed_sensitivities(
+                perturbations, output_std, method=method)
             for crit in criteria:
-                acc = self.get_sensitivity_accuracy(criterion=crit,
-                                                    method=method)
+                acc = self._sensitivity_quality(sens_forw, sens_back, crit)
                 res[crit][pert] = acc.transpose().stack()
 
         for crit in criteria:
@@ -545,7 +968,21 @@ class DirectLocalSensitivity(LocalSensitivity):
     Parameters
     -----------
     model : Model|AlgebraicModel
-
+    parameters : list
+        Parameters to calculate the sensitivities for, default all
+    cse : bool
+        Calculate the common subexpressions of the model equations and the
+        symbolic derivatives only once in the generated functions. Default
+        None follows the use_cse setting of the model.
+    staggered : bool
+        By default, the states and their sensitivities are integrated
+        together, as one system of n_states x (1 + n_parameters) ODEs. With
+        staggered, the states are integrated first and the (linear)
+        sensitivity equations are integrated afterwards along the solution
+        with a single LU factorisation of the state Jacobian for each step,
+        see _get_staggered_ode_sensitivity. For models with many parameters
+        and stiff ODEs, this avoids the implicit solvers approximating the
+        Jacobian of the complete system.
 
     Examples
     ---------
@@ -563,7 +1000,7 @@ class DirectLocalSensitivity(LocalSensitivity):
     >>> M1sens_direct = DirectLocalSensitivity(M1, parameters=['Km', 'Vmax'])
     >>> sens_out = M1sens_direct.get_sensitivity(method='PRS')
     """
-    def __init__(self, model, parameters=None):
+    def __init__(self, model, parameters=None, cse=None, staggered=False):
         """
         """
         if not isinstance(model, _BiointenseModel):
@@ -577,11 +1014,19 @@ class DirectLocalSensitivity(LocalSensitivity):
 
         self._dxdtheta_start = None
         self._dxdtheta_len = 0
+        if cse is None:
+            cse = model.use_cse
+        self.cse = cse
+        self.staggered = staggered
 
         self._fun_alg = None
         self._fun_ode = None
+        self._fun_ode_partials = None
+        self._fun_alg_partials = None
         self._fun_alg_str = None
         self._fun_ode_str = None
+        self._fun_ode_partials_str = None
+        self._fun_alg_partials_str = None
 
         self._generate_sensitivity()
 
@@ -612,9 +1057,16 @@ class DirectLocalSensitivity(LocalSensitivity):
             self._dxdtheta_len = self._dxdtheta_start.size
             self._fun_ode_str =\
                 sensdef.generate_ode_derivative_definition(
-                    self.model, dfdtheta, dfdx, self.parameter_names)
-            exec(self._fun_ode_str)
-            self._fun_ode = fun_ode_lsa
+                    self.model, dfdtheta, dfdx, self.parameter_names,
+                    cse=self.cse)
+            self._fun_ode = load_kernels(
+                {'fun_ode_lsa': self._fun_ode_str})['fun_ode_lsa']
+            self._fun_ode_partials_str = \
+                sensdef.generate_ode_partials_definition(self.model,
+                                                         dfdtheta, dfdx)
+            self._fun_ode_partials = load_kernels(
+                {'fun_ode_partials': self._fun_ode_partials_str}
+            )['fun_ode_partials']
 
         if algvar:
             dgdtheta, dgdx = sensdef.generate_alg_sens(odevar, odefun_ord,
@@ -622,9 +1074,17 @@ class DirectLocalSensitivity(LocalSensitivity):
                                                        self.parameter_names)
             self._fun_alg_str =\
                 sensdef.generate_non_derivative_part_definition(
-                    self.model, dgdtheta, dgdx, self.parameter_names)
-            exec(self._fun_alg_str)
-            self._fun_alg = fun_alg_lsa
+                    self.model, dgdtheta, dgdx, self.parameter_names,
+                    cse=self.cse)
+            self._fun_alg = load_kernels(
+                {'fun_alg_lsa': self._fun_alg_str})['fun_alg_lsa']
+            self._fun_alg_partials_str = \
+                sensdef.generate_alg_partials_definition(
+                    self.model, dgdtheta, dgdx, self.parameter_names,
+                    cse=self.cse)
+            self._fun_alg_partials = load_kernels(
+                {'fun_alg_partials': self._fun_alg_partials_str}
+            )['fun_alg_partials']
 
     def _args_ode_function(self, fun, **kwargs):
         """
@@ -633,14 +1093,20 @@ class DirectLocalSensitivity(LocalSensitivity):
                               for var in self.model._ordered_var['ode']]
         initial_conditions += self._flatten_list(self._dxdtheta_start.tolist())
         args = (fun, initial_conditions,
-                self.model._independent_values, (self.model.parameters,),)
+                self.model._independent_values,
+                self.model._parameter_args(),)
 
         return args
 
     def _get_ode_sensitivity(self, procedure='odeint'):
         """
         """
-        solver = OdeSolver(*self._args_ode_function(self._fun_ode))
+        # The derivatives of the sensitivities are written in a buffer
+        # allocated for this solve only
+        fun_ode = partial(self._fun_ode, dxdtheta_dt=np.zeros(
+            [len(self.model._ordered_var['ode']), len(self.parameter_names)]))
+        solver = OdeSolver(*self._args_ode_function(fun_ode),
+                           inputs=self.model.inputs)
         model_output = solver.solve(procedure=procedure)
         ode_values = model_output[:,:-self._dxdtheta_len]
         model_output = model_output[:,-self._dxdtheta_len:]
@@ -668,6 +1134,106 @@ class DirectLocalSensitivity(LocalSensitivity):
 #==============================================================================
         return ode_values, dxdtheta #model_output#result
 
+    def _trapezoidal_sensitivity(self, independent, segment, partials):
+        """
+        Integrate the sensitivity equations with the trapezoidal rule over
+        the independent values. segment is the index of the segment (see
+        DenseOdeSolution) of each step and partials(k, segment) returns the
+        partial derivatives dfdx and dfdtheta of the ODEs at the k-th
+        independent value, with the arguments of the segment.
+
+        With the sparsity structure of the Jacobian (jac_ode_sparsity), the
+        implicit steps use a sparse LU factorisation, of which the cost
+        scales with the number of nonzero elements instead of the cube of
+        the number of states.
+        """
+        state_len = self._dxdtheta_start.shape[0]
+        identity = np.eye(state_len)
+        sparsity = self.model._solver_jacobian_sparsity()
+        if sparsity is not None:
+            # The structure is set up once, at each step only the values of
+            # the nonzero elements (in the column order of csc) are updated
+            cols, rows = np.nonzero(np.transpose(np.asarray(sparsity) +
+                                                 identity))
+            matrix = csc_matrix((np.ones(len(rows)), (rows, cols)),
+                                shape=identity.shape)
+
+            def sparse(values):
+                matrix.data[:] = values[rows, cols]
+                return matrix
+
+            def factorise(values):
+                return splu(sparse(values)).solve
+
+            def product(dfdx, dxdtheta):
+                return sparse(dfdx).dot(dxdtheta)
+        else:
+            def factorise(values):
+                lu = lu_factor(values)
+                return lambda rhs: lu_solve(lu, rhs)
+            product = np.dot
+
+        dxdtheta = np.empty((len(independent),) +
+                            self._dxdtheta_start.shape)
+        dxdtheta[0] = self._dxdtheta_start
+        for k in range(len(independent) - 1):
+            step = independent[k + 1] - independent[k]
+            dfdx_0, dfdtheta_0 = partials(k, segment[k])
+            dfdx_1, dfdtheta_1 = partials(k + 1, segment[k])
+            # The equations are linear in dxdtheta: one LU factorisation
+            # for the sensitivities to all parameters
+            solve = factorise(identity - step/2*dfdx_1)
+            dxdtheta[k + 1] = solve(
+                dxdtheta[k] + step/2*(product(dfdx_0, dxdtheta[k]) +
+                                      dfdtheta_0 + dfdtheta_1))
+        return dxdtheta
+
+    def _get_staggered_ode_sensitivity(self):
+        """
+        Integrate the states with an integrator providing a continuous
+        extension (see Model.evaluate_at) and the sensitivities along these
+        states with the trapezoidal rule, which is A-stable. The steps of
+        the sensitivities are the steps of the integrator and the
+        independent values, all of them are halved as well and the Richardson
+        extrapolation of both solutions is fourth order accurate.
+        """
+        solution = self.model._dense_ode_solution()
+        independent = np.asarray(self.model._independent_values.values()[0],
+                                 dtype=float)
+
+        coarse = np.union1d(np.asarray(solution.solution.ts), independent)
+        fine = np.empty(2*len(coarse) - 1)
+        fine[::2] = coarse
+        fine[1::2] = (coarse[:-1] + coarse[1:])/2.
+        states = solution(fine)
+        # The breakpoints of the inputs are steps of the integrator, the
+        # partial derivatives at both ends of each step are calculated with
+        # the arguments of the segment containing the step
+        starts = [start for start, args in solution.segments]
+        segment = np.searchsorted(starts, (fine[:-1] + fine[1:])/2.,
+                                  side='right') - 1
+
+        values = {}
+
+        def partials(point, segment):
+            if (point, segment) not in values:
+                values[(point, segment)] = [
+                    np.asarray(value, dtype=float)
+                    for value in self._fun_ode_partials(
+                        states[point], fine[point],
+                        *solution.segments[segment][1])]
+            return values[(point, segment)]
+
+        fine_dxdtheta = self._trapezoidal_sensitivity(fine, segment,
+                                                      partials)
+        coarse_dxdtheta = self._trapezoidal_sensitivity(
+            coarse, segment[::2],
+            lambda point, segment: partials(2*point, segment))
+        dxdtheta = (4*fine_dxdtheta[::2] - coarse_dxdtheta)/3.
+
+        index = np.searchsorted(coarse, independent)
+        return states[::2][index], dxdtheta[index]
+
     def _get_alg_sensitivity(self, ode_values=None, dxdtheta=None):
         """
         """
@@ -700,7 +1266,9 @@ class DirectLocalSensitivity(LocalSensitivity):
         dxdtheta = None
         direct_alg_sens = None
 
-        if self._fun_ode:
+        if self._fun_ode and self.staggered:
+            ode_values, dxdtheta = self._get_staggered_ode_sensitivity()
+        elif self._fun_ode:
             ode_values, dxdtheta = self._get_ode_sensitivity()
 
         if self._fun_alg:
@@ -719,6 +1287,233 @@ class DirectLocalSensitivity(LocalSensitivity):
 
         return self._rescale_sensitivity(direct_sens, method)
 
+    def _output_partials(self, ode_values=None):
+        """
+        Derivatives of the variables of interest to the states (None for
+        models without ODEs) and to the parameters at all independent values
+        """
+        independent_len = self.model._independent_len
+        dydx, dydtheta = [], []
+        if self._fun_alg_partials:
+            solver = AlgebraicSolver(
+                *self.model._args_alg_function(self._fun_alg_partials),
+                ode_values=ode_values)
+            dgdx, dgdtheta = solver._solve_algebraic()
+            dydx.append(dgdx)
+            dydtheta.append(dgdtheta)
+        if self._fun_ode:
+            states_len = ode_values.shape[1]
+            dydx.append(np.tile(np.eye(states_len), (independent_len, 1, 1)))
+            dydtheta.append(np.zeros([independent_len, states_len,
+                                      len(self.parameter_names)]))
+
+        index = self.model._variables_of_interest_index
+        dydtheta = np.concatenate(dydtheta, axis=1)[:, index, :]
+        if not self._fun_ode:
+            return None, dydtheta
+        return np.concatenate(dydx, axis=1)[:, index, :], dydtheta
+
+    def get_adjoint_gradient(self, output_gradient, rtol=1e-8, atol=1e-10):
+        r"""
+        Gradient of an objective function, which is a sum of terms of the
+        variables of interest at each independent value (e.g. the WSSE), to
+        the parameters and the initial conditions. Instead of the
+        sensitivities of all states to all parameters, a single system of
+        adjoint ODEs is integrated backward in time, so the cost hardly
+        depends on the number of parameters.
+
+        For an objective :math:`J = \sum_k \phi_k(x(t_k), \theta)`, the
+        adjoint states :math:`\lambda` are integrated backward from zero with
+
+            .. math:: \frac{d\lambda}{dt} = -\left(\frac{\partial f}{\partial x}\right)^T\lambda
+
+        and jump with :math:`\partial\phi_k/\partial x` at each independent
+        value :math:`t_k`, which gives
+
+            .. math:: \frac{dJ}{d\theta} = \sum_k \frac{\partial \phi_k}{\partial \theta} + \int_{t_0}^{t_N} \lambda^T\frac{\partial f}{\partial \theta}dt, \quad \frac{dJ}{dx_0} = \lambda(t_0)
+
+        Parameters
+        -----------
+        output_gradient : numpy.ndarray
+            Derivative of the objective to each variable of interest
+            (columns) at each independent value (rows), e.g. 2*w*(y - y_meas)
+            for the WSSE.
+        rtol, atol : float
+            Tolerances of the backward integration of the adjoint ODEs.
+
+        Returns
+        --------
+        parameter_gradient : numpy.ndarray
+            Derivative of the objective to each of the parameters.
+        initial_gradient : numpy.ndarray|None
+            Derivative of the objective to the initial condition of each
+            state (in the order of the ODEs), None for algebraic models.
+
+        Notes
+        ------
+        The states are taken from the continuous solution of the ODEs (see
+        Model.evaluate_at).
+        """
+        output_gradient = np.asarray(output_gradient, dtype=float)
+        solution = None
+        ode_values = None
+        if self._fun_ode:
+            independent = np.asarray(
+                self.model._independent_values.values()[0], dtype=float)
+            solution = self.model._dense_ode_solution()
+            ode_values = solution(independent)
+
+        dydx, dydtheta = self._output_partials(ode_values)
+        parameter_gradient = np.einsum('ij,ijk->k', output_gradient, dydtheta)
+        if solution is None:
+            return parameter_gradient, None
+
+        # The jumps of the adjoint states at the independent values
+        jumps = np.einsum('ij,ijk->ik', output_gradient, dydx)
+        states_len = jumps.shape[1]
+
+        starts = [start for start, args in solution.segments]
+        events = np.union1d(independent, starts)
+        adjoint = np.concatenate([np.zeros(states_len),
+                                  np.zeros(len(self.parameter_names))])
+        stats = SolverStats(solves=0)
+        start_time = time()
+        for k in range(len(events) - 1, -1, -1):
+            i = np.searchsorted(independent, events[k])
+            if i < len(independent) and independent[i] == events[k]:
+                adjoint[:states_len] += jumps[i]
+            if k == 0:
+                break
+
+            segment = np.searchsorted(starts, (events[k - 1] + events[k])/2.,
+                                      side='right') - 1
+            fun, jac = self._adjoint_functions(solution,
+                                               solution.segments[segment][1])
+            result = solve_ivp(fun, (events[k], events[k - 1]), adjoint,
+                               method='LSODA', jac=jac, rtol=rtol, atol=atol)
+            if not result.success:
+                raise Exception('The adjoint integration failed: ' +
+                                str(result.message))
+            stats = stats + SolverStats('adjoint:LSODA',
+                                        rhs_evaluations=result.nfev,
+                                        jacobian_evaluations=result.njev,
+                                        steps=len(result.t) - 1, solves=0)
+            adjoint = result.y[:, -1]
+        stats.wall_time = time() - start_time
+        stats.solves = 1
+        self.model._record_solve_stats(stats)
+
+        return (parameter_gradient + adjoint[states_len:],
+                adjoint[:states_len])
+
+    def _adjoint_functions(self, solution, args):
+        """
+        Right hand side and Jacobian of the adjoint states followed by the
+        integral of the gradient to the parameters, along the continuous
+        solution of the states
+        """
+        last = {}
+
+        def partials(independent_value):
+            if last.get('independent') != independent_value:
+                states = solution.solution(independent_value)
+                last['independent'] = independent_value
+                last['partials'] = [
+                    np.asarray(value, dtype=float) for value in
+                    self._fun_ode_partials(states, independent_value, *args)]
+            return last['partials']
+
+        def fun(independent_value, adjoint):
+            dfdx, dfdtheta = partials(independent_value)
+            states_adjoint = adjoint[:dfdx.shape[0]]
+            return np.concatenate([-np.dot(dfdx.T, states_adjoint),
+                                   -np.dot(dfdtheta.T, states_adjoint)])
+
+        def jac(independent_value, adjoint):
+            dfdx, dfdtheta = partials(independent_value)
+            jacobian = np.zeros([len(adjoint), len(adjoint)])
+            jacobian[:dfdx.shape[0], :dfdx.shape[0]] = -dfdx.T
+            jacobian[dfdx.shape[0]:, :dfdx.shape[0]] = -dfdtheta.T
+            return jacobian
+
+        return fun, jac
+
+    def get_steady_state_sensitivity(self, method='AS', initial_guess=None,
+                                     independent_value=None, tol=1e-10,
+                                     max_iter=50):
+        r"""
+        Get the local sensitivity of the steady state of the model (see
+        Model.steady_state) for the different parameters and variables of
+        interest, without integrating the sensitivity equations.
+
+        At the steady state f(x, theta) = 0, so by implicit differentiation
+
+            .. math:: \frac{\partial x}{\partial \theta} = -\left(\frac{\partial f}{\partial x}\right)^{-1}\frac{\partial f}{\partial \theta}
+
+        The sensitivities of the algebraic variables follow from the ones of
+        the states.
+
+        Parameters
+        -----------
+        method : 'AS'|'PRS'|'TRS'
+            Absolute, parameter relative or total relative sensitivity, see
+            get_sensitivity.
+        initial_guess, independent_value, tol, max_iter:
+            Options of the steady state solver, see Model.steady_state.
+
+        Returns
+        --------
+        sensitivity : pandas.DataFrame
+            Sensitivity of each variable of interest (rows) to each of the
+            parameters (columns).
+        """
+        if self._fun_ode_partials is None:
+            raise Exception('Steady state sensitivities are only available '
+                            'for models with ODEs.')
+        if method not in ['AS', 'PRS', 'TRS']:
+            raise Exception('This type of scaling is not known/implemented. '
+                            'Please use AS, PRS or TRS scaling.')
+
+        states, independent_value = self.model._steady_state(
+            initial_guess=initial_guess, independent_value=independent_value,
+            tol=tol, max_iter=max_iter)
+        args = self.model._parameter_args() + self.model._input_args()
+        dfdx, dfdtheta = self._fun_ode_partials(states, independent_value,
+                                                *args)
+        try:
+            dxdtheta = -np.linalg.solve(np.asarray(dfdx, dtype=float),
+                                        np.asarray(dfdtheta, dtype=float))
+        except np.linalg.LinAlgError:
+            raise Exception('The Jacobian of the ODEs is singular at the '
+                            'steady state (e.g. because of conserved '
+                            'quantities), the steady state sensitivities are '
+                            'not defined.')
+
+        steady_sens = dxdtheta
+        if self._fun_alg:
+            independent = {self.model._independent_names[0]:
+                           np.array([independent_value], dtype=float)}
+            solver = AlgebraicSolver(self._fun_alg, independent, args,
+                                     ode_values=states[np.newaxis, :],
+                                     dxdtheta=dxdtheta[np.newaxis, :, :])
+            steady_sens = np.concatenate((solver._solve_algebraic()[0],
+                                          dxdtheta))
+        steady_sens = steady_sens[self.model._variables_of_interest_index]
+
+        if method[1:] == 'RS':
+            # Parameter relative sensitivity
+            steady_sens = steady_sens*self.parameter_values
+            if method == 'TRS':
+                output = self.model._steady_state_output(states,
+                                                         independent_value)
+                output[output < 1e-16] = 1e-16
+                # Total relative sensitivity
+                steady_sens = steady_sens/output[:, np.newaxis]
+
+        return pd.DataFrame(steady_sens,
+                            index=self.model.variables_of_interest,
+                            columns=self.parameter_names)
+
 
 #==============================================================================
 #
@@ -731,11 +1526,307 @@ class DirectLocalSensitivity(LocalSensitivity):
 #         return direct_alg_sens, dxdtheta
 #==============================================================================
 
-#==============================================================================
-# class GlobalSensitivity(Sensitivity):
-#     """
-#     """
-#     def __init__(self, model):
-#         """
-#         """
-#==============================================================================
+
+class GlobalSensitivity(object):
+    r"""
+    Variance-based (Sobol) and screening (Morris) global sensitivity of the
+    variables of interest, for each independent value.
+
+    The parameter sets are evaluated as batches: an AlgebraicModel by
+    run_batch, a Model by run_ensemble, so a batch costs a single call of the
+    (vectorised) model functions.
+
+    Parameters
+    -----------
+    model : Model|AlgebraicModel
+    parameter_distributions : list
+        ModPar instances of the parameters to vary, the other parameters keep
+        their current value.
+    sampling : 'MC'|'LH'
+        Sampling of the parameter distributions for the Sobol indices: Monte
+        Carlo sampling of the distribution (ModPar.MCSample) or Latin
+        hypercube sampling (ModPar.LatinH, uniform distributions only).
+    batch_size : int
+        Maximum number of parameter sets evaluated in one batch, which
+        limits the memory use.
+    executor : None|'thread'|'process'|object
+        By default (None), the batches are evaluated one after the other. With
+        'thread' or 'process', the batches are evaluated concurrently by a
+        pool of threads or processes, each with its own copy of the model.
+        The pool is created once for each call of get_sobol_indices or
+        get_morris_effects. Any long-lived object with a map method can be
+        passed as well, each batch then gets a copy of the model.
+    n_workers : int|None
+        Number of threads or processes of the pool, default the number of
+        CPUs.
+
+    Examples
+    ---------
+    >>> M1 = AlgebraicModel('MM', {'v': 'Vmax*S/(Km + S)'},
+                            {'Vmax': 1e-2, 'Km': 0.4}, ['S'])
+    >>> M1.independent = {'S': np.linspace(0., 5., 100)}
+    >>> M1gsa = GlobalSensitivity(M1, [ModPar('Km', 0.1, 1., 'randomUniform'),
+                                       ModPar('Vmax', 5e-3, 2e-2,
+                                              'randomUniform')])
+    >>> sobol = M1gsa.get_sobol_indices(10000)
+    >>> sobol['ST']['v']
+    >>> morris = M1gsa.get_morris_effects(100)
+    """
+    def __init__(self, model, parameter_distributions, sampling='MC',
+                 batch_size=10000, executor=None, n_workers=None):
+        """
+        """
+        self._model = model
+
+        if isinstance(parameter_distributions, ModPar):
+            parameter_distributions = [parameter_distributions]
+        if not isinstance(parameter_distributions, list) or \
+                not all(isinstance(dist, ModPar)
+                        for dist in parameter_distributions):
+            raise Exception("Bad input type, give list of ModPar instances.")
+        for dist in parameter_distributions:
+            if dist.name not in model.parameters:
+                raise Exception('Parameter %s is not a parameter of the '
+                                'model' % dist.name)
+        self._distributions = parameter_distributions
+
+        if sampling not in ['MC', 'LH']:
+            raise Exception("The sampling should be 'MC' or 'LH'.")
+        self.sampling = sampling
+        self.batch_size = batch_size
+
+        if executor is not None and executor not in SENS_EXECUTORS and \
+                not hasattr(executor, 'map'):
+            raise Exception("The executor should be None, 'thread', "
+                            "'process' or an object with a map method.")
+        self.executor = executor
+        self.n_workers = n_workers
+        self._pool = None
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def parameter_names(self):
+        return [dist.name for dist in self._distributions]
+
+    @staticmethod
+    def _random_state(seed):
+        """
+        Generator of the samples: a local generator for the given seed, which
+        leaves the global numpy random state untouched, or the global numpy
+        generator without seed
+        """
+        if seed is None:
+            return _generator(None)
+        return np.random.RandomState(seed)
+
+    def _sample(self, n_samples, random_state=None):
+        """
+        Array (n_samples, number of parameters) sampled from the parameter
+        distributions
+        """
+        if self.sampling == 'LH':
+            samples = [dist.LatinH(n_samples, random_state=random_state)
+                       for dist in self._distributions]
+        else:
+            samples = [dist.MCSample(n_samples, random_state=random_state)
+                       for dist in self._distributions]
+        return np.column_stack(samples)
+
+    @staticmethod
+    def _evaluate_model(model, parameters, param_matrix):
+        """
+        Output (number of rows, independent values, variables of interest)
+        of the model for each row of param_matrix
+        """
+        if hasattr(model, 'run_batch'):
+            return model.run_batch(param_matrix, parameters=parameters)
+        return model.run_ensemble(
+            parameters=dict(zip(parameters, param_matrix.T)))
+
+    def _evaluate(self, param_matrix):
+        """
+        Model output for each row of param_matrix, evaluated in batches, see
+        batch_size and executor
+        """
+        n_rows = param_matrix.shape[0]
+        batch_size = self.batch_size
+        if self.executor is not None:
+            # at least a batch for each of the workers
+            n_workers = self.n_workers or cpu_count()
+            batch_size = min(batch_size, -(-n_rows//n_workers))
+        batches = [param_matrix[start:start + batch_size]
+                   for start in range(0, n_rows, batch_size)]
+
+        if self.executor is None:
+            return np.concatenate([
+                self._evaluate_model(self.model, self.parameter_names, batch)
+                for batch in batches])
+
+        if self.executor in SENS_EXECUTORS:
+            tasks = [(None, self.parameter_names, batch) for batch in batches]
+            with _worker_pool(self):
+                results = self._pool.map(_run_batch, tasks)
+        else:
+            tasks = [(deepcopy(self.model), self.parameter_names, batch)
+                     for batch in batches]
+            results = list(self.executor.map(_run_batch, tasks))
+
+        # The solves of the copies are part of the solves of the model
+        outputs = []
+        for output, stats in results:
+            self.model._record_solve_stats(stats)
+            outputs.append(output)
+        return np.concatenate(outputs)
+
+    def _as_dataframe(self, indices):
+        """
+        DataFrame of a dict with, for each name, an array (parameters,
+        independent values, variables of interest), with the independent
+        values as index and (name, variable, parameter) as columns, in line
+        with the local sensitivities.
+        """
+        variables = self.model.variables_of_interest
+        frames = []
+        for name, values in indices.items():
+            frames.append(values.transpose(1, 2, 0).reshape(
+                [values.shape[1], -1]))
+        columns = pd.MultiIndex.from_tuples(list(product(
+            indices.keys(), variables, self.parameter_names)))
+        index = pd.MultiIndex.from_arrays(
+            self.model._independent_values.values(),
+            names=self.model._independent_names)
+
+        return pd.DataFrame(np.hstack(frames), index=index, columns=columns)
+
+    @record_solve_stats('sobol')
+    @_pooled
+    def get_sobol_indices(self, n_samples, seed=None):
+        r"""
+        Sobol first order (S1) and total (ST) indices of each parameter, for
+        each variable of interest and independent value.
+
+        The indices are estimated with the Saltelli scheme: two independent
+        samples A and B of n_samples parameter sets and, for each parameter
+        i, the sample AB_i (A with column i of B), in total
+        n_samples*(p + 2) model evaluations for p parameters. With the
+        variance V of f over A and B,
+
+            .. math:: S1_i = \frac{1}{V}\overline{f(B)(f(AB_i) - f(A))}
+
+            .. math:: ST_i = \frac{1}{2V}\overline{(f(A) - f(AB_i))^2}
+
+        Where the output does not vary, e.g. at fixed initial conditions,
+        the indices are NaN.
+
+        Parameters
+        -----------
+        n_samples : int
+            Number of parameter sets of each of the samples A and B.
+        seed : int|None
+            Seed of a local random number generator, for a reproducible
+            sample without changing the global numpy random state. Default
+            the global numpy generator is used.
+
+        Returns
+        --------
+        indices : pandas.DataFrame
+            Indices with the independent values as index and the columns
+            (S1|ST, variable, parameter).
+        """
+        random_state = self._random_state(seed)
+        n_pars = len(self._distributions)
+
+        sample = self._sample(2*n_samples, random_state)
+        sample_a, sample_b = sample[:n_samples], sample[n_samples:]
+        sample_ab = np.repeat(sample_a[np.newaxis], n_pars, axis=0)
+        for i in range(n_pars):
+            sample_ab[i, :, i] = sample_b[:, i]
+
+        output = self._evaluate(np.concatenate(
+            [sample_a, sample_b, sample_ab.reshape(-1, n_pars)]))
+        output_a = output[:n_samples]
+        output_b = output[n_samples:2*n_samples]
+        output_ab = output[2*n_samples:].reshape(
+            (n_pars, n_samples) + output.shape[1:])
+
+        variance = np.var(output[:2*n_samples], axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            first_order = np.mean(output_b*(output_ab - output_a),
+                                  axis=1)/variance
+            total = 0.5*np.mean((output_a - output_ab)**2, axis=1)/variance
+
+        return self._as_dataframe(OrderedDict([('S1', first_order),
+                                               ('ST', total)]))
+
+    @record_solve_stats('morris')
+    @_pooled
+    def get_morris_effects(self, n_trajectories, levels=4, seed=None):
+        r"""
+        Morris elementary effects screening of the parameters, for each
+        variable of interest and independent value.
+
+        Each trajectory starts at a random point of a grid with the given
+        number of levels in the parameter ranges (the min and max of the
+        ModPar) and changes the parameters one at a time, in random order, by
+        a step of levels/(2*(levels - 1)) of their range, in total
+        n_trajectories*(p + 1) model evaluations for p parameters. The
+        elementary effects are the output differences divided by this
+        relative step, so the effects of the parameters are comparable.
+
+        Parameters
+        -----------
+        n_trajectories : int
+            Number of trajectories.
+        levels : int
+            Number of levels of the grid, preferably even.
+        seed : int|None
+            Seed of a local random number generator, for a reproducible
+            sample without changing the global numpy random state. Default
+            the global numpy generator is used.
+
+        Returns
+        --------
+        effects : pandas.DataFrame
+            The mean (mu), the mean of the absolute values (mu_star) and the
+            standard deviation (sigma) of the elementary effects, with the
+            independent values as index and the columns (mu|mu_star|sigma,
+            variable, parameter).
+        """
+        random_state = self._random_state(seed)
+        n_pars = len(self._distributions)
+        trajectories = np.arange(n_trajectories)[:, np.newaxis]
+        delta = levels/(2*(levels - 1))
+
+        start = random_state.randint(levels, size=(n_trajectories, n_pars))
+        start = start/(levels - 1)
+        # step down where a step up leaves the range
+        direction = np.where(start + delta <= 1 + 1e-12, 1., -1.)
+        order = np.argsort(random_state.uniform(size=(n_trajectories, n_pars)),
+                           axis=1)
+
+        points = np.repeat(start[:, np.newaxis], n_pars + 1, axis=1)
+        for k in range(n_pars):
+            par = order[:, k:k + 1]
+            points[trajectories, np.arange(k + 1, n_pars + 1), par] += \
+                delta*direction[trajectories, par]
+
+        minimum = np.array([dist.min for dist in self._distributions])
+        bound = np.array([dist.bound for dist in self._distributions])
+        output = self._evaluate((minimum + points*bound).reshape(-1, n_pars))
+        output = output.reshape((n_trajectories, n_pars + 1) +
+                                output.shape[1:])
+
+        # the k-th step of a trajectory changes parameter order[:, k]
+        effects = np.empty((n_trajectories, n_pars) + output.shape[2:])
+        step = delta*direction[trajectories, order]
+        effects[trajectories, order] = \
+            (output[:, 1:] - output[:, :-1]) / \
+            step.reshape(step.shape + (1,)*(output.ndim - 2))
+
+        return self._as_dataframe(OrderedDict([
+            ('mu', np.mean(effects, axis=0)),
+            ('mu_star', np.mean(np.abs(effects), axis=0)),
+            ('sigma', np.std(effects, axis=0, ddof=1))]))
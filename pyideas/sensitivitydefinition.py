@@ -4,29 +4,25 @@ Created on Wed Mar 18 11:57:22 2015
 
 @author: timothy
 """
+from collections import OrderedDict
+
 import numpy as np
 import sympy
 from sympy.abc import _clash
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import reverse_cuthill_mckee
 
 from pyideas.modeldefinition import *
 
-import pprint
 
+def _ode_system_matrix(odefunctions, algvar, algfunctions):
+    '''Symbolic matrix of the ODEs without algebraic variables
 
-def generate_ode_sens(odevar, odefunctions, algvar, algfunctions, parameters):
-    '''Analytic derivation of the local sensitivities of ODEs
-
-    Sympy based implementation to get the analytic derivation of the
-    ODE sensitivities. Algebraic variables in the ODE equations are replaced
-    by its equations to perform the analytical derivation.
+    Algebraic variables in the ODE equations are replaced by its equations,
+    such that the ODEs only depend on states, parameters and independent.
     '''
-
     # Set up symbolic matrix of system states
     system_matrix = sympy.Matrix(sympy.sympify(odefunctions, _clash))
-    # Set up symbolic matrix of variables
-    states_matrix = sympy.Matrix(sympy.sympify(odevar, _clash))
-    # Set up symbolic matrix of parameters
-    parameter_matrix = sympy.Matrix(sympy.sympify(parameters, _clash))
 
     # Replace algebraic stuff in system_matrix to perform LSA
     if bool(algfunctions):
@@ -43,13 +39,51 @@ def generate_ode_sens(odevar, odefunctions, algvar, algfunctions, parameters):
                                                   _clash))
             h += 1
 
+    return system_matrix
+
+def _numpy_array(matrix):
+    '''Array of the symbolic derivatives, checked to be written as numpy
+    code, see numpy_expression
+    '''
+    array = np.array(matrix)
+    return np.array([numpy_expression(element)
+                     for element in array.ravel()]).reshape(array.shape)
+
+def generate_ode_jacobian(odevar, odefunctions, algvar, algfunctions):
+    '''Analytic derivation of the Jacobian of the ODEs
+
+    Returns
+    --------
+    dfdx: numpy.ndarray
+        Symbolic array with the derivative of each ODE (rows) to each of the
+        states (columns).
+    '''
+    system_matrix = _ode_system_matrix(odefunctions, algvar, algfunctions)
+    # Set up symbolic matrix of variables
+    states_matrix = sympy.Matrix(sympy.sympify(odevar, _clash))
+
+    return _numpy_array(system_matrix.jacobian(states_matrix))
+
+def generate_ode_sens(odevar, odefunctions, algvar, algfunctions, parameters):
+    '''Analytic derivation of the local sensitivities of ODEs
+
+    Sympy based implementation to get the analytic derivation of the
+    ODE sensitivities. Algebraic variables in the ODE equations are replaced
+    by its equations to perform the analytical derivation.
+    '''
+    system_matrix = _ode_system_matrix(odefunctions, algvar, algfunctions)
+    # Set up symbolic matrix of variables
+    states_matrix = sympy.Matrix(sympy.sympify(odevar, _clash))
+    # Set up symbolic matrix of parameters
+    parameter_matrix = sympy.Matrix(sympy.sympify(parameters, _clash))
+
     # Initialize and calculate matrices for analytic sensitivity calculation
     # dfdtheta
     dfdtheta = system_matrix.jacobian(parameter_matrix)
-    dfdtheta = np.array(dfdtheta)
+    dfdtheta = _numpy_array(dfdtheta)
     # dfdx
     dfdx = system_matrix.jacobian(states_matrix)
-    dfdx = np.array(dfdx)
+    dfdx = _numpy_array(dfdx)
     # dxdtheta
     dxdtheta = np.zeros([len(states_matrix), len(parameters)])
     dxdtheta = np.asmatrix(dxdtheta)
@@ -70,11 +104,11 @@ def generate_alg_sens(odevar, odefunctions, algvar, algfunctions, parameters):
     # Initialize and calculate matrices for analytic sensitivity calculation
     # dgdtheta
     dgdtheta = algebraic_matrix.jacobian(parameter_matrix)
-    dgdtheta = np.array(dgdtheta)
+    dgdtheta = _numpy_array(dgdtheta)
     # dgdx
     dgdx = None
     if odefunctions:
-        dgdx = np.array(algebraic_matrix.jacobian(states_matrix))
+        dgdx = _numpy_array(algebraic_matrix.jacobian(states_matrix))
 
     return dgdtheta, dgdx
 
@@ -112,7 +146,81 @@ def _alg_swap(algvar, algfunctions):
 
     return algebraic_swap
 
-def generate_ode_derivative_definition(model, dfdtheta, dfdx, parameters):
+def write_symbolic_array(defstr, name, array):
+    """
+    Write a 2D array of symbolic expressions as a (float) numpy array
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    name : str
+        name of the array in the definition
+    array : numpy.ndarray|list
+        2D array (or nested list) of sympy expressions
+    """
+    rows = ['[' + ', '.join(str(element) for element in row) + ']'
+            for row in array]
+    indent = ',\n' + ' '*(len(name) + 17)
+    defstr += '    {0} = np.array(['.format(name) + indent.join(rows) + '])\n'
+    return defstr
+
+def write_sensitivity_rhs(defstr, dfdtheta, dfdx):
+    """
+    Write the right hand side of the forward sensitivity equations,
+    dfdtheta + dfdx*dxdtheta, with only the nonzero elements of dfdtheta and
+    dfdx. Each row of the derivatives of dxdtheta is the sum of the rows of
+    dxdtheta of the states the ODE depends on, so the number of operations
+    scales with the number of nonzero elements. The rows are written in the
+    dxdtheta_dt buffer, see write_sensitivity_buffer.
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model, with dxdtheta (the
+        sensitivities of the states) defined
+    dfdtheta : numpy.ndarray
+        Symbolic array with the derivative of each ODE to each parameter.
+    dfdx : numpy.ndarray
+        Symbolic array with the derivative of each ODE to each state.
+    """
+    state_len, par_len = dfdtheta.shape
+    for i in range(state_len):
+        terms = ['({0})*dxdtheta[{1}]'.format(dfdx[i, k], k)
+                 for k in range(state_len) if dfdx[i, k] != 0]
+        if terms:
+            defstr += '    dxdtheta_dt[{0}] = '.format(i) + \
+                ' + '.join(terms) + '\n'
+        else:
+            defstr += '    dxdtheta_dt[{0}] = 0.\n'.format(i)
+        for j in range(par_len):
+            if dfdtheta[i, j] != 0:
+                defstr += '    dxdtheta_dt[{0}, {1}] += {2}\n'.format(
+                    i, j, dfdtheta[i, j])
+    return defstr
+
+def write_sensitivity_buffer(defstr, state_len, par_len):
+    """
+    Write the buffer of the derivatives of the sensitivities. The solver
+    passes a buffer allocated once for each solve as the dxdtheta_dt
+    keyword argument, otherwise it is allocated at every call. The function
+    returns a copy.
+
+    Parameters
+    ----------
+    defstr : str
+        str containing the definition to solve in model
+    state_len, par_len : int
+        number of states and parameters
+    """
+    defstr += "    dxdtheta_dt = kwargs.get('dxdtheta_dt')\n"
+    defstr += '    if dxdtheta_dt is None:\n'
+    defstr += '        dxdtheta_dt = np.zeros(({0}, {1}))\n'.format(
+        state_len, par_len)
+    return defstr
+
+def generate_ode_derivative_definition(model, dfdtheta, dfdx, parameters,
+                                       cse=False):
     '''Write derivative of model as definition in file
 
     Writes a file with a derivative definition to run the model and
@@ -121,22 +229,51 @@ def generate_ode_derivative_definition(model, dfdtheta, dfdx, parameters):
     Parameters
     -----------
     model : biointense.model
+    cse : bool
+        If True, the common subexpressions of the ODEs, dfdtheta and dfdx are
+        calculated only once.
 
     '''
     modelstr = 'def fun_ode_lsa(odes, t, parameters, *args, **kwargs):\n'
     # Get the parameter values
-    modelstr = write_parameters(modelstr, model.parameters)
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None), 't')
     modelstr = write_whiteline(modelstr)
     # Get the current variable values from the solver
     modelstr = write_ode_indices(modelstr, model._ordered_var['ode'])
     modelstr = write_whiteline(modelstr)
-    # Write down necessary algebraic equations (if none, nothing written)
-    modelstr = write_algebraic_lines(modelstr,
-                                     model.systemfunctions['algebraic'])
-    modelstr = write_whiteline(modelstr)
 
-    # Write down the current derivative values
-    modelstr = write_ode_lines(modelstr, model.systemfunctions['ode'])
+    if cse:
+        odevar = model._ordered_var['ode']
+        system_matrix = _ode_system_matrix(
+            model.systemfunctions['ode'].values(),
+            model._ordered_var['algebraic'],
+            model.systemfunctions['algebraic'].values())
+        expressions = (list(system_matrix) + list(dfdtheta.ravel()) +
+                       list(dfdx.ravel()))
+        replacements, reduced = cse_expressions(expressions)
+        modelstr = write_cse_lines(modelstr, replacements)
+        modelstr = write_whiteline(modelstr)
+
+        ode_len = len(odevar)
+        par_len = len(parameters)
+        ode_reduced = reduced[:ode_len]
+        dfdtheta = np.reshape(reduced[ode_len:ode_len*(par_len + 1)],
+                              (ode_len, par_len))
+        dfdx = np.reshape(reduced[ode_len*(par_len + 1):],
+                          (ode_len, ode_len))
+
+        # Write down the current derivative values
+        modelstr = write_ode_lines(modelstr, OrderedDict(
+            zip(odevar, [str(expression) for expression in ode_reduced])))
+    else:
+        # Write down necessary algebraic equations (if none, nothing written)
+        modelstr = write_algebraic_lines(modelstr,
+                                         model.systemfunctions['algebraic'])
+        modelstr = write_whiteline(modelstr)
+
+        # Write down the current derivative values
+        modelstr = write_ode_lines(modelstr, model.systemfunctions['ode'])
 
     modelstr += '\n    #Sensitivities\n\n'
 
@@ -144,40 +281,199 @@ def generate_ode_derivative_definition(model, dfdtheta, dfdx, parameters):
     modelstr += '    state_len = ' + str(len(model._ordered_var['ode'])) + '\n'
     # Reshape ODES input to array with right dimensions in order to perform
     # matrix multiplication
-    modelstr += ('    dxdtheta = np.array(odes[state_len:].reshape(state_len, '
-                 '' + str(len(parameters)) + '))\n\n')
+    modelstr += ('    dxdtheta = np.asarray(odes[state_len:]).reshape('
+                 'state_len, ' + str(len(parameters)) + ')\n\n')
 
-    # Write dfdtheta as symbolic array
-    modelstr += '    dfdtheta = np.'
-    modelstr += pprint.pformat(dfdtheta)
-    # Write dfdx as symbolic array
-    modelstr += '\n    dfdx = np.'
-    modelstr += pprint.pformat(dfdx)
-    # Calculate derivative in order to integrate this
-    modelstr += '\n    dxdtheta = dfdtheta + np.dot(dfdx, dxdtheta)\n'
+    # Only the nonzero elements of dfdtheta and dfdx are calculated
+    modelstr = write_sensitivity_buffer(modelstr,
+                                        len(model._ordered_var['ode']),
+                                        len(parameters))
+    modelstr = write_sensitivity_rhs(modelstr, dfdtheta, dfdx)
 
-    modelstr = write_derivative_return(modelstr, model._ordered_var['ode'])
-    modelstr += ' + list(dxdtheta.reshape(-1,))\n\n'
+    derivatives = ', '.join('d' + variable
+                            for variable in model._ordered_var['ode'])
+    modelstr += ('    return np.concatenate(([' + derivatives + '], '
+                 'dxdtheta_dt.ravel()))\n\n')
 
     return replace_numpy_fun(modelstr)
 
-def generate_non_derivative_part_definition(model, dgdtheta, dgdx, parameters):
-    '''Write derivative of model as definition in file
+def generate_ode_jacobian_definition(model, dfdx):
+    '''Write Jacobian of the ODEs as definition
 
-    Writes a file with a derivative definition to run the model and
-    use it for other applications
+    The Jacobian is passed to the ODE solvers (e.g. Dfun of odeint), which
+    avoids the finite difference approximation of the Jacobian.
 
     Parameters
     -----------
     model : biointense.model
+    dfdx : numpy.ndarray
+        Symbolic array with the derivative of each ODE to each state.
 
     '''
-    modelstr = 'def fun_alg_lsa(independent, parameters, *args, **kwargs):\n'
+    modelstr = 'def jac_ode(odes, t, parameters, *args, **kwargs):\n'
+    # Get the parameter values
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None), 't')
+    modelstr = write_whiteline(modelstr)
+    # Get the current variable values from the solver
+    modelstr = write_model_ode_indices(modelstr, model)
+    modelstr = write_whiteline(modelstr)
+
+    modelstr = write_symbolic_array(modelstr, 'jacobian', dfdx)
+    modelstr += '    return jacobian'
+
+    return replace_numpy_fun(modelstr)
+
+def generate_ode_partials_definition(model, dfdtheta, dfdx):
+    '''Write the partial derivatives of the ODEs as definition
+
+    The definition returns the derivatives of each ODE (rows) to each state
+    (dfdx) and to each parameter (dfdtheta), e.g. to calculate the steady
+    state sensitivities by implicit differentiation.
+
+    Parameters
+    -----------
+    model : biointense.model
+    dfdtheta : numpy.ndarray
+        Symbolic array with the derivative of each ODE to each parameter.
+    dfdx : numpy.ndarray
+        Symbolic array with the derivative of each ODE to each state.
+
+    '''
+    modelstr = 'def fun_ode_partials(odes, t, parameters, *args, **kwargs):\n'
+    # Get the parameter values
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None), 't')
+    modelstr = write_whiteline(modelstr)
+    # Get the current variable values from the solver
+    modelstr = write_model_ode_indices(modelstr, model)
+    modelstr = write_whiteline(modelstr)
+
+    modelstr = write_symbolic_array(modelstr, 'dfdx', dfdx)
+    modelstr = write_symbolic_array(modelstr, 'dfdtheta', dfdtheta)
+    modelstr += '    return dfdx, dfdtheta'
+
+    return replace_numpy_fun(modelstr)
+
+def generate_ode_jacobian_sparsity_definition(model, dfdx):
+    '''Write sparsity structure of the Jacobian of the ODEs as definition
+
+    The structure (1 for the nonzero elements) is derived from the symbolic
+    Jacobian and is used by the solvers to limit the finite difference
+    approximation of the Jacobian.
+
+    Parameters
+    -----------
+    model : biointense.model
+    dfdx : numpy.ndarray
+        Symbolic array with the derivative of each ODE to each state.
+
+    '''
+    modelstr = 'def jac_ode_sparsity(*args, **kwargs):\n'
+    sparsity = [[int(element != 0) for element in row] for row in dfdx]
+    modelstr = write_symbolic_array(modelstr, 'sparsity', sparsity)
+    modelstr += '    return sparsity'
+
+    return modelstr
+
+def _bandwidth(sparsity, order):
+    '''Lower and upper bandwidth of the sparsity structure with the states
+    (rows and columns) in the given order
+    '''
+    rows, cols = np.nonzero(sparsity[np.ix_(order, order)])
+    if not rows.size:
+        return 0, 0
+    return max(np.max(rows - cols), 0), max(np.max(cols - rows), 0)
+
+def get_band_ordering(sparsity):
+    '''Order of the states with the narrowest band of the Jacobian
+
+    The states are ordered by their names in the models, which mostly breaks
+    up the band structure of large compartment models (e.g. C1, C10, C100,
+    C101,...). The reverse Cuthill-McKee ordering of the coupling graph
+    restores it. The original order is kept when it is not wider.
+
+    Parameters
+    -----------
+    sparsity : numpy.ndarray
+        Sparsity structure of the Jacobian (nonzero for the dependencies)
+
+    Returns
+    --------
+    order : list
+        Index of the states in the banded system, i.e. the banded system
+        has states odes[order].
+    lband, uband : int
+        Lower and upper bandwidth of the Jacobian of the banded system.
+    '''
+    sparsity = np.asarray(sparsity) != 0
+    order = range(len(sparsity))
+    lband, uband = _bandwidth(sparsity, order)
+
+    coupling = csr_matrix(sparsity | sparsity.T)
+    rcm = [int(i) for i in reverse_cuthill_mckee(coupling,
+                                                 symmetric_mode=True)]
+    rcm_lband, rcm_uband = _bandwidth(sparsity, rcm)
+    if rcm_lband + rcm_uband < lband + uband:
+        return rcm, rcm_lband, rcm_uband
+    return order, lband, uband
+
+def generate_ode_banded_jacobian_definition(model, dfdx, band):
+    '''Write Jacobian of the ODEs in the packed banded format as definition
+
+    The packed format of the Jacobian of the states in the band order, is
+    jacobian[uband + i - j, j] = dfdx[order[i], order[j]], as used by odeint
+    (ml, mu), the lsoda and vode integrators of ode and LSODA of solve_ivp
+    (lband, uband). Only the nonzero elements are written. The band order and
+    widths are stored as attributes of the function.
+
+    Parameters
+    -----------
+    model : biointense.model
+    dfdx : numpy.ndarray
+        Symbolic array with the derivative of each ODE to each state.
+    band : tuple
+        order, lband and uband as returned by get_band_ordering
+
+    '''
+    order, lband, uband = band
+    modelstr = 'def jac_ode_banded(odes, t, parameters, *args, **kwargs):\n'
+    # Get the parameter values
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None), 't')
+    modelstr = write_whiteline(modelstr)
+    # Get the current variable values from the solver
+    modelstr = write_model_ode_indices(modelstr, model)
+    modelstr = write_whiteline(modelstr)
+
+    modelstr += '    jacobian = np.zeros(({0}, {1}))\n'.format(
+        lband + uband + 1, len(order))
+    for i, row in enumerate(order):
+        for j, col in enumerate(order):
+            if dfdx[row, col] != 0:
+                modelstr += '    jacobian[{0}, {1}] = {2}\n'.format(
+                    uband + i - j, j, dfdx[row, col])
+    modelstr += '    return jacobian\n\n'
+
+    modelstr += 'jac_ode_banded.order = {0}\n'.format(list(order))
+    modelstr += 'jac_ode_banded.lband = {0}\n'.format(lband)
+    modelstr += 'jac_ode_banded.uband = {0}\n'.format(uband)
+
+    return replace_numpy_fun(modelstr)
+
+def _write_alg_partials(modelstr, model, dgdtheta, dgdx, parameters,
+                        cse=False):
+    '''Write the independent, parameters, states and the derivatives of the
+    algebraic variables to the parameters (dgdtheta) and to the states
+    (dgdx, only for models with ODEs) for all independent values
+    '''
     # Get independent
     modelstr = write_independent(modelstr, model.independent)
     modelstr = write_whiteline(modelstr)
     # Get the parameter values
-    modelstr = write_parameters(modelstr, model.parameters)
+    modelstr = write_model_parameters(modelstr, model)
+    modelstr = write_inputs(modelstr, getattr(model, 'inputs', None),
+                            model._independent_names[0])
     modelstr = write_whiteline(modelstr)
 
     # Put the variables in a separate array
@@ -185,12 +481,23 @@ def generate_non_derivative_part_definition(model, dgdtheta, dgdx, parameters):
         modelstr = write_array_extraction(modelstr, model._ordered_var['ode'])
         modelstr = write_whiteline(modelstr)
 
-        modelstr += "\n    dxdtheta = kwargs.get('dxdtheta')\n"
-
-    # Write down the equation of algebraic
-    modelstr = write_algebraic_solve(modelstr,
-                                     model.systemfunctions['algebraic'],
-                                     model._independent_names[0])
+    if cse:
+        # The algebraic variables itself are not needed, as the
+        # derivatives only depend on states, parameters and independent
+        expressions = list(dgdtheta.ravel())
+        if dgdx is not None:
+            expressions += list(dgdx.ravel())
+        replacements, reduced = cse_expressions(expressions)
+        modelstr = write_whiteline(modelstr)
+        modelstr = write_cse_lines(modelstr, replacements)
+        dgdtheta = np.reshape(reduced[:dgdtheta.size], dgdtheta.shape)
+        if dgdx is not None:
+            dgdx = np.reshape(reduced[dgdtheta.size:], dgdx.shape)
+    else:
+        # Write down the equation of algebraic
+        modelstr = write_algebraic_solve(modelstr,
+                                         model.systemfunctions['algebraic'],
+                                         model._independent_names[0])
     modelstr = write_whiteline(modelstr)
 
     # TODO!
@@ -216,6 +523,30 @@ def generate_non_derivative_part_definition(model, dgdtheta, dgdx, parameters):
                 modelstr += ('    dgdx[:,' + str(i) + ',' + str(j) + '] = '
                              '' + str(dgdx[i, j]) + '\n')
 
+    return modelstr
+
+def generate_non_derivative_part_definition(model, dgdtheta, dgdx, parameters,
+                                            cse=False):
+    '''Write derivative of model as definition in file
+
+    Writes a file with a derivative definition to run the model and
+    use it for other applications
+
+    Parameters
+    -----------
+    model : biointense.model
+    cse : bool
+        If True, the common subexpressions of dgdtheta and dgdx are
+        calculated only once.
+
+    '''
+    modelstr = 'def fun_alg_lsa(independent, parameters, *args, **kwargs):\n'
+    modelstr = _write_alg_partials(modelstr, model, dgdtheta, dgdx,
+                                   parameters, cse=cse)
+
+    if model.systemfunctions.get('ode', None):
+        modelstr += "\n    dxdtheta = kwargs.get('dxdtheta')\n"
+
         # The two time-dependent 2D matrices should be multiplied with each other
         # (dot product). In order to yield a time-dependent 2D matrix, this is
         # possible using the einsum function.
@@ -230,3 +561,31 @@ def generate_non_derivative_part_definition(model, dgdtheta, dgdx, parameters):
     modelstr += '\n    return dydtheta\n'
 
     return replace_numpy_fun(modelstr)
+
+def generate_alg_partials_definition(model, dgdtheta, dgdx, parameters,
+                                     cse=False):
+    '''Write the partial derivatives of the algebraic variables as definition
+
+    The definition returns the derivatives of each algebraic variable to each
+    state (dgdx, None for models without ODEs) and to each parameter
+    (dgdtheta) for all independent values, e.g. to calculate the adjoint
+    gradient of an objective function.
+
+    Parameters
+    -----------
+    model : biointense.model
+    cse : bool
+        If True, the common subexpressions of dgdtheta and dgdx are
+        calculated only once.
+
+    '''
+    modelstr = ('def fun_alg_partials(independent, parameters, *args, '
+                '**kwargs):\n')
+    modelstr = _write_alg_partials(modelstr, model, dgdtheta, dgdx,
+                                   parameters, cse=cse)
+
+    if not model.systemfunctions.get('ode', None):
+        modelstr += '    dgdx = None\n'
+    modelstr += '\n    return dgdx, dgdtheta\n'
+
+    return replace_numpy_fun(modelstr)
@@ -6,8 +6,11 @@ Created on Sun Jan  4 11:52:12 2015
 """
 from __future__ import division
 
-from scipy.integrate import odeint, ode
+from scipy.integrate import odeint, ode, solve_ivp, OdeSolution
 from itertools import product
+from collections import OrderedDict
+from functools import wraps
+from time import time
 
 # Check whether odespy is installed
 try:
@@ -18,14 +21,186 @@ except ImportError:
 
 import numpy as np
 
+from pyideas.inputs import get_breakpoints, segment_inputs
+
 # Define availabe integrators for each of all ode' approaches
 ODE_INTEGRATORS = {}
 ODE_INTEGRATORS['ode'] = ['vode', 'zvode', 'lsoda', 'dopri5', 'dop853']
+ODE_INTEGRATORS['solve_ivp'] = ['LSODA', 'BDF', 'Radau', 'RK45', 'RK23']
+ODE_INTEGRATORS['rk'] = ['rk4', 'rk45']
 if _ODESPY:
     ODE_INTEGRATORS['odespy'] = odespy.list_available_solvers()
 
 # Standard setting for each ode approach
-STD_ODE_INTEGRATOR = {'ode': 'lsoda', 'odespy': 'lsoda_scipy', 'odeint': ''}
+STD_ODE_INTEGRATOR = {'ode': 'lsoda', 'odespy': 'lsoda_scipy', 'odeint': '',
+                      'solve_ivp': 'LSODA', 'rk': 'rk4'}
+
+# Procedure and integrator selected by procedure='auto' for stiff and for
+# non-stiff systems, see OdeSolver.select_integrator
+AUTO_INTEGRATORS = {True: ('odeint', None), False: ('ode', 'dopri5')}
+# Stiffness ratio above which a system is considered stiff
+STIFFNESS_THRESHOLD = 1e3
+
+# solve_ivp methods using the Jacobian, resp. its sparsity structure
+IVP_JACOBIAN_METHODS = ['LSODA', 'BDF', 'Radau']
+IVP_SPARSITY_METHODS = ['BDF', 'Radau']
+
+# Options of the vectorised Runge-Kutta integrators of the 'rk' procedure
+RK_OPTIONS = {'max_step': np.inf, 'first_step': None, 'rtol': 1e-6,
+              'atol': 1e-8}
+# Dormand-Prince 5(4) tableau of the rk45 integrator, the error estimate is
+# the difference of the 5th and 4th order solutions
+DOPRI_C = np.array([0., 1/5, 3/10, 4/5, 8/9, 1.])
+DOPRI_A = [[],
+           [1/5],
+           [3/40, 9/40],
+           [44/45, -56/15, 32/9],
+           [19372/6561, -25360/2187, 64448/6561, -212/729],
+           [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]]
+DOPRI_B = np.array([35/384, 0., 500/1113, 125/192, -2187/6784, 11/84])
+DOPRI_E = np.array([71/57600, 0., -71/16695, 71/1920, -17253/339200, 22/525,
+                    -1/40])
+
+
+def finite_difference_jacobian(fun_ode, states, independent_value, args):
+    r"""
+    Central finite difference approximation of the Jacobian of the ODEs,
+    with the derivative of each ODE (rows) to each state (columns).
+
+    Parameters
+    -----------
+    fun_ode: function
+        Function to calculate the derivatives, fun_ode(odes, t, *args).
+    states: numpy.ndarray
+        States to evaluate the Jacobian at.
+    independent_value: float
+        Value of the independent to evaluate the Jacobian at.
+    args: tuple
+        Extra arguments of fun_ode.
+    """
+    steps = 1e-7*np.maximum(np.abs(states), 1.)
+    jacobian = np.empty([len(states), len(states)])
+    for j, step in enumerate(steps):
+        perturbation = np.zeros(len(states))
+        perturbation[j] = step
+        jacobian[:, j] = (np.asarray(fun_ode(
+            states + perturbation, independent_value, *args)) -
+            np.asarray(fun_ode(states - perturbation,
+                               independent_value, *args)))/(2*step)
+    return jacobian
+
+
+class SolverStats(object):
+    r"""
+    Cost of one or more solves of the model equations.
+
+    The statistics of several solves are aggregated by adding them, e.g.
+    total = total + solver.stats. Counters which are not reported by a
+    backend are None and are left out of the sum.
+
+    Parameters
+    -----------
+    backend: str|None
+        Solver which did the work, e.g. 'odeint', 'ode:dopri5' or
+        'solve_ivp:BDF'. For aggregated statistics, the different backends
+        separated by a comma.
+    rhs_evaluations: int|None
+        Number of evaluations of the right hand side of the ODEs.
+    jacobian_evaluations: int|None
+        Number of evaluations (or finite difference approximations) of the
+        Jacobian of the ODEs.
+    steps: int|None
+        Number of (accepted) integration steps.
+    rejected_steps: int|None
+        Number of rejected integration steps.
+    wall_time: float
+        Wall clock time of the solves (in seconds).
+    solves: int
+        Number of solves.
+
+    Examples
+    ---------
+    >>> M1.run()
+    >>> M1.last_solve_stats
+    SolverStats(backend='odeint', rhs_evaluations=135, ...)
+    """
+    COUNTERS = ['rhs_evaluations', 'jacobian_evaluations', 'steps',
+                'rejected_steps']
+
+    def __init__(self, backend=None, rhs_evaluations=None,
+                 jacobian_evaluations=None, steps=None, rejected_steps=None,
+                 wall_time=0., solves=1):
+        self.backend = backend
+        self.rhs_evaluations = rhs_evaluations
+        self.jacobian_evaluations = jacobian_evaluations
+        self.steps = steps
+        self.rejected_steps = rejected_steps
+        self.wall_time = wall_time
+        self.solves = solves
+
+    def as_dict(self):
+        r"""
+        OrderedDict with the backend, the counters, the wall time and the
+        number of solves.
+        """
+        return OrderedDict([('backend', self.backend)] +
+                           [(name, getattr(self, name))
+                            for name in self.COUNTERS] +
+                           [('wall_time', self.wall_time),
+                            ('solves', self.solves)])
+
+    def __repr__(self):
+        return 'SolverStats({0})'.format(', '.join(
+            '{0}={1!r}'.format(name, value)
+            for name, value in self.as_dict().items()))
+
+    def __add__(self, other):
+        backends = []
+        for stats in [self, other]:
+            if stats.backend:
+                backends += [backend for backend in stats.backend.split(', ')
+                             if backend not in backends]
+        counters = {}
+        for name in self.COUNTERS:
+            values = [getattr(stats, name) for stats in [self, other]
+                      if getattr(stats, name) is not None]
+            counters[name] = sum(values) if values else None
+        return SolverStats(', '.join(backends) or None,
+                           wall_time=self.wall_time + other.wall_time,
+                           solves=self.solves + other.solves, **counters)
+
+
+def record_solve_stats(stage):
+    r"""
+    Decorator for the methods of the classes working with a model (available
+    as self.model), which adds the statistics of all solves of the model
+    during the method to self.solve_stats[stage], see SolverStats.
+
+    The stages can be nested: the solves of an inner stage are included in
+    the outer stage as well.
+
+    Parameters
+    -----------
+    stage: str
+        Name of the stage, e.g. 'local_optimize'.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            model = self.model
+            total = model.total_solve_stats
+            model.total_solve_stats = SolverStats(solves=0)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stage_stats = model.total_solve_stats
+                model.total_solve_stats = total + stage_stats
+                solve_stats = self.__dict__.setdefault('solve_stats',
+                                                       OrderedDict())
+                solve_stats[stage] = solve_stats.get(
+                    stage, SolverStats(solves=0)) + stage_stats
+        return wrapper
+    return decorator
 
 
 class _Solver(object):
@@ -57,20 +232,65 @@ class _Solver(object):
 class OdeSolver(_Solver):
     r"""
 
+    Parameters
+    -----------
+    jac_ode: function|None
+        Jacobian of fun_ode with the same signature, returning the derivative
+        of each ODE (rows) to each state (columns). When given, it is passed
+        to the solvers instead of approximating the Jacobian with finite
+        differences.
+    inputs: dict|None
+        Input names with their InputSignal. The ODEs are integrated segment
+        by segment between the breakpoints of the signals and the smooth
+        piece of the signals in each segment is passed to fun_ode as extra
+        argument (after args).
+    jac_sparsity: numpy.ndarray|None
+        Sparsity structure of the Jacobian (nonzero elements), used by the
+        BDF and Radau methods of the solve_ivp procedure to limit the finite
+        difference approximation when no jac_ode is given.
+    jac_band: tuple|None
+        (order, lband, uband) of a banded Jacobian: with the states
+        reordered as odes[order], the Jacobian is nonzero only for
+        i - lband <= j <= i + uband. When the band is narrower than the
+        system, odeint, the lsoda, vode and zvode integrators of ode and the
+        LSODA method of solve_ivp integrate the reordered system with a
+        banded Jacobian.
+    jac_ode_banded: function|None
+        Jacobian of the reordered system in the packed banded format,
+        jacobian[uband + i - j, j], with the signature of fun_ode. Without
+        it, the banded solvers approximate the band by finite differences
+        (unless a full jac_ode is given, then the band is not used).
+
+    Attributes
+    -----------
+    stats: SolverStats|None
+        Statistics of the last solve (or of all chunks solved so far), see
+        SolverStats.
     """
     def __init__(self, fun_ode, initial_conditions, independent, args,
-                 ode_solver_options=None, ode_integrator=None):
+                 ode_solver_options=None, ode_integrator=None, jac_ode=None,
+                 inputs=None, jac_sparsity=None, jac_band=None,
+                 jac_ode_banded=None):
         """
         """
         self.fun_ode = fun_ode
+        self.jac_ode = jac_ode
+        self.jac_sparsity = jac_sparsity
+        self.jac_band = jac_band
+        self.jac_ode_banded = jac_ode_banded
+        self.inputs = inputs
         self.initial_conditions = initial_conditions
+        self._independent_name = independent.keys()[0]
         self.independent = independent.values()[0]
         self.args = args
         self.ode_solver_options = ode_solver_options or {}
         self.ode_integrator = ode_integrator
         self._ode_procedure = {'odeint': self._solve_odeint,
                                'ode': self._solve_ode,
-                               'odespy': self._solve_odespy}
+                               'odespy': self._solve_odespy,
+                               'solve_ivp': self._solve_ivp,
+                               'rk': self._solve_rk}
+        self.stats = None
 
     def _check_ode_integrator_setting(self, procedure):
         r"""
@@ -79,8 +299,9 @@ class OdeSolver(_Solver):
         Parameters
         -----------
         procedure: string
-            For each of the odesolvers (*odeint*, *ode* and *odespy*), the
-            available procedures are saved in *ODE_INTEGRATORS*.
+            For each of the odesolvers (*odeint*, *ode*, *odespy* and
+            *solve_ivp*), the available procedures are saved in
+            *ODE_INTEGRATORS*.
         """
         if self.ode_integrator is None:
             self.ode_integrator = STD_ODE_INTEGRATOR[procedure]
@@ -91,6 +312,45 @@ class OdeSolver(_Solver):
                                 'please choose one from the ODE_INTEGRATORS '
                                 'list.')
 
+    def _banded_system(self, args):
+        """
+        Right hand side, packed Jacobian (or None) and initial conditions of
+        the ODEs with the states in the band order, together with the index
+        to restore the original order of the states. None when the band
+        structure is not used, see jac_band.
+
+        Parameters
+        -----------
+        args: tuple
+            Extra arguments of fun_ode (and jac_ode_banded).
+        """
+        if self.jac_band is None or \
+                (self.jac_ode is not None and self.jac_ode_banded is None):
+            return None
+        order, lband, uband = self.jac_band
+        if lband + uband + 1 >= len(order):
+            return None
+
+        order = np.asarray(order)
+        inverse = np.argsort(order)
+        if np.array_equal(order, np.arange(len(order))):
+            # Already in band order: no reordering needed
+            order = inverse = slice(None)
+
+        def fun(states, independent_values):
+            return np.asarray(self.fun_ode(states[inverse],
+                                           independent_values, *args))[order]
+
+        jac = None
+        if self.jac_ode_banded is not None:
+            def jac(states, independent_values):
+                return self.jac_ode_banded(states[inverse],
+                                           independent_values, *args)
+
+        initial_conditions = np.asarray(self.initial_conditions,
+                                        dtype=float)[order]
+        return fun, jac, initial_conditions, inverse
+
     def _solve_odeint(self):
         """
         Calculate the ode equations using scipy integrate odeint solvers
@@ -111,10 +371,31 @@ class OdeSolver(_Solver):
         scipy.integrate.odeint.html
         """
 
-        res = odeint(self.fun_ode,
-                     self.initial_conditions,
-                     self.independent,
-                     args=self.args, **self.ode_solver_options)
+        options = dict(self.ode_solver_options)
+        # The infodict contains the statistics of the integration
+        options['full_output'] = True
+        banded = self._banded_system(self.args)
+        if banded is not None:
+            fun, jac, initial_conditions, inverse = banded
+            options.setdefault('Dfun', jac)
+            options.setdefault('ml', self.jac_band[1])
+            options.setdefault('mu', self.jac_band[2])
+            res, infodict = odeint(fun, initial_conditions, self.independent,
+                                   **options)
+            res = res[:, inverse]
+        else:
+            options.setdefault('Dfun', self.jac_ode)
+            res, infodict = odeint(self.fun_ode,
+                                   self.initial_conditions,
+                                   self.independent,
+                                   args=self.args, **options)
+
+        # Cumulative counts at each output value
+        counts = [int(infodict[key][-1]) if len(infodict[key]) else 0
+                  for key in ['nfe', 'nje', 'nst']]
+        self.stats = SolverStats('odeint', rhs_evaluations=counts[0],
+                                 jacobian_evaluations=counts[1],
+                                 steps=counts[2])
 
         return res
 
@@ -139,34 +420,90 @@ class OdeSolver(_Solver):
         """
         self._check_ode_integrator_setting("ode")
 
-        # Make wrapper function to
-        def wrapper(independent_values, initial_conditions, parameters):
+        options = dict(self.ode_solver_options)
+        banded = None
+        if self.ode_integrator in ['vode', 'zvode', 'lsoda']:
+            banded = self._banded_system(self.args)
+        if banded is None:
+            fun, jac = self.fun_ode, self.jac_ode
+            args = self.args
+            initial_conditions = self.initial_conditions
+            inverse = slice(None)
+        else:
+            fun, jac, initial_conditions, inverse = banded
+            args = ()
+            options.setdefault('lband', self.jac_band[1])
+            options.setdefault('uband', self.jac_band[2])
+
+        # Make wrapper function to switch the order of the input; the
+        # arguments are bound here as the Fortran integrators only pass the
+        # explicitly named arguments of the callbacks
+        def wrapper(independent_values, initial_conditions):
             r"""
             Wrapper function to switch order of input
             """
-            return self.fun_ode(initial_conditions, independent_values,
-                                parameters)
+            return fun(initial_conditions, independent_values, *args)
 
-        solver = ode(wrapper).set_integrator(self.ode_integrator,
-                                             **self.ode_solver_options)
+        jac_wrapper = None
+        if jac is not None:
+            def jac_wrapper(independent_values, initial_conditions):
+                r"""
+                Wrapper function to switch order of input
+                """
+                return jac(initial_conditions, independent_values, *args)
 
-        solver.set_initial_value(self.initial_conditions,
-                                 self.independent)
-        solver.set_f_params(*self.args)
+        solver = ode(wrapper, jac_wrapper).set_integrator(
+            self.ode_integrator, **options)
 
-        xdata = self.independent
-        timesteps = xdata[1:] - xdata[:-1]
-        model_output = []
-        xdata = []
-        model_output.append(solver.y)
-        xdata.append(solver.t)
-        for dt in timesteps:
-            if solver.successful():
-                solver.integrate(solver.t + dt)
-                model_output.append(solver.y)
-                xdata.append(solver.t)
-
-        return np.array(model_output)
+        solver.set_initial_value(initial_conditions, self.independent[0])
+
+        # The ode class only integrates up to one output value at a time
+        independent = np.asarray(self.independent, dtype=float)
+        model_output = np.empty([len(independent),
+                                 len(self.initial_conditions)])
+        model_output[0] = initial_conditions
+        # dopri5 and dop853 restart their counters at each call of integrate
+        counts = np.zeros(4, dtype=int)
+        for i in range(1, len(independent)):
+            model_output[i] = solver.integrate(independent[i])
+            if not solver.successful():
+                raise Exception('The ODE integration with ' +
+                                self.ode_integrator + ' failed at ' +
+                                str(solver.t))
+            if self.ode_integrator in ['dopri5', 'dop853']:
+                counts += solver._integrator.iwork[16:20]
+
+        self.stats = self._ode_stats(solver, counts)
+
+        return model_output[:, inverse]
+
+    def _ode_stats(self, solver, counts):
+        """
+        Statistics of an integration with scipy.integrate.ode, from the
+        work array of the Fortran integrator. For dopri5 and dop853, counts
+        are the summed counters (evaluations, steps, accepted and rejected
+        steps) of the calls of integrate.
+        """
+        backend = 'ode:' + self.ode_integrator
+        iwork = getattr(solver, '_integrator', None)
+        iwork = getattr(iwork, 'iwork', None)
+        if self.ode_integrator in ['dopri5', 'dop853']:
+            return SolverStats(backend, rhs_evaluations=int(counts[0]),
+                               jacobian_evaluations=0,
+                               steps=int(counts[2]),
+                               rejected_steps=int(counts[3]))
+        if iwork is None or len(iwork) < 13:
+            return SolverStats(backend)
+        # Cumulative counters of ODEPACK: steps, evaluations of the right
+        # hand side and of the Jacobian, and for vode the error test and
+        # convergence failures
+        rejected_steps = None
+        if self.ode_integrator in ['vode', 'zvode']:
+            rejected_steps = int(iwork[20] + iwork[21])
+        return SolverStats(backend, rhs_evaluations=int(iwork[11]),
+                           jacobian_evaluations=int(iwork[12]),
+                           steps=int(iwork[10]),
+                           rejected_steps=rejected_steps)
 
     def _solve_odespy(self):
         """
@@ -193,7 +530,13 @@ class OdeSolver(_Solver):
         self._check_ode_integrator_setting("ode")
 
         solver = odespy.__getattribute__(self.ode_integrator)
-        solver = solver(self.fun_ode)
+        # Only the implicit solvers accept a Jacobian
+        if self.jac_ode is not None and \
+                'jac' in getattr(solver, '_optional_parameters', []):
+            solver = solver(self.fun_ode, jac=self.jac_ode,
+                            jac_args=self.args)
+        else:
+            solver = solver(self.fun_ode)
         if self.ode_solver_options is not None:
             solver.set(**self.ode_solver_options)
         solver.set_initial_condition(self.initial_conditions)
@@ -202,36 +545,891 @@ class OdeSolver(_Solver):
         xdata = self.independent
         model_output, xdata = solver.solve(xdata)
 
+        # odespy does not report the statistics of the integration
+        self.stats = SolverStats('odespy:' + self.ode_integrator)
+
         return model_output
 
+    def _ivp_functions(self, args, method):
+        """
+        Right hand side and Jacobian options of the ODEs in the format of
+        scipy.integrate.solve_ivp, fun(t, y)
+
+        Parameters
+        -----------
+        args: tuple
+            Extra arguments of fun_ode (and jac_ode).
+        method: str
+            Integration method of solve_ivp.
+        """
+        def fun(independent_values, states):
+            return self.fun_ode(states, independent_values, *args)
+
+        options = {}
+        if self.jac_ode is not None and method in IVP_JACOBIAN_METHODS:
+            options['jac'] = lambda independent_values, states: \
+                self.jac_ode(states, independent_values, *args)
+        elif self.jac_sparsity is not None and \
+                method in IVP_SPARSITY_METHODS:
+            options['jac_sparsity'] = self.jac_sparsity
+        return fun, options
+
+    def _solve_ivp(self):
+        """
+        Calculate the ode equations using scipy integrate solve_ivp, with the
+        method set by ode_integrator (LSODA, BDF, Radau, RK45 or RK23)
+
+        Returns
+        -------
+        result : numpy.ndarray
+        Contains all outputs from the ode equations in function of the
+        independent values
+
+        Notes
+        ------
+        The output is evaluated at the independent values (t_eval) by the
+        solver itself, there is no Python loop over the output values. The
+        tolerances default to the ones of odeint.
+        """
+        independent = np.asarray(self.independent, dtype=float)
+
+        options = {'rtol': 1.49012e-8, 'atol': 1.49012e-8}
+        options.update(self.ode_solver_options)
+
+        banded = None
+        if self.ode_integrator == 'LSODA':
+            banded = self._banded_system(self.args)
+        if banded is None:
+            fun, jac_options = self._ivp_functions(self.args,
+                                                   self.ode_integrator)
+            initial_conditions = self.initial_conditions
+            inverse = slice(None)
+        else:
+            fun_banded, jac, initial_conditions, inverse = banded
+            fun = lambda independent_values, states: \
+                fun_banded(states, independent_values)
+            jac_options = {'lband': self.jac_band[1],
+                           'uband': self.jac_band[2]}
+            if jac is not None:
+                jac_options['jac'] = lambda independent_values, states: \
+                    jac(states, independent_values)
+        for key, value in jac_options.items():
+            options.setdefault(key, value)
+
+        result = solve_ivp(fun, (independent[0], independent[-1]),
+                           initial_conditions,
+                           method=self.ode_integrator,
+                           t_eval=independent, **options)
+        if not result.success:
+            raise Exception('The ODE integration with ' +
+                            self.ode_integrator + ' failed: ' +
+                            str(result.message))
+
+        self.stats = SolverStats('solve_ivp:' + self.ode_integrator,
+                                 rhs_evaluations=result.nfev,
+                                 jacobian_evaluations=result.njev)
+
+        return result.y.T[:, inverse]
+
+    def _rk_options(self):
+        """
+        Options of the rk procedure, see RK_OPTIONS
+        """
+        unknown = set(self.ode_solver_options) - set(RK_OPTIONS)
+        if unknown:
+            raise Exception('Unknown options of the rk procedure: ' +
+                            ', '.join(sorted(unknown)))
+        options = dict(RK_OPTIONS)
+        options.update(self.ode_solver_options)
+        return options
+
+    def _solve_rk(self):
+        """
+        Calculate the ode equations with a vectorised explicit Runge-Kutta
+        integrator: the classical fixed step rk4 or the error controlled
+        Dormand-Prince rk45.
+
+        Returns
+        -------
+        result : numpy.ndarray
+        Contains all outputs from the ode equations in function of the
+        independent values
+
+        Notes
+        ------
+        The integrators only use array arithmetic on the complete state
+        vector. For the stacked states of an ensemble (fun_ode_ensemble, see
+        Model.run_ensemble), all members are advanced in lock-step with the
+        same steps, so the cost of an (N, n_states) ensemble is one
+        integration with N times larger arrays.
+
+        rk4 takes equal steps between each pair of output values, the
+        largest ones not exceeding max_step (by default one step per output
+        interval). rk45 adapts the step size to keep the error estimate of
+        all states (of all members) within rtol and atol, without stepping
+        over the output values. Both are meant for non-stiff systems.
+        """
+        self._check_ode_integrator_setting('rk')
+        options = self._rk_options()
+
+        def fun(independent_value, states):
+            return np.asarray(self.fun_ode(states, independent_value,
+                                           *self.args), dtype=float)
+
+        independent = np.asarray(self.independent, dtype=float)
+        states = np.array(self.initial_conditions, dtype=float)
+        model_output = np.empty([len(independent), len(states)])
+        model_output[0] = states
+
+        if self.ode_integrator == 'rk4':
+            model_output[1:], counts = self._rk4(fun, independent, states,
+                                                 options)
+        else:
+            model_output[1:], counts = self._rk45(fun, independent, states,
+                                                  options)
+
+        self.stats = SolverStats('rk:' + self.ode_integrator,
+                                 rhs_evaluations=counts[0],
+                                 jacobian_evaluations=0, steps=counts[1],
+                                 rejected_steps=counts[2])
+        return model_output
+
+    @staticmethod
+    def _rk4(fun, independent, states, options):
+        """
+        Classical fourth order Runge-Kutta integration, returning the states
+        at independent[1:] and the (evaluations, steps, rejected steps)
+        """
+        output = np.empty([len(independent) - 1, len(states)])
+        steps = 0
+        for i in range(1, len(independent)):
+            interval = independent[i] - independent[i - 1]
+            substeps = max(int(np.ceil(abs(interval)/options['max_step'] -
+                                       1e-12)), 1)
+            step = interval/substeps
+            for k in range(substeps):
+                independent_value = independent[i - 1] + k*step
+                k1 = fun(independent_value, states)
+                k2 = fun(independent_value + step/2, states + step/2*k1)
+                k3 = fun(independent_value + step/2, states + step/2*k2)
+                k4 = fun(independent_value + step, states + step*k3)
+                states = states + step/6*(k1 + 2*k2 + 2*k3 + k4)
+            steps += substeps
+            output[i - 1] = states
+        return output, (4*steps, steps, 0)
+
+    @staticmethod
+    def _rk45(fun, independent, states, options):
+        """
+        Dormand-Prince 5(4) integration with step size control, returning
+        the states at independent[1:] and the (evaluations, steps, rejected
+        steps)
+        """
+        rtol, atol = options['rtol'], options['atol']
+        max_step = options['max_step']
+        direction = np.sign(independent[-1] - independent[0]) or 1.
+
+        independent_value = independent[0]
+        derivative = fun(independent_value, states)
+        evaluations, steps, rejected = 1, 0, 0
+
+        proposal = options['first_step']
+        if proposal is None:
+            # Rough estimate of the initial step from the first derivative
+            scale = atol + rtol*np.abs(states)
+            norm_states = np.max(np.abs(states)/scale)
+            norm_derivative = np.max(np.abs(derivative)/scale)
+            if norm_states < 1e-5 or norm_derivative < 1e-5:
+                proposal = 1e-6
+            else:
+                proposal = 0.01*norm_states/norm_derivative
+        proposal = min(abs(proposal), max_step)
+
+        output = np.empty([len(independent) - 1, len(states)])
+        stages = np.empty([7, len(states)])
+        for i in range(1, len(independent)):
+            end = independent[i]
+            while direction*(end - independent_value) > 0.:
+                # Do not step over the next output value
+                remaining = abs(end - independent_value)
+                step = min(proposal, remaining)
+                signed_step = direction*step
+                stages[0] = derivative
+                for k in range(1, 6):
+                    stages[k] = fun(independent_value +
+                                    DOPRI_C[k]*signed_step,
+                                    states + signed_step *
+                                    np.dot(DOPRI_A[k], stages[:k]))
+                new_states = states + signed_step*np.dot(DOPRI_B, stages[:6])
+                stages[6] = fun(independent_value + signed_step, new_states)
+                evaluations += 6
+
+                scale = atol + rtol*np.maximum(np.abs(states),
+                                               np.abs(new_states))
+                error = np.max(np.abs(signed_step*np.dot(DOPRI_E, stages)) /
+                               scale)
+                if not np.isfinite(error):
+                    raise Exception('The ODE integration with rk45 failed '
+                                    'at ' + str(independent_value))
+                if error <= 1.:
+                    independent_value = end if step == remaining else \
+                        independent_value + signed_step
+                    states = new_states
+                    # First same as last: the last stage is the derivative
+                    # at the start of the next step
+                    derivative = stages[6]
+                    steps += 1
+                    factor = 10. if error == 0. else \
+                        min(10., 0.9*error**-0.2)
+                    if step < proposal:
+                        # A step shortened to reach the output value does
+                        # not reduce the next step
+                        factor = max(factor*step/proposal, 1.)
+                        step = proposal
+                    proposal = min(step*factor, max_step)
+                else:
+                    rejected += 1
+                    proposal = step*max(0.2, 0.9*error**-0.2)
+                    if proposal < 1e-14*max(abs(independent_value), 1.):
+                        raise Exception('The ODE integration with rk45 '
+                                        'failed at ' +
+                                        str(independent_value) + ': the '
+                                        'step size became too small.')
+            output[i - 1] = states
+        return output, (evaluations, steps, rejected)
+
+    def _segments(self):
+        """
+        (start, end) of the integration segments between the breakpoints of
+        the input signals
+        """
+        independent = np.asarray(self.independent, dtype=float)
+        edges = np.concatenate([independent[:1],
+                                get_breakpoints(self.inputs, independent),
+                                independent[-1:]])
+        return zip(edges[:-1], edges[1:])
+
+    def _segment_args(self, start):
+        """
+        Arguments of fun_ode for the segment starting at start
+        """
+        if self.inputs:
+            return self.args + (segment_inputs(self.inputs, start),)
+        return self.args
+
+    def _solve_segments(self, procedure):
+        """
+        Integrate the ODEs segment by segment, restarting the integrator at
+        each breakpoint of the input signals.
+        """
+        independent = np.asarray(self.independent, dtype=float)
+        output = np.empty([len(independent), len(self.initial_conditions)])
+        state = self.initial_conditions
+        stats = SolverStats(solves=0)
+
+        segments = self._segments()
+        for i, (start, end) in enumerate(segments):
+            if i == len(segments) - 1:
+                mask = independent >= start
+            else:
+                mask = (independent >= start) & (independent < end)
+            points = independent[mask]
+            segment_independent = np.unique(np.concatenate([[start], points,
+                                                            [end]]))
+
+            solver = OdeSolver(self.fun_ode, state,
+                               {self._independent_name: segment_independent},
+                               self._segment_args(start),
+                               ode_solver_options=self.ode_solver_options,
+                               ode_integrator=self.ode_integrator,
+                               jac_ode=self.jac_ode,
+                               jac_sparsity=self.jac_sparsity,
+                               jac_band=self.jac_band,
+                               jac_ode_banded=self.jac_ode_banded)
+            segment_output = solver._ode_procedure[procedure]()
+            stats = stats + solver.stats
+
+            output[mask] = segment_output[
+                np.searchsorted(segment_independent, points)]
+            state = segment_output[-1]
+
+        self.stats = stats
+        return output
+
+    def solve_dense(self, method='LSODA', **kwargs):
+        """
+        Integrate the ODEs over the horizon of the independent values and
+        keep the continuous extension of the integrator, such that the
+        states can be evaluated at any independent value in the horizon by
+        interpolation.
+
+        Parameters
+        -----------
+        method: str
+            Integration method of scipy.integrate.solve_ivp, e.g. 'LSODA',
+            'BDF', 'Radau', 'RK45' or 'DOP853'.
+        kwargs:
+            Extra options of solve_ivp, e.g. rtol and atol.
+
+        Returns
+        --------
+        solution: DenseOdeSolution
+            Continuous solution of the ODEs.
+        """
+        options = {'rtol': 1.49012e-8, 'atol': 1.49012e-8}
+        options.update(kwargs)
+
+        state = self.initial_conditions
+        steps = []
+        interpolants = []
+        segments = []
+        stats = SolverStats(solves=0)
+        start_time = time()
+        for start, end in self._segments():
+            args = self._segment_args(start)
+            fun, jac_options = self._ivp_functions(args, method)
+
+            segment_options = dict(options)
+            for key, value in jac_options.items():
+                segment_options.setdefault(key, value)
+
+            result = solve_ivp(fun, (start, end), state, method=method,
+                               dense_output=True, **segment_options)
+            if not result.success:
+                raise Exception('The dense ODE integration failed: ' +
+                                str(result.message))
+
+            stats = stats + SolverStats('solve_ivp:' + method,
+                                        rhs_evaluations=result.nfev,
+                                        jacobian_evaluations=result.njev,
+                                        steps=len(result.sol.ts) - 1,
+                                        solves=0)
+            steps.append(result.sol.ts[:-1])
+            interpolants += result.sol.interpolants
+            segments.append((start, args))
+            state = result.y[:, -1]
+        steps.append([end])
+        stats.wall_time = time() - start_time
+        stats.solves = 1
+        self.stats = stats
+
+        solution = OdeSolution(np.concatenate(steps), interpolants)
+        return DenseOdeSolution(solution, self.fun_ode, segments)
+
+    def _jacobian(self, states, independent_value, args):
+        """
+        Jacobian of the ODEs, jac_ode or else a central finite difference
+        approximation
+        """
+        states = np.asarray(states, dtype=float)
+        if self.jac_ode is not None:
+            return np.asarray(self.jac_ode(states, independent_value, *args),
+                              dtype=float)
+        return finite_difference_jacobian(self.fun_ode, states,
+                                          independent_value, args)
+
+    def stiffness_ratio(self, probe_points=5):
+        """
+        Estimate the stiffness of the ODEs over the horizon of the independent
+        values.
+
+        A coarse probe integration (LSODA, rtol 1e-3) gives the states at
+        probe_points values of the independent. At each of them, the decay
+        rates of the system are the negative real parts of the eigenvalues
+        of the Jacobian. The stiffness ratio is the largest ratio of the
+        fastest to the slowest decay rate, the slowest rate being at least
+        one over the horizon.
+
+        Parameters
+        -----------
+        probe_points: int
+            Number of independent values to evaluate the Jacobian at.
+
+        Returns
+        --------
+        ratio: float
+            Stiffness ratio, infinite when the probe integration failed.
+        """
+        independent = np.asarray(self.independent, dtype=float)
+        horizon = independent[-1] - independent[0]
+        probe_independent = np.linspace(independent[0], independent[-1],
+                                        probe_points)
+        probe = OdeSolver(self.fun_ode, self.initial_conditions,
+                          {self._independent_name: probe_independent},
+                          self.args,
+                          ode_solver_options={'rtol': 1e-3, 'atol': 1e-6},
+                          ode_integrator='LSODA', jac_ode=self.jac_ode,
+                          inputs=self.inputs)
+        try:
+            states = probe.solve(procedure='solve_ivp')
+        except Exception:
+            return np.inf
+
+        ratio = 1.
+        for independent_value, state in zip(probe_independent, states):
+            jacobian = self._jacobian(state, independent_value,
+                                      self._segment_args(independent_value))
+            rates = -np.real(np.linalg.eigvals(jacobian))
+            rates = rates[rates > 0.]
+            if rates.size:
+                ratio = max(ratio, rates.max()/max(rates.min(), 1./horizon))
+        return ratio
+
+    def select_integrator(self, threshold=STIFFNESS_THRESHOLD):
+        """
+        Select the procedure and integrator for the ODEs: odeint (LSODA with
+        the Jacobian) for stiff systems and the explicit Runge-Kutta dopri5
+        integrator of ode otherwise, see stiffness_ratio.
+
+        Returns
+        --------
+        procedure, ode_integrator: str
+            Arguments of solve and of the OdeSolver, see AUTO_INTEGRATORS.
+        """
+        return AUTO_INTEGRATORS[self.stiffness_ratio() > threshold]
+
+    def _imaginary_scale(self):
+        """
+        Largest imaginary part of the initial conditions and the arguments
+        of fun_ode (including the values of dicts, e.g. the parameters), 0.
+        when all of them are real.
+        """
+        values = [self.initial_conditions]
+        for arg in self.args:
+            values.extend(arg.values() if isinstance(arg, dict) else [arg])
+        imaginary = [np.max(np.abs(np.imag(value))) for value in values
+                     if np.iscomplexobj(value)]
+        return max(imaginary) if imaginary else 0.
+
+    def _complex_system(self, scale):
+        """
+        Real system of twice the number of ODEs for complex states and
+        arguments: the real parts of the states followed by their imaginary
+        parts divided by scale, so both are of the same order of magnitude
+        and the tolerances of the integrators apply to either of them.
+        """
+        n_states = len(self.initial_conditions)
+        args = tuple(self.args)
+
+        def to_complex(states):
+            return states[:n_states] + 1j*scale*states[n_states:]
+
+        def fun(states, independent_value, *extra_args):
+            derivatives = np.asarray(self.fun_ode(to_complex(states),
+                                                  independent_value,
+                                                  *(args + extra_args)),
+                                     dtype=complex)
+            return np.concatenate([derivatives.real, derivatives.imag/scale])
+
+        jac = None
+        if self.jac_ode is not None:
+            def jac(states, independent_value, *extra_args):
+                jacobian = np.asarray(self.jac_ode(to_complex(states),
+                                                   independent_value,
+                                                   *(args + extra_args)),
+                                      dtype=complex)
+                return np.vstack([
+                    np.hstack([jacobian.real, -scale*jacobian.imag]),
+                    np.hstack([jacobian.imag/scale, jacobian.real])])
+
+        return fun, jac, to_complex
+
+    def _solve_complex(self, scale, procedure, **kwargs):
+        """
+        Integrate the ODEs with complex initial conditions or arguments by
+        integrating the real system of _complex_system with the procedure.
+        As the imaginary parts are scaled, it can be used for complex-step
+        derivatives, with imaginary parts far below the tolerances.
+        """
+        fun, jac, to_complex = self._complex_system(scale)
+        initial_conditions = np.asarray(self.initial_conditions,
+                                        dtype=complex)
+        solver = OdeSolver(fun, np.concatenate([initial_conditions.real,
+                                                initial_conditions.imag /
+                                                scale]),
+                           {self._independent_name: self.independent}, (),
+                           ode_solver_options=dict(self.ode_solver_options),
+                           ode_integrator=self.ode_integrator, jac_ode=jac,
+                           inputs=self.inputs)
+        output = solver.solve(procedure=procedure, **kwargs)
+        self.stats = solver.stats
+
+        return to_complex(output.T).T
+
     def solve(self, procedure='odeint', **kwargs):
         """
         Calculate the ode equations using scipy integrate odeint solvers
 
+        Parameters
+        -----------
+        procedure: str
+            'odeint', 'ode', 'odespy', 'solve_ivp', 'rk' or 'auto'. The
+            latter selects the procedure and integrator based on the
+            stiffness of the system, see select_integrator. 'rk' uses the
+            vectorised Runge-Kutta integrators rk4 and rk45, see _solve_rk.
+            With complex initial conditions or arguments, the procedure
+            integrates a real system for the real and imaginary parts of the
+            states, see _solve_complex.
+
         Returns
         -------
         result : pd.DataFrame
             Contains all outputs from the ode equations in function of the
             independent values
         """
+        scale = self._imaginary_scale()
+        if scale:
+            return self._solve_complex(scale, procedure, **kwargs)
+
+        if procedure == 'auto':
+            procedure, self.ode_integrator = self.select_integrator()
         self._check_ode_integrator_setting(procedure)
 
         self.ode_solver_options.update(kwargs)
 
-        output = self._ode_procedure[procedure]()
+        start_time = time()
+        if self.inputs:
+            output = self._solve_segments(procedure)
+        else:
+            output = self._ode_procedure[procedure]()
+        self.stats.wall_time = time() - start_time
+        self.stats.solves = 1
 
         return output
 
+    def solve_chunks(self, chunk_size, procedure='odeint', **kwargs):
+        """
+        Integrate the ODEs chunk by chunk of the independent values, such that
+        only one chunk of the output is in memory at a time. Each chunk is
+        integrated from the last value of the previous chunk onwards, starting
+        from its (integrated) states.
+
+        Parameters
+        -----------
+        chunk_size: int
+            Number of independent values in each chunk.
+        procedure: str
+            ODE solver procedure, see solve.
+
+        Yields
+        -------
+        independent: numpy.ndarray
+            Independent values of the chunk.
+        output: numpy.ndarray
+            Outputs of the ode equations for the independent values of the
+            chunk.
+        """
+        if chunk_size < 1:
+            raise Exception('The chunk size should be at least 1.')
+        if procedure == 'auto':
+            procedure, self.ode_integrator = self.select_integrator()
+        self.ode_solver_options.update(kwargs)
+
+        independent = np.asarray(self.independent, dtype=float)
+        state = np.asarray(self.initial_conditions, dtype=float)
+        self.stats = SolverStats(solves=0)
+        for start in range(0, len(independent), chunk_size):
+            chunk = independent[start:start + chunk_size]
+            if start == 0:
+                chunk_independent = chunk
+            else:
+                # Continue from the last value of the previous chunk
+                chunk_independent = np.concatenate([independent[start - 1:
+                                                                start],
+                                                    chunk])
+            if len(chunk_independent) == 1:
+                output = state[np.newaxis, :]
+            else:
+                solver = OdeSolver(self.fun_ode, state,
+                                   {self._independent_name:
+                                    chunk_independent},
+                                   self.args,
+                                   ode_solver_options=self.ode_solver_options,
+                                   ode_integrator=self.ode_integrator,
+                                   jac_ode=self.jac_ode, inputs=self.inputs,
+                                   jac_sparsity=self.jac_sparsity,
+                                   jac_band=self.jac_band,
+                                   jac_ode_banded=self.jac_ode_banded)
+                output = solver.solve(procedure=procedure)
+                self.stats = self.stats + solver.stats
+            state = output[-1]
+            yield chunk, output[len(chunk_independent) - len(chunk):]
+
+
+class DenseOdeSolution(object):
+    r"""
+    Continuous solution of the ODEs over the integration horizon, as
+    returned by OdeSolver.solve_dense.
+
+    The states are evaluated with the continuous extension of the
+    integrator. The interpolation error is estimated as the difference with
+    a cubic Hermite interpolant through the states and the derivatives at the
+    steps of the integrator. As the Hermite interpolant is the less accurate
+    one, this is a conservative estimate.
+
+    Parameters
+    -----------
+    solution: scipy.integrate.OdeSolution
+        Continuous extension of the integrator.
+    fun_ode: function
+        Function to calculate the derivatives, fun_ode(odes, t, *args).
+    segments: list
+        (start, args) for each integration segment, with args the extra
+        arguments of fun_ode in that segment.
+    """
+    def __init__(self, solution, fun_ode, segments):
+        self.solution = solution
+        self.fun_ode = fun_ode
+        self.segments = segments
+        self.t_min = min(solution.t_min, solution.t_max)
+        self.t_max = max(solution.t_min, solution.t_max)
+
+        self._steps = None
+        self._states = None
+        self._derivatives = None
+
+    def _check_horizon(self, independent):
+        if np.any(independent < self.t_min) or \
+                np.any(independent > self.t_max):
+            raise Exception('The independent values should be inside the '
+                            'integration horizon [{0}, {1}].'.format(
+                                self.t_min, self.t_max))
+
+    def __call__(self, independent):
+        r"""
+        States at the given independent values
+
+        Returns
+        --------
+        states: numpy.ndarray
+            Array with shape (number of independent values, number of ODEs)
+        """
+        independent = np.atleast_1d(np.asarray(independent, dtype=float))
+        self._check_horizon(independent)
+        return self.solution(independent).T
+
+    def hermite(self, independent):
+        r"""
+        States at the given independent values by a cubic Hermite
+        interpolation between the integrator steps
+        """
+        independent = np.atleast_1d(np.asarray(independent, dtype=float))
+        self._check_horizon(independent)
+        if self._steps is None:
+            self._steps = np.asarray(self.solution.ts)
+            self._states = self.solution(self._steps).T
+            # The derivatives at both ends of each step are calculated with
+            # the arguments (inputs) of the segment containing the step
+            starts = [start for start, args in self.segments]
+            middle = (self._steps[:-1] + self._steps[1:])/2.
+            segment = np.searchsorted(starts, middle, side='right') - 1
+            self._derivatives = np.array(
+                [[self.fun_ode(self._states[k + end], self._steps[k + end],
+                               *self.segments[segment[k]][1])
+                  for end in [0, 1]] for k in range(len(middle))])
+
+        i = np.clip(np.searchsorted(self._steps, independent) - 1, 0,
+                    len(self._steps) - 2)
+        step = (self._steps[i + 1] - self._steps[i])[:, None]
+        s = (independent - self._steps[i])[:, None]/step
+        h00 = 2*s**3 - 3*s**2 + 1
+        h10 = s**3 - 2*s**2 + s
+        h01 = -2*s**3 + 3*s**2
+        h11 = s**3 - s**2
+
+        return (h00*self._states[i] + h10*step*self._derivatives[i, 0] +
+                h01*self._states[i + 1] + h11*step*self._derivatives[i, 1])
+
+    def error(self, independent):
+        r"""
+        Estimate of the (absolute) interpolation error of the states at the
+        given independent values
+        """
+        return np.abs(self(independent) - self.hermite(independent))
+
+
+class SteadyStateSolver(_Solver):
+    r"""
+    Solve the steady state of the ODEs, fun_ode(x, t, *args) = 0, directly
+    instead of integrating the ODEs over a long horizon.
+
+    Newton's method (with a backtracking line search) is tried first. When
+    it fails, e.g. because the Jacobian is singular due to conserved
+    quantities, the steady state is searched by pseudo-transient
+    continuation: implicit Euler steps (I/dt - J) dx = f with a time step dt
+    which grows as the residual decreases (at least doubling). These steps keep the conserved
+    quantities of the initial guess.
+
+    Parameters
+    -----------
+    fun_ode: function
+        Function to calculate the derivatives, fun_ode(odes, t, *args).
+    initial_guess: array_like
+        Initial guess of the states.
+    independent_value: float
+        Value of the independent the derivatives are evaluated at (e.g. for
+        the inputs of the model).
+    args: tuple
+        Extra arguments of fun_ode (and jac_ode).
+    jac_ode: function|None
+        Jacobian of fun_ode with the same signature, finite differences are
+        used when None.
+    tol: float
+        The steady state is found when the largest absolute derivative is
+        below tol.
+    max_iter: int
+        Maximum number of Newton iterations; pseudo-transient continuation
+        takes at most 20 times as many steps.
+    first_step: float
+        Initial time step dt of the pseudo-transient continuation.
+
+    Attributes
+    -----------
+    stats: SolverStats|None
+        Statistics of the last solve, with as backend 'steady_state:newton'
+        or 'steady_state:ptc'; the steps are the iterations.
+    """
+    def __init__(self, fun_ode, initial_guess, independent_value, args,
+                 jac_ode=None, tol=1e-10, max_iter=50, first_step=1e-2):
+        self.fun_ode = fun_ode
+        self.jac_ode = jac_ode
+        self.initial_guess = np.asarray(initial_guess, dtype=float)
+        self.independent_value = independent_value
+        self.args = args
+        self.tol = tol
+        self.max_iter = max_iter
+        self.first_step = first_step
+        self.stats = None
+        self._counts = None
+
+    def _fun(self, states):
+        self._counts[0] += 1
+        return np.asarray(self.fun_ode(states, self.independent_value,
+                                       *self.args), dtype=float)
+
+    def _jac(self, states):
+        if self.jac_ode is not None:
+            self._counts[1] += 1
+            return np.asarray(self.jac_ode(states, self.independent_value,
+                                           *self.args), dtype=float)
+        self._counts[0] += 2*len(states)
+        self._counts[1] += 1
+        return finite_difference_jacobian(self.fun_ode, states,
+                                          self.independent_value, self.args)
+
+    def _newton(self):
+        """
+        Damped Newton iterations, returns the states or None when not
+        converged
+        """
+        states = self.initial_guess.copy()
+        residual = self._fun(states)
+        for iteration in range(self.max_iter):
+            if np.max(np.abs(residual)) <= self.tol:
+                return states
+            try:
+                step = np.linalg.solve(self._jac(states), -residual)
+            except np.linalg.LinAlgError:
+                return None
+            self._counts[2] += 1
+
+            # Backtracking on the norm of the residual
+            norm = np.linalg.norm(residual)
+            damping = 1.
+            while damping > 1e-4:
+                new_states = states + damping*step
+                new_residual = self._fun(new_states)
+                if np.all(np.isfinite(new_residual)) and \
+                        np.linalg.norm(new_residual) < norm:
+                    break
+                self._counts[3] += 1
+                damping /= 2.
+            else:
+                return None
+            states, residual = new_states, new_residual
+        if np.max(np.abs(residual)) <= self.tol:
+            return states
+        return None
+
+    def _pseudo_transient(self):
+        """
+        Pseudo-transient continuation with switched evolution relaxation
+        of the time step, returns the states or None when not converged
+        """
+        states = self.initial_guess.copy()
+        residual = self._fun(states)
+        norm = np.linalg.norm(residual)
+        time_step = self.first_step
+        identity = np.eye(len(states))
+        for iteration in range(20*self.max_iter):
+            if np.max(np.abs(residual)) <= self.tol:
+                return states
+            try:
+                step = np.linalg.solve(identity/time_step -
+                                       self._jac(states), residual)
+            except np.linalg.LinAlgError:
+                return None
+            new_states = states + step
+            new_residual = self._fun(new_states)
+            new_norm = np.linalg.norm(new_residual)
+            if not np.isfinite(new_norm):
+                # Reject the step, continue with a smaller time step
+                self._counts[3] += 1
+                time_step /= 10.
+                continue
+            self._counts[2] += 1
+            # Switched evolution relaxation, with at least a doubling of the
+            # time step while the residual decreases
+            ratio = norm/max(new_norm, 1e-300)
+            if ratio >= 1.:
+                ratio = max(ratio, 2.)
+            time_step = min(time_step*ratio, 1e15)
+            states, residual, norm = new_states, new_residual, new_norm
+        if np.max(np.abs(residual)) <= self.tol:
+            return states
+        return None
+
+    def solve(self):
+        """
+        Calculate the steady state of the ODEs
+
+        Returns
+        -------
+        states : numpy.ndarray
+            States for which the derivatives are zero (within tol).
+        """
+        start_time = time()
+        # Evaluations of fun_ode and jac_ode, iterations and rejected steps
+        self._counts = [0, 0, 0, 0]
+        backend = 'steady_state:newton'
+        states = self._newton()
+        if states is None:
+            backend = 'steady_state:ptc'
+            states = self._pseudo_transient()
+        self.stats = SolverStats(backend, rhs_evaluations=self._counts[0],
+                                 jacobian_evaluations=self._counts[1],
+                                 steps=self._counts[2],
+                                 rejected_steps=self._counts[3],
+                                 wall_time=time() - start_time)
+        if states is None:
+            raise Exception('No steady state found: neither Newton\'s '
+                            'method nor the pseudo-transient continuation '
+                            'converged to tol=' + str(self.tol) + '.')
+        return states
+
 
 class AlgebraicSolver(_Solver):
     """
-    Class to calculate the algebraic equations/models
+    Class to calculate the algebraic equations/models. The generated fun_alg
+    only uses numpy operations, so complex parameters or ODE values give
+    the complex outputs used for complex-step derivatives.
     """
     def __init__(self, fun_alg, independent, args, **kwargs):
         self.fun_alg = fun_alg
         self.independent = independent
         self.args = args
         self.kwargs = kwargs
+        self.stats = None
 
     def _solve_algebraic(self):
         """
@@ -251,7 +1449,39 @@ class AlgebraicSolver(_Solver):
             Contains all outputs from the algebraic equation in function of the
             independent values
         """
-        return self._solve_algebraic()
+        start_time = time()
+        output = self._solve_algebraic()
+        self.stats = SolverStats('algebraic', wall_time=time() - start_time)
+        return output
+
+    def solve_chunks(self, chunk_size):
+        """
+        Calculate the algebraic equations chunk by chunk of the (single)
+        independent values.
+
+        Parameters
+        -----------
+        chunk_size: int
+            Number of independent values in each chunk.
+
+        Yields
+        -------
+        output: numpy.ndarray
+            Outputs of the algebraic equations for the independent values of
+            the chunk.
+        """
+        if len(self.independent) != 1:
+            raise Exception('Chunks can only be calculated for a single '
+                            'independent.')
+        name, independent = self.independent.items()[0]
+        self.stats = SolverStats(solves=0)
+        for start in range(0, len(independent), chunk_size):
+            chunk = {name: independent[start:start + chunk_size]}
+            solver = AlgebraicSolver(self.fun_alg, chunk, self.args,
+                                     **self.kwargs)
+            output = solver.solve()
+            self.stats = self.stats + solver.stats
+            yield output
 
 
 class HybridSolver(_Solver):
@@ -260,13 +1490,18 @@ class HybridSolver(_Solver):
     """
 
     def __init__(self, fun_ode, fun_alg, initial_cond, independent_values,
-                 args, **kwargs):
+                 args, jac_ode=None, inputs=None, **kwargs):
 
         self.fun_ode = fun_ode
         self.fun_alg = fun_alg
+        self.jac_ode = jac_ode
+        self.inputs = inputs
+        # Other options of the OdeSolver, e.g. ode_integrator or jac_band
+        self.ode_kwargs = kwargs
         self.initial_conditions = initial_cond
         self.independent = independent_values
         self.args = args
+        self.stats = None
 
     def solve(self, procedure="odeint", **kwargs):
         """
@@ -279,16 +1514,56 @@ class HybridSolver(_Solver):
         Contains all outputs from both odes and algebraics
         """
         odesolver = OdeSolver(self.fun_ode, self.initial_conditions,
-                              self.independent, self.args)
+                              self.independent, self.args,
+                              jac_ode=self.jac_ode, inputs=self.inputs,
+                              **self.ode_kwargs)
         # Solving ODEs
-        odesolver.ode_solver_options.update(kwargs)
-        ode_output = odesolver._ode_procedure[procedure]()
+        ode_output = odesolver.solve(procedure=procedure, **kwargs)
 
         # Solving Algebraic equations
-        algsolver = AlgebraicSolver(self.fun_alg, self.independent, self.args,
+        args = self.args
+        if self.inputs:
+            args = args + (self.inputs,)
+        algsolver = AlgebraicSolver(self.fun_alg, self.independent, args,
                                     ode_values=ode_output)
         alg_output = algsolver.solve()
 
+        # One solve of the hybrid system
+        self.stats = odesolver.stats + algsolver.stats
+        self.stats.solves = 1
+
         result = np.concatenate((alg_output, ode_output), axis=1)
 
         return result
+
+    def solve_chunks(self, chunk_size, procedure="odeint", **kwargs):
+        """
+        Solve hybrid system of odes and algebraic equations chunk by chunk of
+        the independent values, see OdeSolver.solve_chunks. The algebraic
+        equations are calculated for each chunk of the odes.
+
+        Yields
+        -------
+        result : numpy.ndarray
+        Contains all outputs from both odes and algebraics for the
+        independent values of the chunk
+        """
+        odesolver = OdeSolver(self.fun_ode, self.initial_conditions,
+                              self.independent, self.args,
+                              jac_ode=self.jac_ode, inputs=self.inputs,
+                              **self.ode_kwargs)
+        args = self.args
+        if self.inputs:
+            args = args + (self.inputs,)
+        name = self.independent.keys()[0]
+        alg_stats = SolverStats('algebraic', solves=0)
+
+        for independent, ode_output in odesolver.solve_chunks(
+                chunk_size, procedure=procedure, **kwargs):
+            algsolver = AlgebraicSolver(self.fun_alg, {name: independent},
+                                        args, ode_values=ode_output)
+            alg_output = algsolver.solve()
+            alg_stats.wall_time += algsolver.stats.wall_time
+            self.stats = odesolver.stats + alg_stats
+
+            yield np.concatenate((alg_output, ode_output), axis=1)
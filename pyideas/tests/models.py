@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Models shared by the tests
+"""
+from __future__ import division
+
+import numpy as np
+
+from pyideas import Model
+
+
+def michaelis_menten(n_independent=50, variables_of_interest=None,
+                     inputs=None, system=None, parameters=None):
+    """
+    Michaelis-Menten kinetics of the conversion of S into P, with the
+    enzyme concentration E as parameter or, with inputs, as input.
+    """
+    if system is None:
+        system = {'v': 'Vmax*S/(Km + S)',
+                  'dS': '-v*E',
+                  'dP': 'v*E'}
+    if parameters is None:
+        parameters = {'Km': 150., 'Vmax': 0.768, 'E': 0.68}
+    parameters = {par: value for par, value in parameters.items()
+                  if par not in (inputs or {})}
+
+    model = Model('Michaelis-Menten', system, parameters)
+    model.inputs = inputs
+    model.initial_conditions = {'S': 500., 'P': 0.}
+    model.independent = {'t': np.linspace(0, 2500, n_independent)}
+    if variables_of_interest is not None:
+        model.variables_of_interest = variables_of_interest
+    return model
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the adjoint gradient of the objective function
+"""
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_allclose
+
+from pyideas import AlgebraicModel, ParameterOptimisation, Measurements
+
+from models import michaelis_menten
+
+
+def _michaelis_menten():
+    model = michaelis_menten(n_independent=26,
+                             variables_of_interest=['S', 'v'])
+    model.initialize_model()
+    return model
+
+
+def _measurements(model):
+    time = model.independent.values()[0]
+    data = model._run() * (1 + 0.05*np.sin(time))[:, np.newaxis]
+    data = pd.DataFrame(data, index=pd.Index(time, name='t'),
+                        columns=model.variables_of_interest)
+    measurements = Measurements(data)
+    measurements.add_measured_errors({'S': 10., 'v': 0.01},
+                                     method='absolute')
+    return measurements
+
+
+def _finite_difference(optim, dof, step=1e-6):
+    gradient = []
+    values = dict(optim.model.parameters)
+    values.update(getattr(optim.model, 'initial_conditions', {}))
+    values = optim._dof_dict_to_array(values)
+    for i in range(len(dof)):
+        perturbation = np.zeros(len(dof))
+        perturbation[i] = step*values[i]
+        forward = optim._obj_fun('wsse', parray=values + perturbation)
+        backward = optim._obj_fun('wsse', parray=values - perturbation)
+        gradient.append((forward - backward)/(2*perturbation[i]))
+    optim._dof_array_to_model(values)
+    return np.array(gradient)
+
+
+def test_adjoint_gradient():
+    model = _michaelis_menten()
+    dof = ['Km', 'Vmax', 'E', 'S']
+    optim = ParameterOptimisation(model, _measurements(model), optim_par=dof)
+
+    gradient = optim.get_objective_gradient()
+    assert model.last_solve_stats.backend == 'adjoint:LSODA'
+    assert list(gradient.index) == ['Km', 'Vmax', 'E', 'S']
+    assert_allclose(gradient.values, _finite_difference(optim, dof),
+                    rtol=1e-4)
+
+
+def test_adjoint_optimisation():
+    model = _michaelis_menten()
+    measurements = _measurements(model)
+    model.parameters = {'Km': 100., 'Vmax': 1.}
+    optim = ParameterOptimisation(model, measurements,
+                                  optim_par=['Km', 'Vmax'])
+
+    nelder_mead = optim.local_optimize(method='Nelder-Mead')
+    model.parameters = {'Km': 100., 'Vmax': 1.}
+    adjoint = optim.local_optimize(method='BFGS', jac='adjoint')
+    assert_allclose(adjoint.x, nelder_mead.x, rtol=1e-5)
+    assert adjoint.fun <= nelder_mead.fun*(1 + 1e-6)
+
+
+def test_adjoint_algebraic():
+    system = {'W': 'W0*Wf/(W0+(Wf-W0)*exp(-mu*t))'}
+    model = AlgebraicModel('logistic', system,
+                           {'W0': 2.08, 'Wf': 9.75, 'mu': 0.066}, ['t'])
+    model.independent = {'t': np.array([0., 20., 29., 41., 50., 65., 72.])}
+    data = pd.DataFrame({'W': [2.3, 4.5, 6.6, 7.6, 9., 9.1, 9.4]},
+                        index=pd.Index(model.independent['t'], name='t'))
+    measurements = Measurements(data)
+    measurements.add_measured_errors({'W': 1.}, method='absolute')
+
+    optim = ParameterOptimisation(model, measurements)
+    dof = optim.dof
+    assert_allclose(optim.get_objective_gradient().values,
+                    _finite_difference(optim, dof), rtol=1e-5)
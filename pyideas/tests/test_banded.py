@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the banded Jacobian of compartment models
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import Model
+from pyideas.sensitivitydefinition import get_band_ordering
+
+
+def _tanks_in_series(number_of_tanks=30):
+    system = {'C_in': '5/(1+exp(-5*(t-10)))',
+              'dC0': 'Q_in*(C_in - C0)/Vol'}
+    for i in range(1, number_of_tanks):
+        system['dC' + str(i)] = ('Q_in*(C' + str(i - 1) + ' - C' + str(i) +
+                                 ')/Vol')
+    parameters = {'Q_in': 5., 'Vol': 1e2/number_of_tanks}
+
+    model = Model('tanks in series', system, parameters)
+    model.initial_conditions = dict(('C' + str(i), 0.)
+                                    for i in range(number_of_tanks))
+    model.independent = {'t': np.linspace(0, 50, 101)}
+    model.initialize_model()
+    return model
+
+
+def test_band_ordering():
+    # chain 0 -> 2 -> 1
+    sparsity = np.array([[1, 0, 0],
+                         [0, 1, 1],
+                         [1, 0, 1]])
+    order, lband, uband = get_band_ordering(sparsity)
+    assert lband + uband == 1
+    reordered = sparsity[np.ix_(order, order)]
+    assert np.all(np.triu(reordered, 2) == 0)
+    assert np.all(np.tril(reordered, -2) == 0)
+
+
+def test_banded_jacobian():
+    model = _tanks_in_series()
+    banded = model.jac_ode_banded
+    assert banded.lband + banded.uband == 1
+
+    # packed format of the Jacobian of the states in band order
+    states = np.random.RandomState(0).uniform(0, 5, 30)
+    dense = model.jac_ode(states, 12., model.parameters)
+    packed = banded(states, 12., model.parameters)
+    dense = dense[np.ix_(banded.order, banded.order)]
+    for i in range(30):
+        for j in range(max(0, i - banded.lband),
+                       min(30, i + banded.uband + 1)):
+            assert_allclose(packed[banded.uband + i - j, j], dense[i, j])
+
+
+def test_banded_solvers():
+    model = _tanks_in_series()
+    model.use_banded_jacobian = False
+    reference = model._run()
+    model.use_banded_jacobian = True
+
+    assert_allclose(model._run(), reference, rtol=1e-5, atol=1e-8)
+    model.ode_integrator = 'vode'
+    assert_allclose(model._run(procedure='ode'), reference, rtol=1e-4,
+                    atol=1e-6)
+    model.ode_integrator = 'LSODA'
+    assert_allclose(model._run(procedure='solve_ivp'), reference, rtol=1e-5,
+                    atol=1e-8)
+    # finite difference approximation of the band
+    model.ode_integrator = None
+    model.use_jacobian = False
+    assert_allclose(model._run(), reference, rtol=1e-5, atol=1e-8)
+
+
+def test_banded_ensemble():
+    model = _tanks_in_series(5)
+    volumes = np.array([10., 20., 40.])
+    output = model.run_ensemble(parameters={'Vol': volumes})
+    model.use_banded_jacobian = False
+    assert_allclose(output, model.run_ensemble(parameters={'Vol': volumes}),
+                    rtol=1e-5, atol=1e-8)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the chunked model runs
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import Model, InputSignal
+
+
+def _fermentor():
+    system = {'dS': 'Q_in/V*(S_in-S)-1/Ys*mu_max*S/(S+K_S)*X',
+              'dX': '-Q_in/V*X+mu_max*S/(S+K_S)*X',
+              'mu': 'mu_max*S/(S+K_S)'}
+    parameters = {'mu_max': 0.4, 'K_S': 0.015, 'Ys': 0.67, 'S_in': 0.02,
+                  'V': 20}
+
+    model = Model('fermentor', system, parameters)
+    model.inputs = {'Q_in': InputSignal([0., 30., 60.], [2., 0.5, 2.])}
+    model.initial_conditions = {'S': 0.02, 'X': 5e-5}
+    model.independent = {'t': np.linspace(0, 100, 201)}
+    return model
+
+
+def test_run_chunks():
+    model = _fermentor()
+    reference = model._run()
+
+    for chunk_size in [50, 64, 500]:
+        blocks = list(model.run_chunks(chunk_size))
+        assert len(blocks) == int(np.ceil(201/chunk_size))
+        assert max(len(block) for block in blocks) <= chunk_size
+        assert_allclose(np.vstack(blocks), reference, rtol=1e-4,
+                        atol=1e-10)
+
+    # the integrator is restarted at each value, within the (absolute)
+    # tolerance of odeint
+    blocks = list(model.run_chunks(1))
+    assert len(blocks) == 201
+    assert_allclose(np.vstack(blocks), reference, rtol=1e-3, atol=1e-8)
+
+    model.variables_of_interest = ['X']
+    blocks = model.run_chunks(64, procedure='ode')
+    assert_allclose(np.vstack(list(blocks)), model._run(procedure='ode'),
+                    rtol=1e-4, atol=1e-10)
+
+
+def test_extend():
+    model = _fermentor()
+    reference = model._run()
+
+    model.independent = {'t': np.linspace(0, 50, 101)}
+    model.run()
+    # a plain run does not keep its output
+    assert model._last_run is None
+    model.extend(np.linspace(50.5, 75, 50))
+    last_run = model._last_run
+    output = model.extend(np.linspace(75.5, 100, 50))
+    assert_allclose(model.independent['t'], np.linspace(0, 100, 201))
+    assert_allclose(output.values, reference, rtol=1e-4, atol=1e-10)
+    # continued from the previous extend, not simulated again
+    assert_allclose(model._last_run[2][:151], last_run[2])
+
+    # changed parameters: the whole horizon is simulated again
+    model.parameters = {'mu_max': 0.3}
+    output = model._extend(np.linspace(100.5, 110, 20))
+    model.independent = {'t': np.concatenate([np.linspace(0, 100, 201),
+                                              np.linspace(100.5, 110, 20)])}
+    assert_allclose(output, model._run(), rtol=1e-8)
+
+    # the output cache keeps the output of a plain run
+    model = _fermentor()
+    model.enable_output_cache(maxsize=2)
+    model.independent = {'t': np.linspace(0, 50, 101)}
+    model.run()
+    output = model.extend(np.linspace(50.5, 100, 100))
+    assert model.output_cache.hits == 1
+    assert_allclose(output.values, reference, rtol=1e-4, atol=1e-10)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the complex-step numerical sensitivities
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import (AlgebraicModel, Model, InputSignal,
+                     NumericalLocalSensitivity)
+
+
+def test_complex_step_algebraic():
+    system = {'v': 'Vmax*S/(Km + S)', 'w': 'exp(-S)'}
+    model = AlgebraicModel('Michaelis Menten', system,
+                           {'Vmax': 1e-2, 'Km': 0.4}, ['S'])
+    substrate = np.linspace(0., 5., 11)
+    model.independent = {'S': substrate}
+
+    sensitivity = NumericalLocalSensitivity(model, procedure='complex')
+    sens = sensitivity.get_sensitivity()
+    assert_allclose(sens[('v', 'Km')].values,
+                    -1e-2*substrate/(0.4 + substrate)**2, rtol=1e-14)
+    assert_allclose(sens[('v', 'Vmax')].values,
+                    substrate/(0.4 + substrate), rtol=1e-14)
+    assert_allclose(sens['w'].values, 0.)
+    # a single run for each parameter
+    assert sensitivity.solve_stats['sensitivity'].solves == 2
+
+
+def test_complex_step_ode():
+    system = {'dA': '-k*A', 'dB': 'k*A'}
+    model = Model('decay', system, {'k': 0.1})
+    model.initial_conditions = {'A': 1., 'B': 0.}
+    time = np.linspace(0, 20, 21)
+    model.independent = {'t': time}
+    model.ode_solver_options = {'rtol': 1e-10, 'atol': 1e-12}
+
+    exact = -time*np.exp(-0.1*time)
+    for procedure in ['odeint', 'ode', 'solve_ivp', 'rk']:
+        model.ode_integrator = {'ode': 'dopri5', 'solve_ivp': 'RK45',
+                                'rk': 'rk45'}.get(procedure)
+        output = model._run(procedure=procedure)
+        model.parameters = {'k': 0.1 + 1e-20j}
+        complex_output = model._run(procedure=procedure)
+        model.parameters = {'k': 0.1}
+        assert_allclose(complex_output.real, output, atol=1e-9)
+        assert_allclose(complex_output.imag[:, 0]/1e-20, exact, atol=1e-7)
+
+    # the segments of the input signals
+    model = Model('decay', {'dA': '-k*A + u', 'dB': 'k*A'}, {'k': 0.1})
+    model.inputs = {'u': InputSignal([0., 10.], [1., 0.])}
+    model.initial_conditions = {'A': 1., 'B': 0.}
+    model.independent = {'t': time}
+    model.ode_solver_options = {'rtol': 1e-10, 'atol': 1e-12}
+    model.initialize_model()
+    assert "u = inputs['u'](t)" in model.fun_ode_str
+    central = NumericalLocalSensitivity(model).get_sensitivity()
+    complex_step = NumericalLocalSensitivity(
+        model, procedure='complex').get_sensitivity()
+    assert_allclose(complex_step.values, central.values, rtol=1e-4,
+                    atol=1e-6)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the common subexpression elimination in the generated functions
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import Model, DirectLocalSensitivity
+
+
+def _ping_pong(cse):
+    ping_pong = ('(Vf*Vr*(IPA*BA-ACE*MPPA/Keq))/(Vr*Km*BA + Vr*Kp*IPA +'
+                 'Vr*BA*IPA + Vf*Kac*MPPA/Keq + Vf*Kal*ACE/Keq +'
+                 'Vf*ACE*MPPA/Keq + Vr*Km*BA*MPPA/Kialp +'
+                 'Vf*Kal*IPA*ACE/(Keq*Kimp))')
+    system = {'v': ping_pong,
+              'Keq': '((Vf/Vr)**2)*(Kac*Kal)/(Km*Kp)',
+              'dE': '-decay*E',
+              'dIPA': '-v*E',
+              'dBA': '-v*E',
+              'dACE': 'v*E',
+              'dMPPA': 'v*E'}
+    parameters = {'Vf': 2.47e-2, 'Km': 143.18, 'Kp': 3.52, 'Vr': 1.996e-2,
+                  'Kac': 207.64, 'Kal': 2.301, 'Kialp': 1.39889,
+                  'Kimp': 2.9295, 'decay': 0.00302837}
+
+    model = Model('PPBB', system, parameters)
+    model.use_cse = cse
+    model.independent = {'t': np.linspace(0, 30, 100)}
+    model.initial_conditions = {'IPA': 65., 'BA': 5., 'ACE': 0.,
+                                'MPPA': 0., 'E': 0.68}
+    model.initialize_model()
+    return model
+
+
+def test_cse_model():
+    plain = _ping_pong(False)
+    cse = _ping_pong(True)
+
+    assert '_cse0' in cse.fun_ode_str
+    assert '_cse0' in cse.fun_alg_str
+
+    states = np.array([0.5, 5., 0.6, 60., 1.])
+    assert_allclose(cse.fun_ode(states, 0., cse.parameters),
+                    plain.fun_ode(states, 0., plain.parameters))
+    assert_allclose(cse._run(), plain._run(), rtol=1e-6)
+
+
+def test_cse_direct_sensitivity():
+    model = _ping_pong(False)
+    parameters = ['Kp', 'Vf', 'Km', 'Kal']
+    plain = DirectLocalSensitivity(model, parameters, cse=False)
+    cse = DirectLocalSensitivity(model, parameters, cse=True)
+
+    assert '_cse0' in cse._fun_ode_str
+    assert '_cse0' in cse._fun_alg_str
+
+    assert_allclose(cse.get_sensitivity(as_dataframe=False),
+                    plain.get_sensitivity(as_dataframe=False),
+                    rtol=1e-5, atol=1e-10)
+
+    # by default, the setting of the model is followed
+    assert not DirectLocalSensitivity(model, parameters).cse
+    assert DirectLocalSensitivity(_ping_pong(True), parameters).cse
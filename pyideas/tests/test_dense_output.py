@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the evaluation of the model at arbitrary independent values
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from models import michaelis_menten
+
+
+def test_evaluate_at():
+    model = michaelis_menten(n_independent=10)
+    times = np.sort(np.random.RandomState(0).uniform(0, 2500, 50))
+    # the reference run starts at the initial conditions
+    times[0] = 0.
+
+    output, error = model.evaluate_at(times, return_error=True)
+    solution = model._dense_solution
+    assert output.shape == error.shape == (50, 3)
+    assert np.all(error >= 0.)
+
+    model.independent = {'t': times}
+    reference = model._run()
+    assert_allclose(output, reference, rtol=1e-6, atol=1e-6)
+    assert np.all(np.abs(output - reference) <= error + 1e-6)
+
+    # same horizon: no new integration
+    model.independent = {'t': np.linspace(0, 2500, 10)}
+    model.evaluate_at([100.])
+    assert model._dense_solution is solution
+
+    # changed parameters: integrated again
+    model.parameters = {'Km': 100.}
+    model.variables_of_interest = ['S']
+    output = model.evaluate_at(times)
+    assert model._dense_solution is not solution
+    model.independent = {'t': times}
+    assert_allclose(output, model._run(), rtol=1e-6, atol=1e-6)
+
+
+def test_evaluate_at_horizon():
+    model = michaelis_menten(n_independent=10)
+    try:
+        model.evaluate_at([3000.])
+    except Exception as error:
+        assert 'horizon' in str(error)
+    else:
+        raise AssertionError('Evaluation outside the horizon should fail')
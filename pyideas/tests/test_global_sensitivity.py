@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the Sobol indices and Morris elementary effects of the global
+sensitivity
+"""
+from __future__ import division
+
+import random
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import AlgebraicModel, Model, GlobalSensitivity, ModPar
+
+
+def _linear():
+    # y = x1 + x2*t, the variance of x2 grows with t and x3 has no effect
+    model = AlgebraicModel('linear', {'y': 'x1 + x2*t + 0*x3'},
+                           {'x1': 0.5, 'x2': 0.5, 'x3': 0.5}, ['t'])
+    model.independent = {'t': np.array([0., 1., 2.])}
+    distributions = [ModPar(par, 0., 1., 'randomUniform')
+                     for par in ['x1', 'x2', 'x3']]
+    return model, distributions
+
+
+def test_sobol_indices():
+    model, distributions = _linear()
+    time = model.independent['t']
+    # analytical indices of the additive model
+    expected = np.array([1/(1 + time**2), time**2/(1 + time**2),
+                         np.zeros(3)]).T
+
+    for sampling in ['MC', 'LH']:
+        sensitivity = GlobalSensitivity(model, distributions,
+                                        sampling=sampling)
+        indices = sensitivity.get_sobol_indices(20000, seed=1)
+        assert list(indices.index.get_level_values('t')) == [0., 1., 2.]
+        assert_allclose(indices['S1']['y'].values, expected, atol=0.03)
+        assert_allclose(indices['ST']['y'].values, expected, atol=0.03)
+    # N(p + 2) = 100000 evaluations in batches of 10000 parameter sets
+    assert sensitivity.solve_stats['sobol'].solves == 10
+
+    # the seed does not change the global random state
+    np.random.seed(3)
+    expected_draw = np.random.uniform()
+    np.random.seed(3)
+    sensitivity.get_sobol_indices(100, seed=1)
+    sensitivity.get_morris_effects(10, seed=1)
+    assert np.random.uniform() == expected_draw
+
+    # the batches of the process pool give the same result
+    serial = GlobalSensitivity(model, distributions).get_sobol_indices(
+        1000, seed=2)
+    pool = GlobalSensitivity(model, distributions, executor='process',
+                             n_workers=2).get_sobol_indices(1000, seed=2)
+    assert_allclose(pool.values, serial.values)
+
+
+def test_morris_effects():
+    model, distributions = _linear()
+    distributions[1] = ModPar('x2', 1., 3., 'randomUniform')
+    effects = GlobalSensitivity(model, distributions).get_morris_effects(
+        20, seed=1)
+
+    # the elementary effects are relative to the parameter range
+    expected = np.array([np.ones(3), 2*model.independent['t'], np.zeros(3)]).T
+    assert_allclose(effects['mu']['y'].values, expected)
+    assert_allclose(effects['mu_star']['y'].values, expected)
+    assert_allclose(effects['sigma']['y'].values, 0., atol=1e-12)
+
+
+def test_global_sensitivity_ode():
+    model = Model('decay', {'dA': '-k*A', 'dB': 'k*A'}, {'k': 0.1, 'j': 1.})
+    model.initial_conditions = {'A': 1., 'B': 0.}
+    model.independent = {'t': np.linspace(0, 20, 5)}
+    sensitivity = GlobalSensitivity(
+        model, [ModPar('k', 0.05, 0.2, 'randomUniform'),
+                ModPar('j', 0., 1., 'randomUniform')])
+
+    indices = sensitivity.get_sobol_indices(500, seed=1)
+    # no variance at the initial conditions
+    assert np.isnan(indices.values[0]).all()
+    assert_allclose(indices['ST'].xs('j', axis=1, level=1).values[1:], 0.)
+    assert_allclose(indices['ST'].xs('k', axis=1, level=1).values[1:], 1.,
+                    atol=0.05)
+
+    try:
+        GlobalSensitivity(model, [ModPar('Km', 0., 1., 'randomUniform')])
+    except Exception as error:
+        assert 'Km' in str(error)
+    else:
+        raise AssertionError('Km is not a parameter of the model')
+
+
+def test_latin_hypercube():
+    distribution = ModPar('x1', 0., 1., 'randomUniform')
+    # the random module without generator, numpy with one
+    random.seed(1)
+    expected = distribution.LatinH(10)
+    random.seed(1)
+    assert_allclose(distribution.LatinH(10), expected)
+    sample = distribution.LatinH(10, random_state=np.random.RandomState(1))
+
+    for values in [expected, sample]:
+        # one value in each of the strata
+        assert_allclose(np.sort(np.floor(values*10)), np.arange(10))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the piecewise input signals of the models
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import Model, InputSignal
+
+
+def _fed_batch(kind='step'):
+    system = {'dV': 'Q_in',
+              'dC': 'Q_in*(C_in - C)/V - k*C',
+              'load': 'Q_in*C_in'}
+    parameters = {'k': 0.1, 'C_in': 5.}
+
+    model = Model('fed batch', system, parameters)
+    model.inputs = {'Q_in': InputSignal([0., 10., 20.], [2., 0., 1.],
+                                        kind=kind)}
+    model.initial_conditions = {'V': 10., 'C': 0.}
+    model.independent = {'t': np.linspace(0, 30, 31)}
+    model.variables_of_interest = ['V', 'C', 'load']
+    return model
+
+
+def test_input_signal():
+    step = InputSignal([0., 10., 20.], [2., 0., 1.])
+    assert_allclose(step(np.array([-1., 0., 9.9, 10., 25.])),
+                    [2., 2., 2., 0., 1.])
+    linear = InputSignal([0., 10., 20.], [2., 0., 1.], kind='linear')
+    assert_allclose(linear(np.array([5., 15., 25.])), [1., 0.5, 1.])
+    # the segment extends the piece beyond the breakpoint
+    assert_allclose(linear.segment(0.)(12.), -0.4)
+
+    try:
+        InputSignal([0., 0.], [1., 2.])
+    except Exception as error:
+        assert 'increasing' in str(error)
+    else:
+        raise AssertionError('times should be strictly increasing')
+
+
+def test_step_input():
+    model = _fed_batch()
+    output = model._run()
+    time = model.independent['t']
+
+    volume = np.where(time < 10., 10. + 2.*time,
+                      np.where(time < 20., 30., 30. + (time - 20.)))
+    assert_allclose(output[:, 0], volume, rtol=1e-6)
+    assert_allclose(output[:, 2], 5.*InputSignal([0., 10., 20.],
+                                                 [2., 0., 1.])(time))
+    # without feed, the concentration decays exponentially
+    assert_allclose(output[11:21, 1], output[10, 1]*np.exp(-0.1*np.arange(
+        1, 11)), rtol=1e-5)
+
+    assert_allclose(model._run(procedure='ode'), output, rtol=1e-5,
+                    atol=1e-6)
+    assert_allclose(model.evaluate_at(time), output, rtol=1e-5, atol=1e-6)
+
+
+def test_linear_input():
+    model = _fed_batch('linear')
+    output = model._run()
+    assert_allclose(output[[10, 20, 30], 0], [20., 25., 35.], rtol=1e-6)
+
+
+def test_input_names():
+    model = _fed_batch()
+    model.initialize_model()
+    # new signal with the same name: the model functions are reused
+    model.inputs = {'Q_in': InputSignal([0., 5.], [1., 0.])}
+    assert model._initialised
+    assert_allclose(model._run()[-1, 0], 15., rtol=1e-6)
+
+    try:
+        model.inputs = {'k': InputSignal([0.], [1.])}
+    except Exception as error:
+        assert 'parameter' in str(error)
+    else:
+        raise AssertionError('input names can not be parameter names')
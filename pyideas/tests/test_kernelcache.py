@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the on-disk cache of generated model functions
+"""
+from __future__ import division
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pyideas import Model, KernelCache
+
+
+class TestKernelCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.system = {'v': 'Vmax*S/(Km + S)',
+                       'dS': '-v',
+                       'dP': 'v'}
+        self.parameters = {'Vmax': 1e-1, 'Km': 0.5}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _model(self, cache):
+        model = Model('MichaelisMenten', self.system, self.parameters)
+        model.kernel_cache = cache
+        model.initial_conditions = {'S': 0.5, 'P': 0.0}
+        model.independent = {'t': np.linspace(0, 72, 100)}
+        return model
+
+    def test_warm_start(self):
+        cache = KernelCache(self.directory)
+
+        cold = self._model(cache)
+        cold.initialize_model()
+        assert cache.misses == 1 and cache.hits == 0
+        assert cold in cache
+
+        warm = self._model(cache)
+        warm.initialize_model()
+        assert cache.hits == 1
+        assert warm.fun_ode_str == cold.fun_ode_str
+        np.testing.assert_allclose(warm._run(), cold._run())
+
+    def test_code_objects(self):
+        cache = KernelCache(self.directory, store_code=True)
+        self._model(cache).initialize_model()
+
+        warm = self._model(cache)
+        warm.initialize_model()
+        assert cache.hits == 1
+        # ODE states are ordered alphabetically: P, S
+        np.testing.assert_allclose(warm.fun_ode([0., 0.5], 0.,
+                                                warm.parameters),
+                                   [0.05, -0.05])
+
+    def test_invalidate_and_evict(self):
+        cache = KernelCache(self.directory)
+        model = self._model(cache)
+        model.initialize_model()
+
+        cache.invalidate(model)
+        assert model not in cache
+
+        model.initialize_model()
+        other = Model('other', {'dS': '-k*S'}, {'k': 1.})
+        other.kernel_cache = cache
+        other.initialize_model()
+        assert len(cache) == 2
+
+        cache.max_size = cache.size - 1
+        cache._evict()
+        assert len(cache) == 1
+
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_variables_of_interest(self):
+        self.system['w'] = 'v*S'
+        cache = KernelCache(self.directory)
+        cold = self._model(cache)
+        cold.variables_of_interest = ['v', 'S']
+        cold._run()
+        assert len(cache) == 2
+
+        warm = self._model(cache)
+        warm.variables_of_interest = ['v', 'S']
+        warm._run()
+        # the model functions and fun_alg_voi of v
+        assert cache.hits == 2
+        assert warm.fun_alg_voi_str == cold.fun_alg_voi_str
+        assert '    w = ' not in warm.fun_alg_voi_str
+        np.testing.assert_allclose(warm._run(), cold._run())
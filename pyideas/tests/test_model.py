@@ -11,6 +11,7 @@ import unittest
 import numpy as np
 
 from pyideas.model import Model
+from pyideas.sensitivity import DirectLocalSensitivity
 
 
 class TestAlgebraicModel(unittest.TestCase):
@@ -131,3 +132,58 @@ class TestOdeModel(unittest.TestCase):
                                        decimal=14)
         np.testing.assert_almost_equal(6.428571428571429e-06, result[1],
                                        decimal=14)
+
+    def test_def_creation_positional(self):
+
+        ODE = {'dS': 'Q_in/V*(S_in-S)-1/Ys*mu_max*S/(S+K_S)*X',
+               'dX': '-Q_in/V*X+mu_max*S/(S+K_S)*X',
+               'P': 'Q_in*t/X'}
+
+        parameters = {'mu_max': 0.4, 'K_S': 0.015, 'Q_in': 2, 'Ys': 0.67,
+                      'S_in': 0.02, 'V': 20}
+
+        model = Model('Fermentor', ODE, parameters)
+        model.positional_parameters = True
+        model.independent = {'t': [0.02, 5e-5]}
+        model.initialize_model()
+
+        oderef = ("def fun_ode(odes, t, parameters, *args, **kwargs):\n"
+                  "    K_S, Q_in, S_in, V, Ys, mu_max, = parameters\n\n"
+                  "    S, X, = odes\n\n"
+                  "    P = Q_in*t/X\n\n"
+                  "    dS = Q_in/V*(S_in-S)-1/Ys*mu_max*S/(S+K_S)*X\n"
+                  "    dX = -Q_in/V*X+mu_max*S/(S+K_S)*X\n"
+                  "    return [dS, dX]")
+        assert oderef == model.fun_ode_str
+
+        result = model.fun_ode(model._independent_values['t'], np.nan,
+                               *model._parameter_args())
+
+        np.testing.assert_almost_equal(-1.7057569296375266e-05, result[0],
+                                       decimal=14)
+        np.testing.assert_almost_equal(6.428571428571429e-06, result[1],
+                                       decimal=14)
+
+        # parameter updates refresh the parameter vector
+        vector = model._parameter_args()[0]
+        model.parameters = {'V': 40}
+        assert model._parameter_args()[0] is vector
+        assert vector == [0.015, 2, 0.02, 40, 0.67, 0.4]
+
+    def test_positional_flag_after_initialisation(self):
+
+        system = {'v': 'Vmax*S/(Km + S)', 'dS': '-v*E', 'dP': 'v*E'}
+        parameters = {'Km': 150., 'Vmax': 0.768, 'E': 0.68}
+
+        model = Model('Michaelis-Menten', system, parameters)
+        model.positional_parameters = True
+        model.initial_conditions = {'S': 500., 'P': 0.}
+        model.independent = {'t': np.linspace(0, 2500, 20)}
+        model.initialize_model()
+        reference = DirectLocalSensitivity(model).get_sensitivity()
+
+        # the kernels generated later follow the mode of the model functions
+        model.positional_parameters = False
+        sensitivity = DirectLocalSensitivity(model).get_sensitivity()
+        np.testing.assert_allclose(sensitivity.values, reference.values)
+        assert model.fun_ode_str.count('= parameters\n') == 1
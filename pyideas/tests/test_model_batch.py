@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the evaluation of many parameter sets at once
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import AlgebraicModel, Model, InputSignal
+
+
+def test_run_batch():
+    system = {'v': 'Vmax*A*B/(Km*B + Kp*A + A*B)',
+              'w': '2*v + exp(-Km*A)'}
+    parameters = {'Vmax': 1e-2, 'Km': 0.4, 'Kp': 2.}
+
+    model = AlgebraicModel('double MM', system, parameters, ['A', 'B'])
+    model.independent = model.cartesian({'A': np.linspace(0.1, 5., 10),
+                                         'B': np.linspace(0.1, 3., 5)})
+
+    samples = np.random.RandomState(1).uniform(0.1, 1., (20, 2))
+    result = model.run_batch(samples, parameters=['Km', 'Vmax'])
+    assert result.shape == (20, 50, 2)
+
+    for i, (km, vmax) in enumerate(samples):
+        model.parameters = {'Km': km, 'Vmax': vmax}
+        assert_allclose(result[i], model._run())
+
+    model.variables_of_interest = ['w']
+    result = model.run_batch(samples, parameters=['Km', 'Vmax'])
+    assert result.shape == (20, 50, 1)
+
+
+def test_run_ensemble():
+    system = {'v': 'Vmax*S/(Km + S)',
+              'dS': '-v*E',
+              'dP': 'v*E'}
+    parameters = {'Km': 150., 'Vmax': 0.768, 'E': 0.68}
+
+    model = Model('Michaelis-Menten', system, parameters)
+    model.initial_conditions = {'S': 500., 'P': 0.}
+    model.independent = {'t': np.linspace(0, 2500, 50)}
+
+    km = np.linspace(100., 200., 5)
+    s0 = np.linspace(400., 600., 5)
+    result = model.run_ensemble(parameters={'Km': km},
+                                initial_conditions={'S': s0})
+    assert result.shape == (5, 50, 3)
+
+    for i in range(5):
+        model.parameters = {'Km': km[i]}
+        model.initial_conditions = {'S': s0[i]}
+        assert_allclose(result[i], model._run(), rtol=1e-5, atol=1e-5)
+
+    # list of dicts, one for each member
+    model.initial_conditions = {'S': 500.}
+    members = model.run_ensemble(parameters=[{'Km': 100.}, {'Km': 200.}])
+    assert members.shape == (2, 50, 3)
+    model.parameters = {'Km': 200.}
+    assert_allclose(members[-1], model._run(), rtol=1e-5, atol=1e-5)
+
+
+def test_runge_kutta_ensemble():
+    system = {'dA': '-k*A', 'dB': 'k*A'}
+    model = Model('decay', system, {'k': 0.1})
+    model.initial_conditions = {'A': 1., 'B': 0.}
+    time = np.linspace(0, 20, 81)
+    model.independent = {'t': time}
+
+    rates = np.linspace(0.05, 0.5, 100)
+    exact = np.exp(-rates[:, None]*time)
+    for integrator, max_step, tolerance in [('rk4', np.inf, 1e-6),
+                                            ('rk4', 0.05, 1e-9),
+                                            ('rk45', np.inf, 1e-6)]:
+        model.ode_integrator = integrator
+        model.ode_solver_options = {'max_step': max_step}
+        result = model.run_ensemble(parameters={'k': rates}, procedure='rk')
+        assert_allclose(result[:, :, 0], exact, atol=tolerance)
+        assert_allclose(result.sum(axis=2), 1.)
+    # the members are advanced in lock-step
+    assert model.last_solve_stats.backend == 'rk:rk45'
+    assert model.last_solve_stats.rhs_evaluations < 1000
+
+
+def test_run_batch_inputs():
+    model = AlgebraicModel('dosage', {'y': 'k*Q_in*t'}, {'k': 1.}, ['t'])
+    model.independent = {'t': np.linspace(0, 20, 11)}
+    model.inputs = {'Q_in': InputSignal([0., 10., 20.], [2., 0., 1.])}
+
+    rates = np.array([[0.5], [1.], [2.]])
+    result = model.run_batch(rates, parameters=['k'])
+    assert result.shape == (3, 11, 1)
+    for i, (k,) in enumerate(rates):
+        model.parameters = {'k': k}
+        assert_allclose(result[i], model._run())
+
+
+def test_run_ensemble_algebraic():
+    system = {'v': 'Vmax*S/(Km + S)*E',
+              'dS': '-v',
+              'dP': 'v'}
+    model = Model('Michaelis-Menten', system, {'Km': 150., 'Vmax': 0.768})
+    model.inputs = {'E': InputSignal([0., 1000.], [0.68, 0.34])}
+    model.initial_conditions = {'S': 500., 'P': 0.}
+    model.independent = {'t': np.linspace(0, 2500, 50)}
+    model.variables_of_interest = ['v']
+
+    km = np.linspace(100., 200., 4)
+    result = model.run_ensemble(parameters={'Km': km})
+    assert result.shape == (4, 50, 1)
+    # the algebraic part of all members is evaluated at once
+    assert 'solved_variables[:, :, ' in model.fun_alg_batch_str
+    for i in range(4):
+        model.parameters = {'Km': km[i]}
+        assert_allclose(result[i], model._run(), rtol=1e-5, atol=1e-5)
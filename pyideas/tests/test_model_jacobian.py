@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the analytical Jacobian passed to the ODE solvers
+"""
+from __future__ import division
+
+import warnings
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import Model, OdeSolver
+
+
+def _robertson(system=None):
+    system = system or {'dA': '-k1*A + k3*B*C',
+                        'dB': 'k1*A - k2*B**2 - k3*B*C',
+                        'dC': 'k2*B**2'}
+    parameters = {'k1': 0.04, 'k2': 3e7, 'k3': 1e4}
+
+    model = Model('Robertson', system, parameters)
+    model.initial_conditions = {'A': 1., 'B': 0., 'C': 0.}
+    model.independent = {'t': np.logspace(-5, 5, 50)}
+    model.initialize_model()
+    return model
+
+
+def test_jacobian_finite_difference():
+    model = _robertson()
+    states = np.array([0.5, 1e-4, 0.5])
+
+    def fun(x):
+        return np.array(model.fun_ode(x, 0., model.parameters))
+
+    step = 1e-7
+    numerical = np.array([(fun(states + step*unit) -
+                           fun(states - step*unit))/(2*step)
+                          for unit in np.eye(3)]).T
+    assert_allclose(model.jac_ode(states, 0., model.parameters), numerical,
+                    rtol=1e-5, atol=1e-2)
+
+
+def test_jacobian_solvers():
+    model = _robertson()
+    reference = model._run()
+
+    model.use_jacobian = False
+    assert_allclose(model._run(), reference, rtol=1e-4, atol=1e-6)
+
+    model.use_jacobian = True
+    assert_allclose(model._run(procedure='ode'), reference, rtol=1e-4,
+                    atol=1e-6)
+
+
+def test_jacobian_sparsity():
+    model = _robertson()
+    # order of the states: A, B, C
+    assert_allclose(model.jac_ode_sparsity(), [[1, 1, 1],
+                                               [1, 1, 1],
+                                               [0, 1, 0]])
+
+
+def test_solve_ivp():
+    model = _robertson()
+    reference = model._run()
+
+    for method in ['LSODA', 'BDF', 'Radau']:
+        model.ode_integrator = method
+        assert_allclose(model._run(procedure='solve_ivp'), reference,
+                        rtol=1e-4, atol=1e-6)
+
+    # finite difference Jacobian limited to the sparsity structure
+    model.use_jacobian = False
+    model.ode_integrator = 'BDF'
+    assert_allclose(model._run(procedure='solve_ivp'), reference, rtol=1e-4,
+                    atol=1e-6)
+
+    # the solution of dy/dt = y**2 blows up at t = 1
+    solver = OdeSolver(lambda y, t, parameters: y**2, [1.],
+                       {'t': np.linspace(0, 2, 5)}, ({},),
+                       ode_integrator='BDF')
+    try:
+        solver.solve(procedure='solve_ivp')
+    except Exception as error:
+        assert 'BDF' in str(error)
+    else:
+        raise AssertionError('a failed integration should raise')
+
+
+def test_auto_procedure():
+    model = _robertson()
+    reference = model._run()
+    assert_allclose(model._run(procedure='auto'), reference, rtol=1e-4,
+                    atol=1e-6)
+    # the stiffness probe is done once
+    assert model._auto_integrator == ('odeint', None)
+    model._auto_integrator = ('odeint', 'probed')
+    model._run(procedure='auto')
+    assert model._auto_integrator == ('odeint', 'probed')
+    model.initialize_model()
+    assert model._auto_integrator is None
+
+    decay = Model('decay', {'dA': '-k*A'}, {'k': 0.1})
+    decay.initial_conditions = {'A': 1.}
+    decay.independent = {'t': np.linspace(0, 10, 11)}
+    output = decay._run(procedure='auto')
+    assert decay._auto_integrator == ('ode', 'dopri5')
+    assert_allclose(output[:, 0], np.exp(-0.1*decay.independent['t']),
+                    rtol=1e-6)
+
+
+def test_jacobian_abs():
+    # sympy can not evaluate the derivative of abs(A)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        model = _robertson({'dA': '-k1*abs(A) + k3*B*C',
+                            'dB': 'k1*abs(A) - k2*B**2 - k3*B*C',
+                            'dC': 'k2*B**2'})
+    assert any('finite difference' in str(warning.message)
+               for warning in caught)
+    assert model.jac_ode is None
+    assert model.jac_ode_banded is None
+    reference = _robertson()._run()
+    assert_allclose(model._run(), reference, rtol=1e-4, atol=1e-6)
+
+    # abs of a parameter is written as np.abs
+    model = _robertson({'dA': '-abs(k1)*A + k3*B*C',
+                        'dB': 'abs(k1)*A - k2*B**2 - k3*B*C',
+                        'dC': 'k2*B**2'})
+    assert 'np.abs(k1)' in model.jac_ode_str
+    assert_allclose(model._run(), reference, rtol=1e-4, atol=1e-6)
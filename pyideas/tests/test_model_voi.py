@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the algebraic part restricted to the variables of interest
+"""
+from __future__ import division
+
+from numpy.testing import assert_allclose
+
+from pyideas.modeldefinition import get_algebraic_dependencies
+
+from models import michaelis_menten
+
+
+def _michaelis_menten():
+    system = {'v': 'Vmax*S/(Km + S)',
+              'rate': 'v*E',
+              'conversion': '1 - S/S0',
+              'yield_P': 'P/S0',
+              'dS': '-rate',
+              'dP': 'rate'}
+    parameters = {'Km': 150., 'Vmax': 0.768, 'E': 0.68, 'S0': 500.}
+    return michaelis_menten(system=system, parameters=parameters)
+
+
+def test_algebraic_dependencies():
+    algebraic = {'a': 'b + 1', 'b': 'c*exp(x)', 'c': '2*k', 'd': 'a + c'}
+    assert set(get_algebraic_dependencies(algebraic, ['a'])) == \
+        set(['a', 'b', 'c'])
+    assert get_algebraic_dependencies(algebraic, ['c']).keys() == ['c']
+
+
+def test_variables_of_interest_pruning():
+    model = _michaelis_menten()
+    reference = model._run()
+
+    model.variables_of_interest = ['P', 'rate']
+    output = model._run()
+    assert_allclose(output, reference[:, [model._variables.index('P'),
+                                          model._variables.index('rate')]])
+    assert 'conversion' not in model.fun_alg_voi_str
+    assert 'v = ' in model.fun_alg_voi_str
+    assert len(model.fun_alg_str) > len(model.fun_alg_voi_str)
+
+    # regenerated for new variables of interest
+    model.variables_of_interest = ['conversion', 'S']
+    output = model._run()
+    assert 'rate' not in model.fun_alg_voi_str
+    assert_allclose(output, reference[:, [model._variables.index('conversion'),
+                                          model._variables.index('S')]])
+
+    # no algebraic variables of interest: the ODEs only
+    model.variables_of_interest = ['S']
+    assert_allclose(model._run()[:, 0],
+                    reference[:, model._variables.index('S')])
+    assert model.fun_alg_voi is None
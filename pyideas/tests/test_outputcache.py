@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the in-memory cache of model outputs
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas.cache import OutputCache
+
+from models import michaelis_menten
+
+
+def test_output_cache_hits():
+    model = michaelis_menten(n_independent=100)
+    reference = model._run()
+
+    model.enable_output_cache(maxsize=2)
+    first = model._run()
+    second = model._run()
+    assert_allclose(first, reference)
+    assert_allclose(second, reference)
+    assert model.output_cache.hits == 1
+    assert model.output_cache.misses == 1
+
+    # returned outputs are copies
+    second[:] = 0.
+    assert_allclose(model._run(), reference)
+
+    # the variables of interest are selected from the cached output
+    model.variables_of_interest = ['v']
+    assert_allclose(model._run(), reference[:, [0]])
+    assert model.output_cache.misses == 1
+
+
+def test_output_cache_invalidation():
+    model = michaelis_menten(n_independent=100)
+    model.enable_output_cache(maxsize=2)
+    reference = model._run()
+
+    model.parameters = {'Km': 100.}
+    assert not np.allclose(model._run(), reference)
+    model.initial_conditions = {'S': 400.}
+    model._run()
+    model.independent = {'t': np.linspace(0, 2500, 50)}
+    assert model._run().shape == (50, 3)
+    assert model.output_cache.misses == 4
+    assert len(model.output_cache) == 2
+
+    model.parameters = {'Km': 150.}
+    model.initial_conditions = {'S': 500.}
+    model.independent = {'t': np.linspace(0, 2500, 100)}
+    assert_allclose(model._run(), reference)
+
+    model.initialize_model()
+    assert len(model.output_cache) == 0
+
+    model.disable_output_cache()
+    assert model.output_cache is None
+
+
+def test_output_cache_max_bytes():
+    cache = OutputCache(maxsize=10, max_bytes=2000)
+    for i in range(5):
+        cache.put(OutputCache.fingerprint(i), np.zeros(100))
+    assert len(cache) == 2
+    assert cache.nbytes == 1600
+    assert OutputCache.fingerprint(4) in cache
+    assert cache.get(OutputCache.fingerprint(0)) is None
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the concurrent perturbed runs of the numerical sensitivities
+"""
+from __future__ import division
+
+import pickle
+from multiprocessing.pool import ThreadPool
+
+from numpy.testing import assert_allclose
+
+from pyideas import NumericalLocalSensitivity
+from pyideas.sensitivity import SENS_EXECUTORS
+
+from models import michaelis_menten
+
+
+def test_pickle_model():
+    model = michaelis_menten(variables_of_interest=['S', 'P', 'v'])
+    copy = pickle.loads(pickle.dumps(model, pickle.HIGHEST_PROTOCOL))
+    assert_allclose(copy._run(), model._run())
+
+
+def test_sensitivity_executor():
+    model = michaelis_menten(variables_of_interest=['S', 'P', 'v'])
+    serial = NumericalLocalSensitivity(model).get_sensitivity()
+
+    for procedure, n_runs in [('central', 6), ('forward', 3)]:
+        for executor in ['thread', 'process']:
+            sensitivity = NumericalLocalSensitivity(
+                model, procedure=procedure, executor=executor, n_workers=2)
+            result = sensitivity.get_sensitivity()
+            if procedure == 'central':
+                assert_allclose(result.values, serial.values)
+            # nominal run and the perturbed runs of the copies
+            assert sensitivity.solve_stats['sensitivity'].solves == \
+                1 + n_runs
+    # the perturbed runs did not change the model
+    assert model.parameters['Km'] == 150.
+
+    try:
+        NumericalLocalSensitivity(model, executor='cluster')
+    except Exception as error:
+        assert 'executor' in str(error)
+    else:
+        raise AssertionError('the executor is unknown')
+
+
+def test_executor_pool_reuse():
+    model = michaelis_menten(variables_of_interest=['S', 'P', 'v'])
+    pools = []
+
+    def counting_pool(n_workers, initializer, initargs):
+        pools.append(ThreadPool(n_workers, initializer, initargs))
+        return pools[-1]
+
+    SENS_EXECUTORS['counting'] = counting_pool
+    try:
+        serial = NumericalLocalSensitivity(model)
+        serial.autotune_perturbation(bounds=(1e-7, 1e-3))
+        sensitivity = NumericalLocalSensitivity(model, executor='counting',
+                                                n_workers=2)
+        sensitivity.autotune_perturbation(bounds=(1e-7, 1e-3))
+    finally:
+        del SENS_EXECUTORS['counting']
+    # one pool for all golden section steps
+    assert len(pools) == 1
+    assert sensitivity._pool is None
+    assert_allclose(sensitivity.perturbation.values(),
+                    serial.perturbation.values())
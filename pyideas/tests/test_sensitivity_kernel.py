@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the generated forward sensitivity equations and the staggered
+integration of the sensitivities
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import Model, DirectLocalSensitivity, InputSignal
+
+
+def _chain(n_states=6):
+    system = {}
+    for i in range(n_states):
+        source = 'C{0}'.format(i - 1) if i else 'u'
+        system['dC{0}'.format(i)] = 'k{0}*{1} - k{2}*C{0}**2'.format(
+            i, source, i + 1)
+    parameters = {'k{0}'.format(i): 10.**(i % 3)
+                  for i in range(n_states + 1)}
+
+    model = Model('chain', system, parameters)
+    model.inputs = {'u': InputSignal([0., 5.], [1., 0.5])}
+    model.initial_conditions = {'C{0}'.format(i): 0.
+                                for i in range(n_states)}
+    model.independent = {'t': np.linspace(0, 10, 41)}
+    model.initialize_model()
+    return model
+
+
+def test_sparse_sensitivity_equations():
+    model = _chain()
+    sensitivity = DirectLocalSensitivity(model)
+    # no dense matrices of the partial derivatives
+    assert 'dfdx' not in sensitivity._fun_ode_str
+    assert 'np.dot' not in sensitivity._fun_ode_str
+    # no module level buffer of the derivatives, shared between solves
+    source = sensitivity._fun_ode_str
+    assert source.index('def fun_ode_lsa') == 0
+
+    states = np.random.RandomState(0).uniform(0.1, 1., 6)
+    dxdtheta = np.random.RandomState(1).uniform(-1., 1., (6, 7))
+    args = model._parameter_args() + (model.inputs,)
+    output = sensitivity._fun_ode(np.concatenate([states, dxdtheta.ravel()]),
+                                  1., *args)
+
+    dfdx, dfdtheta = sensitivity._fun_ode_partials(states, 1., *args)
+    assert_allclose(output[:6], model.fun_ode(states, 1., *args))
+    assert_allclose(output[6:].reshape(6, 7),
+                    dfdtheta + np.dot(dfdx, dxdtheta))
+
+    # the derivatives are written in the buffer of the solve
+    buffer = np.empty((6, 7))
+    assert_allclose(sensitivity._fun_ode(
+        np.concatenate([states, dxdtheta.ravel()]), 1., *args,
+        dxdtheta_dt=buffer), output)
+    assert_allclose(buffer.ravel(), output[6:])
+
+
+def test_staggered_sensitivity():
+    model = _chain()
+    simultaneous = DirectLocalSensitivity(model).get_sensitivity()
+    staggered = DirectLocalSensitivity(model, staggered=True)
+    assert_allclose(staggered.get_sensitivity().values, simultaneous.values,
+                    rtol=1e-4, atol=1e-6)
+
+    # without the sparsity structure, the steps use a dense factorisation
+    model.jac_ode_sparsity = None
+    assert_allclose(staggered.get_sensitivity().values, simultaneous.values,
+                    rtol=1e-4, atol=1e-6)
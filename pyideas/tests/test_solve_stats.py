@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the statistics of the model solves
+"""
+from __future__ import division
+
+import numpy as np
+
+from pyideas import InputSignal, NumericalLocalSensitivity, SolverStats
+
+from models import michaelis_menten
+
+
+def test_solver_stats_add():
+    total = SolverStats('odeint', 10, 1, 5, None, 0.5) + \
+        SolverStats('ode:dopri5', 20, 0, 4, 1, 0.25)
+    assert total.backend == 'odeint, ode:dopri5'
+    assert (total.rhs_evaluations, total.jacobian_evaluations,
+            total.steps, total.rejected_steps) == (30, 1, 9, 1)
+    assert total.wall_time == 0.75 and total.solves == 2
+    assert (SolverStats('odeint') + SolverStats('odeint')).steps is None
+
+
+def test_backend_stats():
+    model = michaelis_menten(variables_of_interest=['S', 'P'])
+    for procedure, integrator, backend in [
+            ('odeint', None, 'odeint'), ('ode', 'vode', 'ode:vode'),
+            ('ode', 'dopri5', 'ode:dopri5'),
+            ('solve_ivp', 'BDF', 'solve_ivp:BDF')]:
+        model.ode_integrator = integrator
+        model._run(procedure=procedure)
+        stats = model.last_solve_stats
+        assert stats.backend == backend
+        assert stats.rhs_evaluations > 0
+        assert stats.solves == 1 and stats.wall_time >= 0.
+
+    stats = model.last_solve_stats
+    assert stats.jacobian_evaluations > 0
+    assert model.total_solve_stats.solves == 4
+
+    model.reset_solve_stats()
+    assert model.last_solve_stats is None
+    assert model.total_solve_stats.solves == 0
+
+
+def test_aggregated_stats():
+    model = michaelis_menten(inputs={'E': InputSignal([0., 1000.], [0.68, 0.34])})
+    model._run()
+    # the segments of the input signal are summed in one solve
+    segmented = model.last_solve_stats
+    assert segmented.solves == 1
+    assert segmented.steps > 0
+
+    # all chunks are recorded, also when not consumed until the end
+    model.reset_solve_stats()
+    for output in model.run_chunks(10):
+        break
+    assert model.total_solve_stats.solves == 1
+
+    model.enable_output_cache()
+    model._run()
+    model._run()
+    assert model.last_solve_stats.backend == 'cache'
+
+
+def test_stage_stats():
+    model = michaelis_menten(variables_of_interest=['S', 'P'])
+    sensitivity = NumericalLocalSensitivity(model, parameters=['Km', 'Vmax'])
+    sensitivity.get_sensitivity()
+    stats = sensitivity.solve_stats['sensitivity']
+    # nominal run and two perturbed runs for each parameter
+    assert stats.solves == 5
+    assert model.total_solve_stats.solves == 5
+
+    sensitivity.get_sensitivity()
+    assert sensitivity.solve_stats['sensitivity'].solves == 10
+
+
+def test_shared_perturbation_runs():
+    model = michaelis_menten(variables_of_interest=['S', 'P'])
+    sensitivity = NumericalLocalSensitivity(model, parameters=['Km', 'Vmax'])
+    quality = sensitivity.calc_quality_num_lsa([1e-6, 1e-4])
+    # one nominal run and two perturbed runs for each parameter and factor
+    assert sensitivity.solve_stats['quality_num_lsa'].solves == 9
+
+    accuracy = sensitivity.get_sensitivity_accuracy('SRE')
+    assert sensitivity.solve_stats['sensitivity_accuracy'].solves == 5
+
+    sensitivity.procedure = 'forward'
+    forward = sensitivity.get_sensitivity(as_dataframe=False)
+    sensitivity.procedure = 'backward'
+    backward = sensitivity.get_sensitivity(as_dataframe=False)
+    sre = np.mean(np.abs(1 - backward[1:, 0]/forward[1:, 0]))
+    np.testing.assert_allclose(accuracy['S'].values, sre)
+    assert quality.shape == (2, 2*2*5)
+
+
+def test_autotune_perturbation():
+    model = michaelis_menten(variables_of_interest=['S', 'P'])
+    sensitivity = NumericalLocalSensitivity(model)
+    tuned = sensitivity.autotune_perturbation(criterion='SRE')
+    assert sensitivity.perturbation == tuned
+    assert all(1e-9 <= value <= 1e-2 for value in tuned.values())
+    # fewer runs than a sweep of the decades between the bounds
+    assert sensitivity.solve_stats['autotune_perturbation'].solves < \
+        1 + 2*3*8
+
+    output_std = model._run()
+    decades = 10**np.arange(-9., -1.)
+    for par in tuned:
+        perturbations = list(decades) + [tuned[par]]
+        runs = [(par, sign*value) for value in perturbations
+                for sign in [1, -1]]
+        outputs = dict(zip(runs, sensitivity._perturbed_outputs(runs)))
+        quality = [sensitivity._perturbation_quality(par, value, outputs,
+                                                     output_std, 'SRE')
+                   for value in perturbations]
+        assert quality[-1] <= 2*min(quality[:-1])
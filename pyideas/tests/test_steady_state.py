@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the direct steady state solver and its sensitivities
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from pyideas import Model, DirectLocalSensitivity
+
+
+def _chemostat():
+    system = {'mu': 'mu_max*S/(S + K_S)',
+              'dS': 'D*(S_in - S) - mu*X/Ys',
+              'dX': 'mu*X - D*X'}
+    parameters = {'mu_max': 0.4, 'K_S': 0.015, 'Ys': 0.67, 'S_in': 0.02,
+                  'D': 0.1}
+
+    model = Model('chemostat', system, parameters)
+    model.initial_conditions = {'S': 0.01, 'X': 0.005}
+    model.independent = {'t': np.linspace(0, 500, 11)}
+    model.variables_of_interest = ['S', 'X', 'mu']
+    return model
+
+
+def test_steady_state():
+    model = _chemostat()
+    steady = model.steady_state()
+    # the growth rate equals the dilution rate
+    assert_allclose(steady.values, [0.005, 0.67*0.015, 0.1], rtol=1e-8)
+    assert model.last_solve_stats.backend == 'steady_state:newton'
+    assert_allclose(model._run()[-1], steady.values, rtol=1e-5)
+
+    # washout is a steady state as well
+    washout = model.steady_state(initial_guess={'X': 0.})
+    assert_allclose(washout[['S', 'X']].values, [0.02, 0.], atol=1e-12)
+
+
+def test_pseudo_transient_continuation():
+    # the Jacobian is singular, as the sum of S and P is conserved
+    system = {'v': 'Vmax*S/(Km + S)',
+              'dS': '-v*E',
+              'dP': 'v*E'}
+    model = Model('Michaelis-Menten', system,
+                  {'Km': 150., 'Vmax': 0.768, 'E': 0.68})
+    model.initial_conditions = {'S': 500., 'P': 0.}
+    model.independent = {'t': np.linspace(0, 2500, 11)}
+    model.variables_of_interest = ['S', 'P']
+
+    assert_allclose(model.steady_state().values, [0., 500.], atol=1e-6)
+    assert model.last_solve_stats.backend == 'steady_state:ptc'
+
+    sensitivity = DirectLocalSensitivity(model)
+    try:
+        sensitivity.get_steady_state_sensitivity()
+    except Exception as error:
+        assert 'singular' in str(error)
+    else:
+        raise AssertionError('the steady state sensitivity is not defined')
+
+
+def test_steady_state_sensitivity():
+    model = _chemostat()
+    sensitivity = DirectLocalSensitivity(model)
+    steady_sens = sensitivity.get_steady_state_sensitivity()
+
+    # S = K_S*D/(mu_max - D)
+    assert_allclose(steady_sens.loc['S', 'K_S'], 0.1/0.3)
+    assert_allclose(steady_sens.loc['S', 'D'], 0.015*0.4/0.3**2)
+    assert_allclose(steady_sens.loc['mu', 'D'], 1.)
+
+    # finite difference of the steady state
+    for par in ['K_S', 'Ys']:
+        value = model.parameters[par]
+        model.parameters = {par: value*(1 + 1e-6)}
+        forward = model.steady_state().values
+        model.parameters = {par: value}
+        numerical = (forward - model.steady_state().values)/(value*1e-6)
+        assert_allclose(steady_sens[par].values, numerical, rtol=1e-4,
+                        atol=1e-6)
+
+    relative = sensitivity.get_steady_state_sensitivity(method='TRS')
+    assert_allclose(relative.loc['S', 'K_S'], 1.)